@@ -1,23 +1,134 @@
+import argparse
+import asyncio
+import sys
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import HTMLResponse, RedirectResponse
 from uvicorn import run as app_run
 
-from typing import Optional
+from typing import Optional, List
+
+from pandas import DataFrame
 
-from heart_disease.constants import APP_HOST, APP_PORT
+from heart_disease.constants import APP_HOST, APP_PORT, HEART_DISEASE_STATUS_MAP, PREFORK_WORKERS
+from heart_disease.configuration.client_manager import ClientManager
+from heart_disease.cloud_storage.async_azure_blob_storage import AsyncSimpleStorageService
+from heart_disease.entity.arrow_scoring import ArrowRequestDecoder, encode_prediction_batch
+from heart_disease.entity.config_entity import (ArrowScoringConfig, HeartDiseasePredictorConfig, PreforkServerConfig,
+                                                StorageConfig, UploadScoringConfig)
+from heart_disease.entity.prediction_schema import PredictionRequestDecoder, encode_json, format_prediction_record
+from heart_disease.entity.upload_scoring import (PredictionStreamEncoder, UploadScoringResponse, UploadStream,
+                                                 iter_scored_upload, open_upload_reader)
+from heart_disease.logger import logging
 from heart_disease.pipline.prediction_pipeline import HeartDieseaseData, HeartDiseaseClassifier
+from heart_disease.pipline.prefork_server import PreforkServer, get_server_memory
 from heart_disease.pipline.training_pipeline import TrainingPipeline
 
 
 
 
-app = FastAPI()
+async def refresh_model_periodically(storage: AsyncSimpleStorageService):
+    """
+    Keep the served model in sync with the registry through the async blob client, twice per
+    version check interval, so request handlers never wait on the blob store
+    """
+    model_predictor = await run_in_threadpool(HeartDiseaseClassifier)
+    interval = model_predictor.prediction_pipeline_config.model_version_check_interval / 2
+    while True:
+        try:
+            await model_predictor.refresh_model_async(storage)
+        except Exception as e:
+            logging.warning(f"Model refresh failed: {e}")
+        await asyncio.sleep(interval)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+async def prefetch_cohort_models():
+    """
+    Load the hottest cohort models in the background so startup does not wait on the registry
+    """
+    try:
+        model_predictor = await run_in_threadpool(HeartDiseaseClassifier)
+        if model_predictor.prediction_pipeline_config.cohort_models_enabled:
+            await run_in_threadpool(model_predictor.prefetch_cohort_models)
+    except Exception as e:
+        logging.warning(f"Cohort model prefetch failed: {e}")
+
+
+async def get_model_predictor() -> HeartDiseaseClassifier:
+    """
+    The classifier of a request handler. When the registry version check is due, it and the load of a new model
+    run in the thread pool, so the handler never waits on the blob store on the event loop
+    """
+    model_predictor = HeartDiseaseClassifier()
+    if model_predictor.is_model_version_check_due():
+        await run_in_threadpool(model_predictor.refresh_model)
+    return model_predictor
+
+
+async def run_scoring(model_predictor: HeartDiseaseClassifier, data, method, *args, **kwargs):
+    """
+    Runs a scoring method of the classifier on the rows of data (a DataFrame or a dict of columns) on the event
+    loop when their cohort models are resident, in the thread pool when routing them loads a cohort model or
+    re-reads the cohort manifest from the blob store
+    """
+    if model_predictor.is_cohort_model_load_due(data):
+        return await run_in_threadpool(method, *args, **kwargs)
+    return method(*args, **kwargs)
+
+
+async def warm_up_model():
+    """
+    Load the served model and run the warm-up rows through it in the background, /health/ready answers 503 until
+    it is done; a failed warm-up (e.g. the registry is not reachable yet) is retried while the worker stays live
+    """
+    while True:
+        try:
+            model_predictor = await run_in_threadpool(HeartDiseaseClassifier)
+            status = await run_in_threadpool(model_predictor.warm_up)
+            logging.info(f"Model warm-up done: {status}")
+            return
+        except Exception as e:
+            logging.warning(f"Model warm-up failed: {e}")
+            await asyncio.sleep(HeartDiseasePredictorConfig().warm_up_retry_interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open the pooled blob connections (and the Mongo ones when CLIENT_WARM_UP_MONGO) once, before the first request
+    client_manager = ClientManager.get_instance()
+    await run_in_threadpool(client_manager.warm_up)
+
+    async_storage = AsyncSimpleStorageService.get_instance()
+    model_refresher = None
+    # under the prefork server the model is preloaded by the master, which also reloads it
+    if StorageConfig().backend_type == "azure" and not HeartDiseaseClassifier._version_pinned:
+        model_refresher = asyncio.create_task(refresh_model_periodically(async_storage))
+    model_warmer = asyncio.create_task(warm_up_model())
+    cohort_prefetcher = asyncio.create_task(prefetch_cohort_models())
+    yield
+    model_warmer.cancel()
+    with suppress(asyncio.CancelledError):
+        await model_warmer
+    cohort_prefetcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await cohort_prefetcher
+    if model_refresher is not None:
+        model_refresher.cancel()
+        with suppress(asyncio.CancelledError):
+            await model_refresher
+    await async_storage.close()
+    client_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 
 templates = Jinja2Templates(directory='templates')
 
@@ -45,6 +156,7 @@ class DataForm:
         self.exang: Optional[str] = None
         self.oldpeak: Optional[float] = None
         self.slope: Optional[str] = None
+        self.dataset: Optional[str] = None
 
     async def get_heartdisease_data(self):
         form = await self.request.form()
@@ -61,6 +173,7 @@ class DataForm:
         self.restecg = form.get("restecg")
         self.exang = form.get("exang")      # Must be "TRUE" / "FALSE"
         self.slope = form.get("slope")
+        self.dataset = form.get("dataset") or None   # optional source site, routes to its cohort model
 
 
         
@@ -70,17 +183,20 @@ class DataForm:
 async def index(request: Request):
 
     return templates.TemplateResponse(
-            "heartdisease.html",{"request": request, "context": "Rendering"})
+            request, "heartdisease.html", {"context": "Rendering"})
 
 
 
 
 @app.get("/train")
-async def trainRouteClient():
+async def trainRouteClient(incremental: bool = False):
     try:
         train_pipeline = TrainingPipeline()
 
-        train_pipeline.run_pipeline()
+        if incremental:
+            train_pipeline.run_incremental_pipeline()
+        else:
+            train_pipeline.run_pipeline()
 
         return Response("Training successful !!")
 
@@ -106,7 +222,8 @@ async def predictRouteClient(request: Request):
             thalch=form.thalch,
             exang=form.exang,
             oldpeak=form.oldpeak,
-            slope=form.slope
+            slope=form.slope,
+            dataset=form.dataset
         )
         
         heartdisease_df = heartdisease_data.get_heartdisease_input_data_frame()
@@ -114,26 +231,20 @@ async def predictRouteClient(request: Request):
         print(heartdisease_df)
 
         # Predict
-        model_predictor = HeartDiseaseClassifier()
-        pred_array = model_predictor.predict(dataframe=heartdisease_df)
+        model_predictor = await get_model_predictor()
+        pred_array = await run_scoring(model_predictor, heartdisease_df, model_predictor.predict,
+                                       dataframe=heartdisease_df)
         value = int(pred_array[0])
         print("prectict value: ", value)           # Check if model is loaded
 
 
         # Map prediction to human readable
-        status_map = {
-            0: "No heart disease",
-            1: "Mild heart disease",
-            2: "Moderate heart disease",
-            3: "Severe heart disease",
-            4: "High-risk heart disease"
-        }
-
-        status = status_map.get(value, "Unknown")
+        status = HEART_DISEASE_STATUS_MAP.get(value, "Unknown")
 
         return templates.TemplateResponse(
+            request,
             "heartdisease.html",
-            {"request": request, "context": status},
+            {"context": status},
         )
         
     except Exception as e:
@@ -142,6 +253,217 @@ async def predictRouteClient(request: Request):
     
 
 
+def format_scored_records(scores_df: DataFrame, explanations: Optional[List[Optional[dict]]] = None) -> List[dict]:
+    """
+    Convert the output of predict_with_scores into JSON serializable records, with the explanation of
+    every row when explanations are given (None for the rows beyond the explanation latency budget)
+    """
+    probability_columns = [column for column in scores_df.columns if column.startswith("probability_")]
+    records = []
+    for position, row in enumerate(scores_df.itertuples(index=False)):
+        row = row._asdict()
+        value = int(row["prediction"])
+        record = {
+            "prediction": value,
+            "status": HEART_DISEASE_STATUS_MAP.get(value, "Unknown"),
+            "probabilities": {column.replace("probability_", ""): float(row[column])
+                              for column in probability_columns},
+            "risk_score": float(row["risk_score"]),
+        }
+        if explanations is not None:
+            record["explanation"] = explanations[position]
+        records.append(record)
+    return records
+
+
+@app.post("/predict")
+async def predictJsonRouteClient(request: Request, explain: bool = False):
+    try:
+        record = await request.json()
+        heartdisease_df = DataFrame([record])
+
+        model_predictor = await get_model_predictor()
+        scores_df = await run_scoring(model_predictor, heartdisease_df, model_predictor.predict_with_scores,
+                                      dataframe=heartdisease_df)
+        explanations = await run_scoring(model_predictor, heartdisease_df, model_predictor.explain,
+                                         dataframe=heartdisease_df, scores_df=scores_df) if explain else None
+
+        return {"status": True, "result": format_scored_records(scores_df, explanations)[0]}
+
+    except Exception as e:
+        return {"status": False, "error": f"{e}"}
+
+
+@app.post("/predict/batch")
+async def predictBatchRouteClient(request: Request, explain: bool = False):
+    try:
+        records = await request.json()
+        heartdisease_df = DataFrame.from_records(records)
+
+        model_predictor = await get_model_predictor()
+        scores_df = await run_scoring(model_predictor, heartdisease_df, model_predictor.predict_with_scores,
+                                      dataframe=heartdisease_df)
+        explanations = await run_scoring(model_predictor, heartdisease_df, model_predictor.explain,
+                                         dataframe=heartdisease_df, scores_df=scores_df) if explain else None
+
+        return {"status": True, "result": format_scored_records(scores_df, explanations)}
+
+    except Exception as e:
+        return {"status": False, "error": f"{e}"}
+
+
+prediction_request_decoder = PredictionRequestDecoder()
+
+
+@app.post("/api/v1/predict")
+async def predictApiV1RouteClient(request: Request):
+    """
+    Typed JSON prediction API: one record or a list of records with the fields of config/schema.yaml,
+    validated while decoding and scored without building a DataFrame
+    """
+    try:
+        records, is_single_record = prediction_request_decoder.decode(await request.body())
+    except ValueError as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=422,
+                        media_type="application/json")
+    try:
+        if not records:
+            return Response(encode_json({"status": True, "result": []}), media_type="application/json")
+        model_predictor = await get_model_predictor()
+        columns = prediction_request_decoder.to_columns(records)
+        results = [format_prediction_record(record) for record in
+                   await run_scoring(model_predictor, columns, model_predictor.predict_columns, columns)]
+        return Response(encode_json({"status": True, "result": results[0] if is_single_record else results}),
+                        media_type="application/json")
+
+    except Exception as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=500,
+                        media_type="application/json")
+
+
+@app.post("/api/v1/predict/upload")
+async def predictUploadRouteClient(request: Request, output_format: Optional[str] = None, gzip: bool = False,
+                                   input_format: Optional[str] = None):
+    """
+    Bulk scoring of a CSV or Parquet file, sent as the raw (optionally gzip compressed) request body or as the
+    file part of a multipart form. CSV uploads are parsed and scored in fixed-size chunks while they arrive and
+    the predictions are streamed back as NDJSON or CSV (gzip compressed with gzip=true), so memory does not grow
+    with the size of the file
+    """
+    upload_scoring_config = UploadScoringConfig()
+    try:
+        upload = UploadStream(request.stream(), content_type=request.headers.get("content-type"),
+                              content_encoding=request.headers.get("content-encoding"),
+                              upload_scoring_config=upload_scoring_config)
+        reader = await open_upload_reader(upload, prediction_request_decoder.field_types, upload_format=input_format,
+                                          upload_scoring_config=upload_scoring_config)
+        encoder = PredictionStreamEncoder(output_format or upload_scoring_config.output_format, gzip=gzip,
+                                          has_id=reader.has_id, upload_scoring_config=upload_scoring_config)
+    except ValueError as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=422,
+                        media_type="application/json")
+    try:
+        model_predictor = HeartDiseaseClassifier()
+        return UploadScoringResponse(iter_scored_upload(reader, encoder, model_predictor),
+                                     media_type=encoder.media_type, headers=encoder.headers)
+
+    except Exception as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=500,
+                        media_type="application/json")
+
+
+arrow_scoring_config = ArrowScoringConfig()
+arrow_request_decoder = ArrowRequestDecoder(prediction_request_decoder.field_types, arrow_scoring_config)
+
+
+@app.post("/api/v1/predict/arrow")
+async def predictArrowRouteClient(request: Request):
+    """
+    Binary prediction API for service-to-service traffic: an Arrow IPC stream with a column per input field
+    (plus the optional id and cohort columns), mapped onto the model inputs without copies, answered with the
+    predictions and probabilities as an Arrow record batch
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and int(content_length) > arrow_scoring_config.max_body_bytes:
+        return Response(encode_json({"status": False, "error": "Request body too large"}), status_code=413,
+                        media_type="application/json")
+    try:
+        columns, ids, n_rows = arrow_request_decoder.decode(await request.body())
+        if not n_rows:
+            raise ValueError("The Arrow stream has no rows")
+    except ValueError as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=422,
+                        media_type="application/json")
+    try:
+        model_predictor = await get_model_predictor()
+        predictions, probabilities, classes, risk_scores = await run_scoring(model_predictor, columns,
+                                                                             model_predictor.score_columns, columns)
+        body = encode_prediction_batch(predictions, probabilities, classes, risk_scores, ids=ids,
+                                       arrow_scoring_config=arrow_scoring_config)
+        return Response(memoryview(body), media_type=arrow_scoring_config.media_type)
+
+    except Exception as e:
+        return Response(encode_json({"status": False, "error": f"{e}"}), status_code=500,
+                        media_type="application/json")
+
+
+def get_health_response(require_warm_up: bool) -> Response:
+    status = HeartDiseaseClassifier.get_warm_up_status()
+    status_code = 503 if require_warm_up and not status["ready"] else 200
+    return Response(encode_json(status), status_code=status_code, media_type="application/json")
+
+
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness probe: 200 as long as the worker answers, with the warm-up status. It is not gated on the warm-up,
+    which retries until the registry is reachable, so a slow registry does not get a starting worker restarted
+    """
+    return get_health_response(require_warm_up=False)
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness probe: 503 until the served model is loaded and warmed up, so load balancers do not send traffic
+    to a cold worker. A refreshed model is warmed up before it is swapped in and keeps the worker ready
+    """
+    return get_health_response(require_warm_up=True)
+
+
+@app.get("/health/clients")
+async def clientsHealth():
+    return await run_in_threadpool(ClientManager.get_instance().health)
+
+
+@app.get("/metrics/prediction-cache")
+async def predictionCacheMetrics():
+    return HeartDiseaseClassifier.get_cache_stats()
+
+
+@app.get("/metrics/cohort-models")
+async def cohortModelsMetrics():
+    return HeartDiseaseClassifier.get_cohort_pool_stats()
+
+
+@app.get("/metrics/memory")
+async def memoryMetrics():
+    """
+    Unique (uss), proportional (pss) and resident (rss) memory in MB of the prefork master and of every worker
+    """
+    return await run_in_threadpool(get_server_memory)
+
+
+
 
 if __name__ == "__main__":
-    app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Serve the heart disease prediction app")
+    parser.add_argument("--host", default=APP_HOST)
+    parser.add_argument("--port", type=int, default=APP_PORT)
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS,
+                        help="worker processes forked from a master holding the model, a single process when 1")
+    args = parser.parse_args()
+    if args.workers > 1:
+        sys.exit(PreforkServer(app, PreforkServerConfig(host=args.host, port=args.port,
+                                                        n_workers=args.workers)).run())
+    app_run(app, host=args.host, port=args.port)
\ No newline at end of file
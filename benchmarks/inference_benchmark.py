@@ -0,0 +1,361 @@
+"""
+Single-row and batch inference latency / throughput through HeartDiseaseModel
+and through the FastAPI app with an in-process ASGI client
+"""
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+from pandas import DataFrame
+
+from benchmarks.utils import latency_summary, time_calls
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.cloud_storage.storage_backend import InMemoryBackend
+from heart_disease.components.data_transformation import DataTransformation
+from heart_disease.constants import (MODEL_BLOB_NAME, MODEL_TRAINER_MODEL_CONFIG_FILE_PATH, TARGET_COLUMN,
+                                     SCHEMA_FILE_PATH)
+from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.utils.main_utils import load_object, read_yaml_file, prepare_features_and_target
+from heart_disease.utils.synthetic_data import generate_synthetic_data, generate_prediction_input
+
+
+class LocalModelEstimator:
+    """
+    Stand-in for HeartDieseaseEstimator that serves an in-memory model, so the app is benchmarked
+    without a blob round trip
+    """
+
+    def __init__(self, model: HeartDiseaseModel, model_version: str = "benchmark"):
+        self.loaded_model = model
+        self.model_version = model_version
+        # empty registry, every row is served by the benchmarked model
+        self.blobS = SimpleStorageService(backend=InMemoryBackend(container_name=MODEL_BLOB_NAME))
+
+    def get_model_version(self) -> str:
+        return self.model_version
+
+    def predict(self, dataframe: DataFrame):
+        return self.loaded_model.predict(dataframe)
+
+    def predict_with_scores(self, dataframe: DataFrame) -> DataFrame:
+        return self.loaded_model.predict_with_scores(dataframe)
+
+    def predict_columns_with_scores(self, columns: dict) -> tuple:
+        return self.loaded_model.predict_columns_with_scores(columns)
+
+    def explain(self, dataframe: DataFrame, classes=None) -> DataFrame:
+        return self.loaded_model.explain(dataframe, classes=classes)
+
+
+def build_benchmark_model(n_rows: int = 5000, random_state: int = 42) -> HeartDiseaseModel:
+    """
+    fit the training preprocessor and a CatBoostClassifier with the default parameters of config/model.yaml
+    on synthetic data
+    """
+    from catboost import CatBoostClassifier
+
+    schema_config = read_yaml_file(SCHEMA_FILE_PATH)
+    dataframe = generate_synthetic_data(n_rows, schema_config=schema_config, random_state=random_state)
+    x, y = prepare_features_and_target(df=dataframe, target_column=TARGET_COLUMN, cols=schema_config["drop_columns"])
+
+    preprocessor = DataTransformation(data_ingestion_artifact=None, data_transformation_config=None,
+                                      data_validation_artifact=None).get_data_transformer_object()
+    params = dict(read_yaml_file(MODEL_TRAINER_MODEL_CONFIG_FILE_PATH)["model_selection"]["module_0"]["params"])
+    model = CatBoostClassifier(random_seed=random_state, thread_count=-1, **params)
+    model.fit(preprocessor.fit_transform(x), y)
+    return HeartDiseaseModel(preprocessing_object=preprocessor, trained_model_object=model)
+
+
+def get_benchmark_model(model_path: Optional[str] = None) -> HeartDiseaseModel:
+    if model_path:
+        return load_object(model_path)
+    return build_benchmark_model()
+
+
+def run_model_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    results = []
+    rows = generate_prediction_input(n_calls + 10, random_state=7)
+
+    latencies = time_calls(lambda i: model.predict(rows.iloc[[i]]), n_calls)
+    results.append({"name": "model.predict.single_row", **latency_summary(latencies)})
+
+    latencies = time_calls(lambda i: model.predict_with_scores(rows.iloc[[i]]), n_calls)
+    results.append({"name": "model.predict_with_scores.single_row", **latency_summary(latencies)})
+
+    latencies = time_calls(lambda i: model.explain(rows.iloc[[i]]), n_calls)
+    results.append({"name": "model.explain.single_row", **latency_summary(latencies)})
+
+    for batch_size in batch_sizes:
+        batch = generate_prediction_input(batch_size, random_state=batch_size)
+        calls = max(3, min(n_calls, 100_000 // batch_size))
+        latencies = time_calls(lambda i: model.predict(batch), calls, warmup_calls=1)
+        results.append({"name": f"model.predict.batch_{batch_size}", **latency_summary(latencies, batch_size)})
+        latencies = time_calls(lambda i: model.explain(batch), calls, warmup_calls=1)
+        results.append({"name": f"model.explain.batch_{batch_size}", **latency_summary(latencies, batch_size)})
+
+    return results
+
+
+async def _run_api_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    import httpx
+
+    from app import app
+    from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+
+    HeartDiseaseClassifier._estimator = LocalModelEstimator(model)
+    HeartDiseaseClassifier._model_version = None
+    HeartDiseaseClassifier()
+
+    rows = generate_prediction_input(n_calls + 10, random_state=11)
+    records = json.loads(rows.to_json(orient="records"))
+    forms = [{key: str(int(value)) if isinstance(value, bool) else str(value) for key, value in record.items()}
+             for record in records]
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+
+        async def measure(name: str, send, calls: int, rows_per_call: int = 1, warmup_calls: int = 5):
+            for i in range(warmup_calls):
+                await send(i)
+            latencies = []
+            for i in range(calls):
+                start = time.perf_counter()
+                response = await send(i)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+                if response.headers.get("content-type", "").startswith("application/json") \
+                        and response.json().get("status") is False:
+                    raise RuntimeError(f"{name} failed: {response.json().get('error')}")
+            results.append({"name": name, **latency_summary(latencies, rows_per_call)})
+
+        await measure("api.form.single_row", lambda i: client.post("/", data=forms[i]), n_calls)
+
+        HeartDiseaseClassifier._prediction_cache.clear()
+        await measure("api.json.single_row.uncached", lambda i: client.post("/predict", json=records[i]),
+                      n_calls, warmup_calls=0)
+        await measure("api.json.single_row.cached", lambda i: client.post("/predict", json=records[0]), n_calls)
+        HeartDiseaseClassifier._prediction_cache.clear()
+        await measure("api.v1.single_row.uncached", lambda i: client.post("/api/v1/predict", json=records[i]),
+                      n_calls, warmup_calls=0)
+        await measure("api.v1.single_row.cached", lambda i: client.post("/api/v1/predict", json=records[0]), n_calls)
+        await measure("api.json.single_row.explain",
+                      lambda i: client.post("/predict", json=records[0], params={"explain": "true"}), n_calls)
+
+        for batch_size in batch_sizes:
+            batch = json.loads(generate_prediction_input(batch_size, random_state=batch_size).to_json(orient="records"))
+            calls = max(3, min(n_calls, 100_000 // batch_size))
+            HeartDiseaseClassifier._prediction_cache.clear()
+            await measure(f"api.json.batch_{batch_size}.uncached",
+                          lambda i: client.post("/predict/batch", json=batch), 1, batch_size, warmup_calls=0)
+            await measure(f"api.json.batch_{batch_size}.cached",
+                          lambda i: client.post("/predict/batch", json=batch), calls, batch_size, warmup_calls=1)
+            HeartDiseaseClassifier._prediction_cache.clear()
+            await measure(f"api.v1.batch_{batch_size}.uncached",
+                          lambda i: client.post("/api/v1/predict", json=batch), 1, batch_size, warmup_calls=0)
+            await measure(f"api.v1.batch_{batch_size}.cached",
+                          lambda i: client.post("/api/v1/predict", json=batch), calls, batch_size, warmup_calls=1)
+
+    return results
+
+
+def run_api_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    return asyncio.run(_run_api_benchmarks(model, batch_sizes, n_calls))
+
+
+def run_evaluator_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    """
+    predict_proba latency of the CatBoost model against the NumPy oblivious tree evaluator of its JSON export,
+    on preprocessed rows, with the largest raw and probability differences between the two
+    """
+    import numpy as np
+
+    from heart_disease.entity.oblivious_tree_evaluator import ObliviousTreeEvaluator
+
+    model_obj = model.trained_model_object
+    evaluator = ObliviousTreeEvaluator.from_catboost_model(model_obj)
+    rows = np.asarray(model.preprocessing_object.transform(generate_prediction_input(n_calls + 10, random_state=13)))
+
+    results = []
+    for name, predictor in (("catboost", model_obj), ("numpy", evaluator)):
+        latencies = time_calls(lambda i: predictor.predict_proba(rows[i:i + 1]), n_calls)
+        results.append({"name": f"evaluator.{name}.single_row", **latency_summary(latencies)})
+
+    for batch_size in batch_sizes:
+        batch = np.asarray(model.preprocessing_object.transform(
+            generate_prediction_input(batch_size, random_state=batch_size)))
+        calls = max(3, min(n_calls, 100_000 // batch_size))
+        expected_raw = np.asarray(model_obj.predict(batch, prediction_type="RawFormulaVal"), dtype=np.float64)
+        raw = evaluator.predict_raw(batch)
+        max_raw_diff = float(np.abs(expected_raw.reshape(raw.shape) - raw).max())
+        max_proba_diff = float(np.abs(model_obj.predict_proba(batch) - evaluator.predict_proba(batch)).max())
+        for name, predictor in (("catboost", model_obj), ("numpy", evaluator)):
+            latencies = time_calls(lambda i: predictor.predict_proba(batch), calls, warmup_calls=1)
+            results.append({"name": f"evaluator.{name}.batch_{batch_size}", **latency_summary(latencies, batch_size),
+                            "max_raw_diff": max_raw_diff, "max_proba_diff": max_proba_diff})
+
+    return results
+
+
+async def _run_wire_format_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    import io
+
+    import httpx
+    import pandas as pd
+    import pyarrow as pa
+
+    from app import app
+    from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+
+    HeartDiseaseClassifier._estimator = LocalModelEstimator(model)
+    HeartDiseaseClassifier._model_version = None
+    HeartDiseaseClassifier()
+
+    def to_arrow(batch: DataFrame) -> bytes:
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    # the request body of every format is encoded once, the response is decoded by the measured call
+    formats = {
+        "json": ("/api/v1/predict", "application/json", lambda batch: batch.to_json(orient="records").encode(),
+                 lambda content: len(json.loads(content)["result"])),
+        "csv": ("/api/v1/predict/upload?output_format=csv", "text/csv",
+                lambda batch: batch.to_csv(index=False).encode(),
+                lambda content: len(pd.read_csv(io.BytesIO(content)))),
+        "arrow": ("/api/v1/predict/arrow", "application/vnd.apache.arrow.stream", to_arrow,
+                  lambda content: pa.ipc.open_stream(content).read_all().num_rows),
+    }
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for batch_size in batch_sizes:
+            batch = generate_prediction_input(batch_size, random_state=batch_size)
+            calls = max(3, min(n_calls, 100_000 // batch_size))
+            for name, (path, content_type, encode, decode) in formats.items():
+                body = encode(batch)
+                headers = {"content-type": content_type}
+                response = await client.post(path, content=body, headers=headers)
+                response.raise_for_status()
+                latencies = []
+                for _ in range(calls):
+                    # JSON requests go through the prediction cache, the other formats do not
+                    HeartDiseaseClassifier._prediction_cache.clear()
+                    start = time.perf_counter()
+                    response = await client.post(path, content=body, headers=headers)
+                    n_rows = decode(response.content)
+                    latencies.append(time.perf_counter() - start)
+                    if n_rows != batch_size:
+                        raise RuntimeError(f"{name} returned {n_rows} predictions for {batch_size} rows")
+                results.append({"name": f"api.wire.{name}.batch_{batch_size}",
+                                **latency_summary(latencies, batch_size),
+                                "request_bytes": len(body), "response_bytes": len(response.content)})
+
+    return results
+
+
+def run_wire_format_benchmarks(model: HeartDiseaseModel, batch_sizes: List[int], n_calls: int) -> List[dict]:
+    """
+    the same batches scored through /api/v1/predict (JSON), /api/v1/predict/upload (CSV) and
+    /api/v1/predict/arrow (Arrow IPC), decoding of the response included, with the payload sizes
+    """
+    return asyncio.run(_run_wire_format_benchmarks(model, batch_sizes, n_calls))
+
+
+def _post_streaming_upload(port: int, path: str, chunks) -> int:
+    """
+    POST chunks with chunked transfer encoding from a sending thread while the chunked response is read, as
+    curl does; a client sending the whole body before reading would block once both socket buffers are full.
+    Returns the number of lines of the response
+    """
+    import socket
+    import threading
+
+    sock = socket.create_connection(("127.0.0.1", port))
+
+    def send():
+        sock.sendall(f"POST {path} HTTP/1.1\r\nHost: benchmark\r\nContent-Type: text/csv\r\n"
+                     f"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n".encode())
+        for chunk in chunks:
+            sock.sendall(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        sock.sendall(b"0\r\n\r\n")
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    n_lines = 0
+    with sock, sock.makefile("rb") as response:
+        status = response.readline().split()
+        if status[1] != b"200":
+            raise RuntimeError(f"upload failed with status {status[1].decode()}")
+        while response.readline() not in (b"\r\n", b""):
+            pass
+        while True:
+            size = int(response.readline().split(b";")[0], 16)
+            if size == 0:
+                break
+            n_lines += response.read(size).count(b"\n")
+            response.readline()
+    sender.join()
+    return n_lines
+
+
+def run_upload_benchmarks(model: HeartDiseaseModel, upload_rows: List[int], output_formats: List[str] = None,
+                          block_rows: int = 10_000) -> List[dict]:
+    """
+    throughput and peak resident memory of /api/v1/predict/upload through a uvicorn server on a local port:
+    the CSV upload is generated while it is sent and the predictions are counted while they arrive, so the
+    memory increase is the one of the server and should not grow with the number of rows
+    """
+    import socket
+    import threading
+
+    import uvicorn
+
+    from app import app
+    from benchmarks.utils import MemoryMonitor
+    from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+
+    HeartDiseaseClassifier._estimator = LocalModelEstimator(model)
+    HeartDiseaseClassifier._model_version = None
+    HeartDiseaseClassifier()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    block = generate_prediction_input(block_rows, random_state=17).to_csv(index=False).encode()
+    header, _, block = block.partition(b"\n")
+
+    def generate_upload(n_rows: int):
+        yield header + b"\n"
+        for start in range(0, n_rows, block_rows):
+            rows = min(block_rows, n_rows - start)
+            yield block if rows == block_rows else b"".join(block.splitlines(keepends=True)[:rows])
+
+    results = []
+    try:
+        for output_format in output_formats or ["ndjson", "csv"]:
+            for n_rows in upload_rows:
+                with MemoryMonitor() as monitor:
+                    start = time.perf_counter()
+                    n_lines = _post_streaming_upload(port, f"/api/v1/predict/upload?output_format={output_format}",
+                                                     generate_upload(n_rows))
+                    seconds = time.perf_counter() - start
+                n_predictions = n_lines - (output_format == "csv")
+                if n_predictions != n_rows:
+                    raise RuntimeError(f"upload of {n_rows} rows returned {n_predictions} predictions")
+                results.append({"name": f"api.upload.{output_format}.rows_{n_rows}",
+                                **latency_summary([seconds], n_rows), **monitor.summary()})
+    finally:
+        server.should_exit = True
+        thread.join()
+    return results
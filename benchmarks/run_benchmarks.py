@@ -0,0 +1,115 @@
+"""
+Benchmark harness for the serving and training hot paths.
+
+    python -m benchmarks.run_benchmarks --suite model api
+    python -m benchmarks.run_benchmarks --suite evaluator --batch-sizes 1 100 1000 10000
+    python -m benchmarks.run_benchmarks --suite wire --batch-sizes 1000 10000 50000
+    python -m benchmarks.run_benchmarks --suite upload --upload-rows 10000 100000 1000000
+    python -m benchmarks.run_benchmarks --suite training --sizes 10000 1000000 10000000
+    python -m benchmarks.run_benchmarks --suite tuning --sizes 10000 100000
+    python -m benchmarks.run_benchmarks --suite rebalancing --sizes 10000 1000000 --strategies smoteenn class_weight
+    python -m benchmarks.run_benchmarks --suite storage --latencies 0 0.005 0.05
+    python -m benchmarks.run_benchmarks --suite model --baseline benchmarks/results/previous.json
+
+Results are written as JSON to --output (default benchmarks/results/<timestamp>.json) and, when
+--baseline is given, compared against a previous run to flag regressions.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from benchmarks.utils import compare_results, write_results
+from heart_disease.components.data_rebalancing import REBALANCING_STRATEGIES
+from heart_disease.constants import MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+
+SUITES = ["model", "api", "evaluator", "wire", "upload", "training", "tuning", "rebalancing", "storage"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the heart disease serving and training hot paths")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=["model", "api"])
+    parser.add_argument("--model-path", default=None,
+                        help="pickled HeartDiseaseModel to benchmark, a model is trained on synthetic data if omitted")
+    parser.add_argument("--calls", type=int, default=200, help="measured calls per single-row benchmark")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--upload-rows", type=int, nargs="+", default=[10_000, 100_000, 500_000],
+                        help="row counts of the CSV files streamed by the upload benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000],
+                        help="row counts of the training benchmark")
+    parser.add_argument("--stages", nargs="+", default=None,
+                        help="training stages to run (default: every stage up to model_trainer)")
+    parser.add_argument("--model-config", default=MODEL_TRAINER_MODEL_CONFIG_FILE_PATH,
+                        help="model.yaml searched by the tuning benchmark")
+    parser.add_argument("--strategies", nargs="+", default=list(REBALANCING_STRATEGIES),
+                        help="rebalancing strategies of the rebalancing benchmark")
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0.0, 0.005, 0.05],
+                        help="blob latencies (seconds) injected by the storage benchmark")
+    parser.add_argument("--artifact-dir", default=os.path.join("artifact", "benchmark"))
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = []
+
+    if any(suite in args.suite for suite in ("model", "api", "evaluator", "wire", "upload", "storage")):
+        from benchmarks.inference_benchmark import (get_benchmark_model, run_model_benchmarks, run_api_benchmarks,
+                                                    run_evaluator_benchmarks, run_upload_benchmarks,
+                                                    run_wire_format_benchmarks)
+
+        model = get_benchmark_model(args.model_path)
+        if "model" in args.suite:
+            results += run_model_benchmarks(model, args.batch_sizes, args.calls)
+        if "api" in args.suite:
+            results += run_api_benchmarks(model, args.batch_sizes, args.calls)
+        if "evaluator" in args.suite:
+            results += run_evaluator_benchmarks(model, args.batch_sizes, args.calls)
+        if "wire" in args.suite:
+            results += run_wire_format_benchmarks(model, args.batch_sizes, args.calls)
+        if "upload" in args.suite:
+            results += run_upload_benchmarks(model, args.upload_rows)
+        if "storage" in args.suite:
+            from benchmarks.storage_benchmark import run_storage_benchmarks
+
+            results += run_storage_benchmarks(model, args.latencies, args.calls)
+
+    if "training" in args.suite:
+        from benchmarks.training_benchmark import DEFAULT_TRAINING_STAGES, run_training_benchmarks
+
+        results += run_training_benchmarks(args.sizes, args.stages or DEFAULT_TRAINING_STAGES, args.artifact_dir)
+
+    if "tuning" in args.suite:
+        from benchmarks.training_benchmark import run_tuning_benchmarks
+
+        results += run_tuning_benchmarks(args.sizes, args.model_config)
+
+    if "rebalancing" in args.suite:
+        from benchmarks.training_benchmark import run_rebalancing_benchmarks
+
+        results += run_rebalancing_benchmarks(args.sizes, args.strategies)
+
+    output = args.output or os.path.join("benchmarks", "results",
+                                         f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.json")
+    write_results(output, results, parameters=vars(args))
+
+    for result in results:
+        print(result)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        comparisons = compare_results(args.baseline, results, threshold=args.threshold)
+        for comparison in comparisons:
+            flag = "REGRESSION" if comparison["regression"] else "ok"
+            print(f"{flag:>10}  {comparison['name']} {comparison['metric']}: "
+                  f"{comparison['baseline']:.4g} -> {comparison['current']:.4g} ({comparison['change']:+.1%})")
+        if any(comparison["regression"] for comparison in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
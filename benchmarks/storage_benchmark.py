@@ -0,0 +1,62 @@
+"""
+Effect of blob latency on model loads and on served prediction latency, with the registry model kept
+in an in-memory backend behind a LatencyInjectingBackend
+"""
+import time
+from dataclasses import replace
+from typing import List
+
+import dill
+
+from benchmarks.utils import latency_summary, time_calls
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.cloud_storage.storage_backend import InMemoryBackend, LatencyInjectingBackend
+from heart_disease.constants import MODEL_BLOB_NAME, MODEL_FILE_NAME
+from heart_disease.entity.blob_estimator import HeartDieseaseEstimator
+from heart_disease.entity.config_entity import HeartDiseasePredictorConfig
+from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.utils.synthetic_data import generate_prediction_input
+
+
+def run_storage_benchmarks(model: HeartDiseaseModel, latencies: List[float], n_calls: int,
+                           random_state: int = 42) -> List[dict]:
+    from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+
+    model_bytes = dill.dumps(model)
+    rows = generate_prediction_input(n_calls + 10, random_state=13)
+    results = []
+    for latency in latencies:
+        memory_backend = InMemoryBackend(container_name=MODEL_BLOB_NAME)
+        memory_backend.write_bytes(MODEL_FILE_NAME, model_bytes)
+        backend = LatencyInjectingBackend(memory_backend, latency_seconds=latency, jitter_seconds=latency / 2,
+                                          tail_probability=0.01, tail_latency_seconds=latency * 10,
+                                          random_state=random_state)
+        storage = SimpleStorageService(backend=backend)
+
+        latencies_seconds = time_calls(lambda i: storage.load_model(MODEL_FILE_NAME), min(n_calls, 20),
+                                       warmup_calls=1)
+        results.append({"name": f"storage.latency_{latency}.load_model", "injected_latency_seconds": latency,
+                        "model_bytes": len(model_bytes), **latency_summary(latencies_seconds)})
+
+        # served predictions, the version check hits the store once per interval (0 = on every request)
+        for interval in (0.0, HeartDiseasePredictorConfig().model_version_check_interval):
+            HeartDiseaseClassifier._estimator = HeartDieseaseEstimator(blob_name=MODEL_BLOB_NAME,
+                                                                       model_path=MODEL_FILE_NAME,
+                                                                       blob_storage=storage)
+            HeartDiseaseClassifier._model_version = None
+            classifier = HeartDiseaseClassifier(replace(HeartDiseasePredictorConfig(),
+                                                        model_version_check_interval=interval))
+            HeartDiseaseClassifier._prediction_cache.clear()
+
+            start = time.perf_counter()
+            classifier.predict_with_scores(rows.iloc[[0]])
+            cold_seconds = time.perf_counter() - start
+
+            latencies_seconds = time_calls(lambda i: classifier.predict_with_scores(rows.iloc[[i + 1]]), n_calls)
+            results.append({"name": f"storage.latency_{latency}.predict.version_check_{interval}s",
+                            "injected_latency_seconds": latency, "cold_request_seconds": cold_seconds,
+                            **latency_summary(latencies_seconds)})
+
+    HeartDiseaseClassifier._estimator = None
+    HeartDiseaseClassifier._model_version = None
+    return results
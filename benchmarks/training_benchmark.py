@@ -0,0 +1,171 @@
+"""
+Per-stage wall time and peak memory of the TrainingPipeline on synthetic data
+"""
+import os
+import time
+from dataclasses import fields, replace
+from typing import List
+
+from benchmarks.utils import MemoryMonitor
+from heart_disease.entity.config_entity import training_pipeline_config
+from heart_disease.pipline.training_pipeline import TrainingPipeline
+from heart_disease.utils.synthetic_data import generate_synthetic_data
+
+# model_pusher is never benchmarked, it would publish the benchmark model to the registry
+TRAINING_STAGES = ["data_ingestion", "data_validation", "data_transformation", "model_trainer", "model_evaluation"]
+DEFAULT_TRAINING_STAGES = ["data_ingestion", "data_validation", "data_transformation", "model_trainer"]
+
+
+def rebase_config(config, old_root: str, new_root: str):
+    """
+    return a copy of a config dataclass with every path under old_root moved under new_root
+    """
+    changes = {}
+    for field in fields(config):
+        value = getattr(config, field.name)
+        if isinstance(value, str) and value.startswith(old_root):
+            changes[field.name] = new_root + value[len(old_root):]
+    return replace(config, **changes)
+
+
+def get_benchmark_pipeline(artifact_dir: str) -> TrainingPipeline:
+    pipeline = TrainingPipeline()
+    old_root = training_pipeline_config.artifact_dir
+    for name in ("data_ingestion_config", "data_validation_config", "data_transformation_config",
+                 "model_trainer_config", "model_compaction_config", "model_evaluation_config", "model_pusher_config"):
+        setattr(pipeline, name, rebase_config(getattr(pipeline, name), old_root, artifact_dir))
+    return pipeline
+
+
+def run_training_benchmarks(sizes: List[int], stages: List[str], artifact_root: str,
+                            random_state: int = 42) -> List[dict]:
+    results = []
+    for n_rows in sizes:
+        pipeline = get_benchmark_pipeline(os.path.join(artifact_root, str(n_rows)))
+        artifacts = {}
+
+        # the synthetic rows are written to a local Parquet source, ingestion reads them through FileDataSource
+        source_path = os.path.join(artifact_root, str(n_rows), "source", "cvd_data.parquet")
+        start = time.perf_counter()
+        with MemoryMonitor() as monitor:
+            dataframe = generate_synthetic_data(n_rows, random_state=random_state)
+            os.makedirs(os.path.dirname(source_path), exist_ok=True)
+            dataframe.to_parquet(source_path, index=False)
+            del dataframe
+        results.append({"name": f"training.{n_rows}.synthetic_data_generation", "rows": n_rows,
+                        "seconds": time.perf_counter() - start, **monitor.summary()})
+        pipeline.data_ingestion_config = replace(pipeline.data_ingestion_config, data_source_type="file",
+                                                 data_source_path=source_path)
+
+        stage_functions = {
+            "data_ingestion": pipeline.start_data_ingestion,
+            "data_validation": lambda: pipeline.start_data_validation(
+                data_ingestion_artifact=artifacts["data_ingestion"]),
+            "data_transformation": lambda: pipeline.start_data_transformation(
+                data_ingestion_artifact=artifacts["data_ingestion"],
+                data_validation_artifact=artifacts["data_validation"]),
+            "model_trainer": lambda: pipeline.start_model_trainer(
+                data_transformation_artifact=artifacts["data_transformation"]),
+            "model_evaluation": lambda: pipeline.start_model_evaluation(
+                data_ingestion_artifact=artifacts["data_ingestion"],
+                model_trainer_artifact=artifacts["model_trainer"]),
+        }
+
+        for stage in TRAINING_STAGES:
+            if stage not in stages:
+                continue
+            result = {"name": f"training.{n_rows}.{stage}", "rows": n_rows}
+            start = time.perf_counter()
+            try:
+                with MemoryMonitor() as monitor:
+                    artifacts[stage] = stage_functions[stage]()
+                result.update({"seconds": time.perf_counter() - start, **monitor.summary()})
+            except Exception as e:
+                result.update({"seconds": None, "error": str(e)})
+            results.append(result)
+            if "error" in result:
+                break
+    return results
+
+
+def run_rebalancing_benchmarks(sizes: List[int], strategies: List[str], random_state: int = 42) -> List[dict]:
+    """
+    wall time, peak memory and output rows of every rebalancing strategy on the transformed synthetic train set
+    """
+    from heart_disease.components.data_rebalancing import DataRebalancing
+    from heart_disease.components.data_transformation import DataTransformation
+    from heart_disease.constants import TARGET_COLUMN
+    from heart_disease.entity.config_entity import DataTransformationConfig
+    from heart_disease.utils.main_utils import prepare_features_and_target
+
+    config = DataTransformationConfig()
+    results = []
+    for n_rows in sizes:
+        transformation = DataTransformation(data_ingestion_artifact=None, data_transformation_config=config,
+                                            data_validation_artifact=None)
+        dataframe = generate_synthetic_data(n_rows, random_state=random_state)
+        x, y = prepare_features_and_target(df=dataframe, target_column=TARGET_COLUMN,
+                                           cols=transformation._schema_config["drop_columns"])
+        x = transformation.get_data_transformer_object().fit_transform(x)
+        del dataframe
+
+        for strategy in strategies:
+            result = {"name": f"rebalancing.{n_rows}.{strategy}", "rows": n_rows}
+            try:
+                rebalancing = DataRebalancing(strategy=strategy, k_neighbors=config.smote_k_neighbors,
+                                              neighbors_algorithm=config.neighbors_algorithm,
+                                              n_jobs=config.rebalancing_n_jobs, random_state=random_state)
+                start = time.perf_counter()
+                with MemoryMonitor() as monitor:
+                    _, _, _, report = rebalancing.rebalance(x, y)
+                result.update({"seconds": time.perf_counter() - start, "rows_after": report["rows_after"],
+                               **monitor.summary()})
+            except Exception as e:
+                result.update({"seconds": None, "error": str(e)})
+            results.append(result)
+    return results
+
+
+def run_tuning_benchmarks(sizes: List[int], model_config_file_path: str, random_state: int = 42) -> List[dict]:
+    """
+    hyperparameter search time of neuro_mf GridSearchCV (before) and of the fold cached search (after) on the
+    transformed synthetic train set, with the best score of both
+    """
+    from neuro_mf import ModelFactory
+
+    from heart_disease.components.data_transformation import DataTransformation
+    from heart_disease.components.model_tuning import FoldCachedModelSearch
+    from heart_disease.constants import TARGET_COLUMN
+    from heart_disease.entity.config_entity import DataTransformationConfig
+    from heart_disease.utils.main_utils import prepare_features_and_target
+
+    results = []
+    for n_rows in sizes:
+        transformation = DataTransformation(data_ingestion_artifact=None,
+                                            data_transformation_config=DataTransformationConfig(),
+                                            data_validation_artifact=None)
+        dataframe = generate_synthetic_data(n_rows, random_state=random_state)
+        x, y = prepare_features_and_target(df=dataframe, target_column=TARGET_COLUMN,
+                                           cols=transformation._schema_config["drop_columns"])
+        x = transformation.get_data_transformer_object().fit_transform(x)
+        y = y.to_numpy().astype(float)
+        del dataframe
+
+        searches = {
+            "grid_search_cv": lambda: ModelFactory(model_config_path=model_config_file_path).get_best_model(
+                X=x, y=y, base_accuracy=0.0),
+            "fold_cached": lambda: FoldCachedModelSearch(model_config_file_path=model_config_file_path)
+            .get_best_model(x, y, base_accuracy=0.0),
+        }
+        for method, search in searches.items():
+            result = {"name": f"tuning.{n_rows}.{method}", "rows": n_rows}
+            start = time.perf_counter()
+            try:
+                with MemoryMonitor() as monitor:
+                    best_model = search()
+                result.update({"seconds": time.perf_counter() - start, "best_score": float(best_model.best_score),
+                               "best_parameters": dict(best_model.best_parameters), **monitor.summary()})
+            except Exception as e:
+                result.update({"seconds": None, "error": str(e)})
+            results.append(result)
+    return results
@@ -0,0 +1,156 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+def latency_summary(latencies_seconds: List[float], rows_per_call: int = 1) -> dict:
+    """
+    summarize a list of per-call latencies into percentiles (milliseconds) and throughput (rows/sec)
+    """
+    latencies = np.asarray(latencies_seconds, dtype=np.float64)
+    total_seconds = float(latencies.sum())
+    return {
+        "calls": int(latencies.size),
+        "rows_per_call": rows_per_call,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "mean_ms": float(latencies.mean() * 1000),
+        "rows_per_sec": float(latencies.size * rows_per_call / total_seconds) if total_seconds else None,
+    }
+
+
+def time_calls(func: Callable, n_calls: int, warmup_calls: int = 5) -> List[float]:
+    """
+    call func(i) warmup_calls times without measuring, then n_calls times and return the latencies in seconds
+    """
+    for i in range(warmup_calls):
+        func(i)
+    latencies = []
+    for i in range(n_calls):
+        start = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class MemoryMonitor:
+    """
+    Measures the peak resident memory of the process while a block runs by sampling /proc/self/statm
+    from a background thread. Falls back to tracemalloc (python and numpy allocations only)
+    on platforms without /proc.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01):
+        self.interval_seconds = interval_seconds
+        self.use_rss = _current_rss_bytes() is not None
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+            time.sleep(self.interval_seconds)
+
+    def __enter__(self):
+        if self.use_rss:
+            self.start_bytes = self.peak_bytes = _current_rss_bytes()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.use_rss:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+        else:
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+    def summary(self) -> dict:
+        return {
+            "memory_source": "rss" if self.use_rss else "tracemalloc",
+            "peak_memory_mb": self.peak_bytes / 1e6,
+            "peak_memory_increase_mb": (self.peak_bytes - self.start_bytes) / 1e6,
+        }
+
+
+def get_environment_metadata() -> dict:
+    """
+    describe the machine and code version a benchmark run was produced on
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    versions = {}
+    for package in ("numpy", "pandas", "sklearn", "catboost", "xgboost", "fastapi"):
+        try:
+            versions[package] = __import__(package).__version__
+        except ImportError:
+            versions[package] = None
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+    }
+
+
+def write_results(file_path: str, results: List[dict], parameters: dict) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w") as file:
+        json.dump({"metadata": get_environment_metadata(), "parameters": parameters, "results": results},
+                  file, indent=2)
+
+
+def compare_results(baseline_path: str, current_results: List[dict], threshold: float = 0.1) -> List[dict]:
+    """
+    compare the current results with a previous run, matched on benchmark name
+    a regression is a latency / time / memory increase or a throughput decrease larger than threshold
+    """
+    with open(baseline_path) as file:
+        baseline = {result["name"]: result for result in json.load(file)["results"]}
+
+    lower_is_better = ("p50_ms", "p99_ms", "seconds", "peak_memory_increase_mb")
+    higher_is_better = ("rows_per_sec",)
+    comparisons = []
+    for result in current_results:
+        previous = baseline.get(result["name"])
+        if previous is None:
+            continue
+        for metric in lower_is_better + higher_is_better:
+            if result.get(metric) is None or not previous.get(metric):
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric]
+            regression = change > threshold if metric in lower_is_better else change < -threshold
+            comparisons.append({"name": result["name"], "metric": metric, "baseline": previous[metric],
+                                "current": result[metric], "change": change, "regression": regression})
+    return comparisons
@@ -0,0 +1,172 @@
+import asyncio
+import pickle
+import sys
+from typing import AsyncIterable, AsyncIterator, IO, Optional, Union
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob.aio import BlobServiceClient, ExponentialRetry
+
+from heart_disease.constants import STORAGE_ACCOUNT_CONNECTION, STORAGE_ACCOUNT_CONTAINER
+from heart_disease.entity.config_entity import ClientManagerConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.single_flight import AsyncSingleFlight
+
+
+class AsyncSimpleStorageService:
+    """
+    Async variant of SimpleStorageService on azure.storage.blob.aio for the serving path.
+    One process-wide instance (get_instance) owns a single aiohttp session with a bounded keep-alive
+    connection pool, shared by every blob call, so blob I/O never blocks the event loop.
+    """
+    _instance = None
+
+    def __init__(self, client_manager_config: ClientManagerConfig = ClientManagerConfig(),
+                 connection_string: str = STORAGE_ACCOUNT_CONNECTION,
+                 container_name: str = STORAGE_ACCOUNT_CONTAINER):
+        """
+        :param client_manager_config: pool size, timeout and retry configuration shared with the sync clients
+        """
+        self.client_manager_config = client_manager_config
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._blob_service_client: Optional[BlobServiceClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._single_flight = AsyncSingleFlight()
+
+    @classmethod
+    def get_instance(cls) -> "AsyncSimpleStorageService":
+        if cls._instance is None:
+            cls._instance = AsyncSimpleStorageService()
+        return cls._instance
+
+    async def open(self) -> BlobServiceClient:
+        """
+        Create the shared session and blob service client on first use, inside the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._blob_service_client is not None and self._loop is loop:
+            return self._blob_service_client
+        if self._lock is None or self._loop is not loop:
+            # clients and locks are bound to the loop that created them
+            self._lock = asyncio.Lock()
+            self._blob_service_client = None
+            self._session = None
+            self._loop = loop
+
+        async with self._lock:
+            if self._blob_service_client is None:
+                if not self.connection_string:
+                    raise Exception(f"Storage connection string (STORAGE_ACCOUNT_CONNECTION) is not set.")
+                config = self.client_manager_config
+                connector = aiohttp.TCPConnector(limit=config.blob_connection_pool_size)
+                self._session = aiohttp.ClientSession(connector=connector)
+                transport = AioHttpTransport(session=self._session, session_owner=False,
+                                             connection_timeout=config.blob_connection_timeout,
+                                             read_timeout=config.blob_read_timeout)
+                retry_policy = ExponentialRetry(initial_backoff=config.retry_backoff_seconds, increment_base=2,
+                                                retry_total=config.retry_total, random_jitter_range=1)
+                self._blob_service_client = BlobServiceClient.from_connection_string(
+                    self.connection_string, transport=transport, retry_policy=retry_policy)
+                logging.info("Created async BlobServiceClient with shared aiohttp session")
+            return self._blob_service_client
+
+    async def close(self) -> None:
+        """
+        Close the blob service client and the shared session, called from the application shutdown hook
+        """
+        if self._blob_service_client is not None:
+            await self._blob_service_client.close()
+            self._blob_service_client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logging.info("Closed async blob client")
+
+    async def __aenter__(self) -> "AsyncSimpleStorageService":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def get_blob_client(self, blob_name: str, container_name: Optional[str] = None):
+        blob_service_client = await self.open()
+        return blob_service_client.get_blob_client(container=container_name or self.container_name, blob=blob_name)
+
+    async def exists(self, blob_name: str, container_name: Optional[str] = None) -> bool:
+        try:
+            blob_client = await self.get_blob_client(blob_name, container_name)
+            return await blob_client.exists()
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    async def get_blob_version(self, blob_name: str, container_name: Optional[str] = None) -> str:
+        """
+        Return the ETag of a blob, which changes every time the blob is overwritten.
+        """
+        try:
+            blob_client = await self.get_blob_client(blob_name, container_name)
+            return (await blob_client.get_blob_properties()).etag
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    async def download_stream(self, blob_name: str, container_name: Optional[str] = None,
+                              max_concurrency: int = 1) -> AsyncIterator[bytes]:
+        """
+        Yield the content of a blob chunk by chunk without holding the whole blob in memory
+        """
+        try:
+            blob_client = await self.get_blob_client(blob_name, container_name)
+            downloader = await blob_client.download_blob(max_concurrency=max_concurrency)
+            async for chunk in downloader.chunks():
+                yield chunk
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    async def read_bytes(self, blob_name: str, container_name: Optional[str] = None,
+                         max_concurrency: int = 4) -> bytes:
+        try:
+            blob_client = await self.get_blob_client(blob_name, container_name)
+            downloader = await blob_client.download_blob(max_concurrency=max_concurrency)
+            return await downloader.readall()
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    async def upload_stream(self, blob_name: str, data: Union[bytes, IO[bytes], AsyncIterable[bytes]],
+                            container_name: Optional[str] = None, length: Optional[int] = None,
+                            overwrite: bool = True, max_concurrency: int = 4) -> None:
+        """
+        Upload bytes, a file object or an async iterable of byte chunks as a blob
+        """
+        try:
+            blob_client = await self.get_blob_client(blob_name, container_name)
+            await blob_client.upload_blob(data, length=length, overwrite=overwrite, max_concurrency=max_concurrency)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    async def _load_model(self, blob_path: str):
+        model_data = await self.read_bytes(blob_path)
+        model = await asyncio.to_thread(pickle.loads, model_data)
+        logging.info(f"Loaded model from blob: {blob_path}")
+        return model
+
+    async def load_model(self, model_name: str, blob_prefix: str = None, model_dir: str = None,
+                         version: str = None):
+        """
+        Download a pickled model without blocking the loop, unpickling runs in a worker thread.
+        Concurrent loads of the same blob and version await one download.
+        :param version: version the caller expects (see get_blob_version), only used to tell loads apart
+        """
+        try:
+            blob_path = f"{blob_prefix}/{model_name}" if blob_prefix else model_name
+            if model_dir:
+                blob_path = f"{model_dir}/{blob_path}"
+
+            return await self._single_flight.do((self.container_name, blob_path, version),
+                                                self._load_model, blob_path)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
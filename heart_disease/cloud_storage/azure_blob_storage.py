@@ -2,44 +2,67 @@
 import os
 import sys
 import pickle
-from io import StringIO
+from io import BytesIO, StringIO
 from typing import Union, List, Optional
 
 import pandas as pd
 
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.configuration.azure_connection import AzuriteClient
+from heart_disease.cloud_storage.storage_backend import StorageBackend, AzureBlobBackend, get_storage_backend
+from heart_disease.utils.single_flight import SingleFlight
 from azure.storage.blob import BlobClient
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 
 
 class SimpleStorageService:
-    def __init__(self):
-        azurite_client = AzuriteClient()
-        logging.info("Connecting to Azurite......")
-
-        # pull instances from the AzuriteClient singleton
-        self.blob_service_client = azurite_client.client["blob_service_client"]
-        self.container_client = azurite_client.client["container_client"]
-        self.container_name = azurite_client.client["container_name"]
+    """
+    Model registry / artifact store. Every call goes through a StorageBackend (Azure, local filesystem or
+    in-memory, selected by StorageConfig) so single-host deployments and tests skip the HTTP hop.
+    Blob downloads are single-flight across every instance of the process: concurrent reads of the same
+    object share one fetch instead of each pulling it from the store.
+    """
+    _single_flight = SingleFlight()
+
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        """
+        :param backend: storage backend to use, defaults to get_storage_backend()
+        """
+        self.backend = backend if backend is not None else get_storage_backend()
+        logging.info(f"Using {self.backend.__class__.__name__} storage......")
+        self.container_name = self.backend.container_name
 
     def blob_are_available(self, blob_name, model_path) -> bool:
         try:
-            blob_list = self.container_client.list_blobs(name_starts_with=model_path)
-            return any(blob.name == blob_name for blob in blob_list)
+            return any(name == blob_name for name in self.backend.list_names(prefix=model_path))
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
-        
-    @staticmethod
+
+    def single_flight(self, key: tuple, func, *args, **kwargs):
+        """
+        Run func once for concurrent callers of the same key on this store, every caller gets its result
+        or its exception. Instances share a call when their backends read the same store (the same Azure
+        account, local root or in-memory backend)
+        """
+        store_key = self.backend.store_key + (self.container_name,) + tuple(key)
+        return SimpleStorageService._single_flight.do(store_key, func, *args, **kwargs)
+
+    def read_bytes(self, blob_name: str, container_name: Optional[str] = None) -> bytes:
+        return self.single_flight(("read_bytes", container_name, blob_name),
+                                  self.backend.read_bytes, blob_name, container_name)
+
+    def exists(self, blob_name: str, container_name: Optional[str] = None) -> bool:
+        try:
+            return self.backend.exists(blob_name, container_name)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
     def read_object(self, blob_name: str, decode: bool = True, make_readable: bool = False) -> Union[StringIO, str, bytes]:
         """
         Read a blob and return either bytes, str or StringIO depending on flags.
         """
         logging.info("Entered read_object")
         try:
-            blob_client = self.get_blob_client(blob_name)
-            blob_bytes = blob_client.download_blob().readall()
+            blob_bytes = self.read_bytes(blob_name)
 
             if not decode:
                 return blob_bytes
@@ -50,49 +73,62 @@ class SimpleStorageService:
                 return StringIO(text)
             return text
 
-        except ResourceNotFoundError as e:
+        except FileNotFoundError as e:
             raise HeartdieseaseException(f"Blob '{blob_name}' not found: {e}", sys) from e
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
     def get_blob(self, blob_name: str) -> BlobClient:
-        """Get a blob client scoped to the default container."""
-        try:
-            return self.container_client.get_blob_client(blob_name)
-        except Exception as e:
-            raise HeartdieseaseException(e, sys) from e
+        """Get a blob client scoped to the default container (Azure backend only)."""
+        return self.get_blob_client(blob_name)
 
     def get_blob_client(self, blob_name: str, container_name: Optional[str] = None) -> BlobClient:
         """
-        Get a blob client from a specified container (or the default container if None).
+        Get a blob client from a specified container (or the default container if None), Azure backend only.
         """
         try:
-            if container_name is None:
-                container_name = self.container_name
-            return self.blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+            if not isinstance(self.backend, AzureBlobBackend):
+                raise Exception(f"Blob clients are only available with the azure storage backend")
+            return self.backend.get_blob_client(blob_name, container_name)
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
     def get_file_object(self, filename: str) -> Union[List[str], str]:
         try:
-            blob_list = [blob.name for blob in self.container_client.list_blobs(name_starts_with=filename)]
+            blob_list = self.backend.list_names(prefix=filename)
             if not blob_list:
                 raise Exception(f"No blobs found with prefix '{filename}'")
             return blob_list[0] if len(blob_list) == 1 else blob_list
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
-    def load_model(self, model_name: str, blob_prefix: str = None, model_dir: str = None):
+    def _load_model(self, blob_path: str):
+        # the local backend hands out a memory mapped view, unpickled without an intermediate copy
+        with self.backend.open_buffer(blob_path) as model_data:
+            model = pickle.loads(model_data)
+        logging.info(f"Loaded model from blob: {blob_path}")
+        return model
+
+    def load_model(self, model_name: str, blob_prefix: str = None, model_dir: str = None, version: str = None):
+        """
+        Download and unpickle a model. Concurrent loads of the same blob and version share one download.
+        :param version: version the caller expects (see get_blob_version), only used to tell loads apart
+        """
         try:
             blob_path = f"{blob_prefix}/{model_name}" if blob_prefix else model_name
             if model_dir:
                 blob_path = f"{model_dir}/{blob_path}"
 
-            blob_client = self.get_blob_client(blob_path)
-            model_data = blob_client.download_blob().readall()
-            model = pickle.loads(model_data)
-            logging.info(f"Loaded model from blob: {blob_path}")
-            return model
+            return self.single_flight(("load_model", blob_path, version), self._load_model, blob_path)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_blob_version(self, blob_name: str, container_name: Optional[str] = None) -> str:
+        """
+        Return the version (ETag for Azure) of a blob, which changes every time the blob is overwritten.
+        """
+        try:
+            return self.backend.get_version(blob_name, container_name)
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
@@ -101,54 +137,54 @@ class SimpleStorageService:
         Create a zero-byte blob named `folder_name/` to represent a virtual folder.
         """
         try:
-            if container_name is None:
-                container_name = self.container_name
-
-            blob_client = self.get_blob_client(f"{folder_name.rstrip('/')}/", container_name)
             try:
-                # Try to create without overwrite; if exists, ResourceExistsError will be thrown
-                blob_client.upload_blob(b'', overwrite=False)
-            except ResourceExistsError:
+                # Try to create without overwrite; if exists, FileExistsError will be thrown
+                self.backend.write_bytes(f"{folder_name.rstrip('/')}/", b'', container_name, overwrite=False)
+            except FileExistsError:
                 pass
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
     def upload_file(self, from_filename: str, to_filename: str, container_name: Optional[str] = None, remove: bool = True):
         try:
-            if container_name is None:
-                container_name = self.container_name
-
-            blob_client = self.get_blob_client(to_filename, container_name)
-            with open(from_filename, "rb") as data:
-                blob_client.upload_blob(data, overwrite=True)
+            self.backend.upload_file(from_filename, to_filename, container_name)
 
             if remove:
                 os.remove(from_filename)
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
+    def upload_bytes(self, data: bytes, to_filename: str, container_name: Optional[str] = None) -> None:
+        try:
+            self.backend.write_bytes(to_filename, data, container_name)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def delete(self, blob_name: str, container_name: Optional[str] = None) -> None:
+        """
+        Delete a blob, nothing happens when it does not exist.
+        """
+        try:
+            self.backend.delete(blob_name, container_name)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
     def upload_df_as_csv(self, data_frame: pd.DataFrame, local_filename: str, blob_filename: str, container_name: Optional[str] = None) -> None:
         """
-        Upload a DataFrame as CSV (in-memory) to Azurite.
+        Upload a DataFrame as CSV (in-memory) to the storage backend.
         local_filename is optional (kept for backward compatibility) but not required.
         """
         try:
-            if container_name is None:
-                container_name = self.container_name
-
             csv_buffer = StringIO()
             data_frame.to_csv(csv_buffer, index=False)
-            blob_client = self.get_blob_client(blob_filename, container_name)
-            blob_client.upload_blob(csv_buffer.getvalue(), overwrite=True)
+            self.backend.write_bytes(blob_filename, csv_buffer.getvalue().encode("utf-8"), container_name)
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
     def get_df_from_object(self, blob_name: str, container_name: Optional[str] = None) -> pd.DataFrame:
         try:
-            blob_client = self.get_blob_client(blob_name, container_name)
-            blob_bytes = blob_client.download_blob().readall()
-            text = blob_bytes.decode("utf-8")
-            df = pd.read_csv(StringIO(text))
+            blob_bytes = self.read_bytes(blob_name, container_name)
+            df = pd.read_csv(BytesIO(blob_bytes))
             return df
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
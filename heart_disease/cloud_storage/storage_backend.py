@@ -0,0 +1,360 @@
+import mmap
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Union
+
+from heart_disease.entity.config_entity import StorageConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+STORAGE_BACKEND_TYPES = ("azure", "local", "memory")
+
+
+class StorageBackend(ABC):
+    """
+    Minimal blob store used by SimpleStorageService: named byte objects inside containers,
+    with a version string that changes on every overwrite
+    """
+    container_name: str
+
+    @property
+    def store_key(self) -> tuple:
+        """
+        Identifies the store the backend reads from, backends with the same key hold the same objects
+        """
+        return self.__class__.__name__, id(self)
+
+    @abstractmethod
+    def read_bytes(self, name: str, container_name: Optional[str] = None) -> bytes:
+        ...
+
+    @abstractmethod
+    def write_bytes(self, name: str, data: bytes, container_name: Optional[str] = None,
+                    overwrite: bool = True) -> None:
+        """
+        :raises FileExistsError: when the object exists and overwrite is False
+        """
+
+    @abstractmethod
+    def exists(self, name: str, container_name: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def list_names(self, prefix: str = "", container_name: Optional[str] = None) -> List[str]:
+        ...
+
+    @abstractmethod
+    def get_version(self, name: str, container_name: Optional[str] = None) -> str:
+        ...
+
+    @abstractmethod
+    def delete(self, name: str, container_name: Optional[str] = None) -> None:
+        """
+        Removes an object, a missing object is not an error
+        """
+
+    @contextmanager
+    def open_buffer(self, name: str, container_name: Optional[str] = None) -> Iterator[Union[bytes, memoryview]]:
+        """
+        bytes-like view of an object, only valid inside the with block
+        """
+        yield self.read_bytes(name, container_name)
+
+    def upload_file(self, from_filename: str, name: str, container_name: Optional[str] = None) -> None:
+        with open(from_filename, "rb") as data:
+            self.write_bytes(name, data.read(), container_name)
+
+
+class AzureBlobBackend(StorageBackend):
+    """
+    Blob containers of Azure Storage / Azurite through the pooled clients of AzuriteClient
+    """
+
+    def __init__(self):
+        from heart_disease.configuration.azure_connection import AzuriteClient
+
+        azurite_client = AzuriteClient()
+        self.blob_service_client = azurite_client.client["blob_service_client"]
+        self.container_client = azurite_client.client["container_client"]
+        self.container_name = azurite_client.client["container_name"]
+
+    @property
+    def store_key(self) -> tuple:
+        return self.__class__.__name__, self.blob_service_client.url
+
+    def get_blob_client(self, name: str, container_name: Optional[str] = None):
+        return self.blob_service_client.get_blob_client(container=container_name or self.container_name, blob=name)
+
+    def read_bytes(self, name: str, container_name: Optional[str] = None) -> bytes:
+        return self.get_blob_client(name, container_name).download_blob().readall()
+
+    def write_bytes(self, name: str, data: bytes, container_name: Optional[str] = None,
+                    overwrite: bool = True) -> None:
+        from azure.core.exceptions import ResourceExistsError
+
+        try:
+            self.get_blob_client(name, container_name).upload_blob(data, overwrite=overwrite)
+        except ResourceExistsError as e:
+            raise FileExistsError(name) from e
+
+    def upload_file(self, from_filename: str, name: str, container_name: Optional[str] = None) -> None:
+        # the SDK streams the file in blocks instead of reading it into memory
+        with open(from_filename, "rb") as data:
+            self.get_blob_client(name, container_name).upload_blob(data, overwrite=True)
+
+    def exists(self, name: str, container_name: Optional[str] = None) -> bool:
+        return self.get_blob_client(name, container_name).exists()
+
+    def list_names(self, prefix: str = "", container_name: Optional[str] = None) -> List[str]:
+        container_client = self.blob_service_client.get_container_client(container_name or self.container_name)
+        return [blob.name for blob in container_client.list_blobs(name_starts_with=prefix or None)]
+
+    def get_version(self, name: str, container_name: Optional[str] = None) -> str:
+        return self.get_blob_client(name, container_name).get_blob_properties().etag
+
+    def delete(self, name: str, container_name: Optional[str] = None) -> None:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            self.get_blob_client(name, container_name).delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+
+class LocalFileSystemBackend(StorageBackend):
+    """
+    Containers are directories under root_dir. Reads are memory mapped so a model is unpickled straight
+    from the page cache, writes go to a temporary file that is atomically renamed over the object.
+    """
+
+    def __init__(self, root_dir: str, container_name: str):
+        self.root_dir = root_dir
+        self.container_name = container_name
+
+    @property
+    def store_key(self) -> tuple:
+        return self.__class__.__name__, os.path.realpath(self.root_dir)
+
+    def get_path(self, name: str, container_name: Optional[str] = None) -> str:
+        return os.path.join(self.root_dir, container_name or self.container_name, *name.split("/"))
+
+    def read_bytes(self, name: str, container_name: Optional[str] = None) -> bytes:
+        with self.open_buffer(name, container_name) as buffer:
+            return bytes(buffer)
+
+    @contextmanager
+    def open_buffer(self, name: str, container_name: Optional[str] = None) -> Iterator[Union[bytes, memoryview]]:
+        path = self.get_path(name, container_name)
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def write_bytes(self, name: str, data: bytes, container_name: Optional[str] = None,
+                    overwrite: bool = True) -> None:
+        path = self.get_path(name, container_name)
+        if not overwrite and os.path.exists(path):
+            raise FileExistsError(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if name.endswith("/"):
+            return
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def exists(self, name: str, container_name: Optional[str] = None) -> bool:
+        return os.path.exists(self.get_path(name, container_name))
+
+    def list_names(self, prefix: str = "", container_name: Optional[str] = None) -> List[str]:
+        container_dir = os.path.join(self.root_dir, container_name or self.container_name)
+        names = []
+        for directory, _, file_names in os.walk(container_dir):
+            for file_name in file_names:
+                if file_name.startswith(".tmp-"):
+                    continue
+                name = os.path.relpath(os.path.join(directory, file_name), container_dir).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def get_version(self, name: str, container_name: Optional[str] = None) -> str:
+        stat = os.stat(self.get_path(name, container_name))
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{stat.st_ino:x}"
+
+    def delete(self, name: str, container_name: Optional[str] = None) -> None:
+        try:
+            os.remove(self.get_path(name, container_name))
+        except FileNotFoundError:
+            pass
+
+
+class InMemoryBackend(StorageBackend):
+    """
+    Process-local object store for tests, benchmarks and single-process runs
+    """
+
+    def __init__(self, container_name: str):
+        self.container_name = container_name
+        self._objects = {}
+        self._versions = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, container_name: Optional[str]):
+        return container_name or self.container_name, name
+
+    def read_bytes(self, name: str, container_name: Optional[str] = None) -> bytes:
+        try:
+            return self._objects[self._key(name, container_name)]
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def write_bytes(self, name: str, data: bytes, container_name: Optional[str] = None,
+                    overwrite: bool = True) -> None:
+        key = self._key(name, container_name)
+        with self._lock:
+            if not overwrite and key in self._objects:
+                raise FileExistsError(name)
+            self._counter += 1
+            self._objects[key] = bytes(data)
+            self._versions[key] = str(self._counter)
+
+    def exists(self, name: str, container_name: Optional[str] = None) -> bool:
+        return self._key(name, container_name) in self._objects
+
+    def list_names(self, prefix: str = "", container_name: Optional[str] = None) -> List[str]:
+        container_name = container_name or self.container_name
+        return sorted(name for container, name in list(self._objects) if container == container_name
+                      and name.startswith(prefix))
+
+    def get_version(self, name: str, container_name: Optional[str] = None) -> str:
+        try:
+            return self._versions[self._key(name, container_name)]
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def delete(self, name: str, container_name: Optional[str] = None) -> None:
+        key = self._key(name, container_name)
+        with self._lock:
+            self._objects.pop(key, None)
+            self._versions.pop(key, None)
+
+
+class LatencyInjectingBackend(StorageBackend):
+    """
+    Wraps a backend and sleeps before every call: latency_seconds plus uniform jitter, with probability
+    tail_probability an extra tail_latency_seconds, and transfers limited to bandwidth_mb_per_second.
+    Used to measure how blob latency moves serving and training tail latency.
+    """
+
+    def __init__(self, backend: StorageBackend, latency_seconds: float = 0.0, jitter_seconds: float = 0.0,
+                 tail_probability: float = 0.0, tail_latency_seconds: float = 0.0,
+                 bandwidth_mb_per_second: Optional[float] = None, random_state: Optional[int] = None):
+        self.backend = backend
+        self.container_name = backend.container_name
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.tail_probability = tail_probability
+        self.tail_latency_seconds = tail_latency_seconds
+        self.bandwidth_mb_per_second = bandwidth_mb_per_second
+        self._random = random.Random(random_state)
+        self._lock = threading.Lock()
+
+    def delay(self, n_bytes: int = 0) -> float:
+        with self._lock:
+            seconds = self.latency_seconds + self._random.uniform(0, self.jitter_seconds)
+            if self._random.random() < self.tail_probability:
+                seconds += self.tail_latency_seconds
+        if self.bandwidth_mb_per_second:
+            seconds += n_bytes / (self.bandwidth_mb_per_second * 1e6)
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+    def read_bytes(self, name: str, container_name: Optional[str] = None) -> bytes:
+        data = self.backend.read_bytes(name, container_name)
+        self.delay(len(data))
+        return data
+
+    @contextmanager
+    def open_buffer(self, name: str, container_name: Optional[str] = None) -> Iterator[Union[bytes, memoryview]]:
+        with self.backend.open_buffer(name, container_name) as buffer:
+            self.delay(len(buffer))
+            yield buffer
+
+    def write_bytes(self, name: str, data: bytes, container_name: Optional[str] = None,
+                    overwrite: bool = True) -> None:
+        self.delay(len(data))
+        self.backend.write_bytes(name, data, container_name, overwrite)
+
+    def upload_file(self, from_filename: str, name: str, container_name: Optional[str] = None) -> None:
+        self.delay(os.path.getsize(from_filename))
+        self.backend.upload_file(from_filename, name, container_name)
+
+    def exists(self, name: str, container_name: Optional[str] = None) -> bool:
+        self.delay()
+        return self.backend.exists(name, container_name)
+
+    def list_names(self, prefix: str = "", container_name: Optional[str] = None) -> List[str]:
+        self.delay()
+        return self.backend.list_names(prefix, container_name)
+
+    def get_version(self, name: str, container_name: Optional[str] = None) -> str:
+        self.delay()
+        return self.backend.get_version(name, container_name)
+
+    def delete(self, name: str, container_name: Optional[str] = None) -> None:
+        self.delay()
+        self.backend.delete(name, container_name)
+
+
+_memory_backends = {}
+_memory_backends_lock = threading.Lock()
+
+
+def get_storage_backend(storage_config: StorageConfig = StorageConfig()) -> StorageBackend:
+    """
+    create the storage backend selected by storage_config.backend_type, wrapped in a LatencyInjectingBackend
+    when an injected latency is configured. In-memory stores are shared per container within the process.
+    """
+    try:
+        backend_type = storage_config.backend_type
+        if backend_type == "azure":
+            backend = AzureBlobBackend()
+        elif backend_type == "local":
+            backend = LocalFileSystemBackend(root_dir=storage_config.local_root_dir,
+                                             container_name=storage_config.container_name)
+        elif backend_type == "memory":
+            with _memory_backends_lock:
+                backend = _memory_backends.setdefault(storage_config.container_name,
+                                                      InMemoryBackend(container_name=storage_config.container_name))
+        else:
+            raise Exception(f"Unknown storage backend '{backend_type}', expected one of {STORAGE_BACKEND_TYPES}")
+
+        if storage_config.injected_latency_seconds or storage_config.injected_tail_latency_seconds:
+            backend = LatencyInjectingBackend(backend, latency_seconds=storage_config.injected_latency_seconds,
+                                              jitter_seconds=storage_config.injected_jitter_seconds,
+                                              tail_probability=storage_config.injected_tail_probability,
+                                              tail_latency_seconds=storage_config.injected_tail_latency_seconds)
+        logging.info(f"Using {backend_type} storage backend")
+        return backend
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
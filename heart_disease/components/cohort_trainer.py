@@ -0,0 +1,248 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields, replace
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import yaml
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.components.data_transformation import DataTransformation
+from heart_disease.components.model_evaluation import ModelEvaluation
+from heart_disease.components.model_pusher import ModelPusher
+from heart_disease.components.model_trainer import ModelTrainer
+from heart_disease.constants import (MODEL_FILE_NAME, TRAIN_FILE_NAME, TEST_FILE_NAME, DATA_INGESTION_DIR_NAME,
+                                     DATA_INGESTION_INGESTED_DIR)
+from heart_disease.entity.artifact_entity import (CohortTrainingArtifact, DataIngestionArtifact,
+                                                  DataValidationArtifact, ModelTrainerArtifact)
+from heart_disease.entity.config_entity import (CohortTrainingConfig, DataTransformationConfig, ModelTrainerConfig,
+                                                ModelEvaluationConfig, ModelPusherConfig)
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import write_yaml_file, cohort_slug
+
+
+def get_cohort_blob_path(blob_prefix: str, cohort) -> str:
+    return f"{blob_prefix}/{cohort_slug(cohort)}/{MODEL_FILE_NAME}"
+
+
+def relocate_config(config, artifact_dir: str, cohort_artifact_dir: str):
+    """
+    Copy of a stage config whose artifact paths point into the directory of a cohort instead of the
+    artifact directory of the run
+    """
+    changes = {}
+    for field in fields(config):
+        value = getattr(config, field.name)
+        if isinstance(value, str) and value.startswith(artifact_dir + os.sep):
+            changes[field.name] = os.path.join(cohort_artifact_dir, os.path.relpath(value, artifact_dir))
+    return replace(config, **changes)
+
+
+def train_cohort(cohort: str, data_ingestion_artifact: DataIngestionArtifact,
+                 data_validation_artifact: DataValidationArtifact,
+                 data_transformation_config: DataTransformationConfig,
+                 model_trainer_config: ModelTrainerConfig) -> Tuple[str, Optional[ModelTrainerArtifact], str]:
+    """
+    Transform and train the model of one cohort, runs in a worker process.
+    A cohort that fails (e.g. no model above the expected score) is reported instead of failing the others.
+    """
+    try:
+        logging.info(f"Training the model of cohort {cohort}")
+        data_transformation_artifact = DataTransformation(
+            data_ingestion_artifact=data_ingestion_artifact,
+            data_transformation_config=data_transformation_config,
+            data_validation_artifact=data_validation_artifact).initiate_data_transformation()
+        model_trainer_artifact = ModelTrainer(data_transformation_artifact=data_transformation_artifact,
+                                              model_trainer_config=model_trainer_config).initiate_model_trainer()
+        return cohort, model_trainer_artifact, ""
+    except Exception as e:
+        logging.info(f"Training the model of cohort {cohort} failed: {e}")
+        return cohort, None, str(e)
+
+
+class CohortTrainer:
+    """
+    Trains one model per cohort (source site of the dataset column) in parallel worker processes,
+    evaluates each against its registry model and publishes the accepted ones under
+    <blob_prefix>/<cohort>/model.pkl together with a manifest used by the serving model pool
+    """
+
+    def __init__(self, cohort_training_config: CohortTrainingConfig, data_ingestion_artifact: DataIngestionArtifact,
+                 data_validation_artifact: DataValidationArtifact,
+                 data_transformation_config: DataTransformationConfig, model_trainer_config: ModelTrainerConfig,
+                 model_evaluation_config: ModelEvaluationConfig):
+        """
+        :param cohort_training_config: configuration for cohort training
+        :param data_transformation_config: configuration of the global run, relocated per cohort
+        """
+        self.cohort_training_config = cohort_training_config
+        self.data_ingestion_artifact = data_ingestion_artifact
+        self.data_validation_artifact = data_validation_artifact
+        self.data_transformation_config = data_transformation_config
+        self.model_trainer_config = model_trainer_config
+        self.model_evaluation_config = model_evaluation_config
+
+    def get_cohort_artifact_dir(self, cohort) -> str:
+        return os.path.join(self.cohort_training_config.cohort_dir, cohort_slug(cohort))
+
+    def relocate_config(self, config, cohort):
+        # the cohort directory sits in the artifact directory of the run
+        artifact_dir = os.path.dirname(os.path.normpath(self.cohort_training_config.cohort_dir))
+        return relocate_config(config, artifact_dir, self.get_cohort_artifact_dir(cohort))
+
+    def split_by_cohort(self) -> Tuple[Dict[str, DataIngestionArtifact], Dict[str, dict], List[str]]:
+        """
+        Method Name :   split_by_cohort
+        Description :   This method splits the ingested train and test sets by cohort, so every cohort model
+                        is scored on the test rows of the global run
+
+        Output      :   Returns the data ingestion artifact and row counts of every cohort with enough rows
+                        and the names of the skipped cohorts
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            cohort_column = self.cohort_training_config.cohort_column
+            train_df = pd.read_csv(self.data_ingestion_artifact.trained_file_path)
+            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+
+            cohort_artifacts, row_counts, skipped_cohorts = {}, {}, []
+            train_groups = dict(list(train_df.groupby(cohort_column)))
+            test_groups = dict(list(test_df.groupby(cohort_column)))
+            for cohort in sorted(set(train_groups) | set(test_groups)):
+                cohort_train_df = train_groups.get(cohort, train_df.iloc[:0])
+                cohort_test_df = test_groups.get(cohort, test_df.iloc[:0])
+                if len(cohort_train_df) + len(cohort_test_df) < self.cohort_training_config.min_rows or \
+                        cohort_test_df.empty:
+                    logging.info(f"Skipping cohort {cohort}: {len(cohort_train_df)} train / "
+                                 f"{len(cohort_test_df)} test rows")
+                    skipped_cohorts.append(cohort)
+                    continue
+
+                ingested_dir = os.path.join(self.get_cohort_artifact_dir(cohort), DATA_INGESTION_DIR_NAME,
+                                            DATA_INGESTION_INGESTED_DIR)
+                os.makedirs(ingested_dir, exist_ok=True)
+                training_file_path = os.path.join(ingested_dir, TRAIN_FILE_NAME)
+                testing_file_path = os.path.join(ingested_dir, TEST_FILE_NAME)
+                cohort_train_df.to_csv(training_file_path, index=False, header=True)
+                cohort_test_df.to_csv(testing_file_path, index=False, header=True)
+
+                cohort_artifacts[cohort] = DataIngestionArtifact(trained_file_path=training_file_path,
+                                                                 test_file_path=testing_file_path)
+                row_counts[cohort] = {"train_rows": len(cohort_train_df), "test_rows": len(cohort_test_df)}
+            return cohort_artifacts, row_counts, skipped_cohorts
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def train_cohorts(self, cohort_artifacts: Dict[str, DataIngestionArtifact]) -> Dict[str, tuple]:
+        """
+        Method Name :   train_cohorts
+        Description :   This method trains the cohort models, one worker process per cohort up to n_jobs
+
+        Output      :   Returns the model trainer artifact (None when training failed) and message per cohort
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            jobs = []
+            for cohort, data_ingestion_artifact in cohort_artifacts.items():
+                jobs.append((cohort, data_ingestion_artifact, self.data_validation_artifact,
+                             self.relocate_config(self.data_transformation_config, cohort),
+                             self.relocate_config(self.model_trainer_config, cohort)))
+
+            n_jobs = min(self.cohort_training_config.n_jobs, len(jobs))
+            if n_jobs <= 1:
+                results = [train_cohort(*job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    results = list(executor.map(train_cohort, *zip(*jobs)))
+            return {cohort: (model_trainer_artifact, message) for cohort, model_trainer_artifact, message in results}
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def evaluate_and_push(self, cohort, data_ingestion_artifact: DataIngestionArtifact,
+                          model_trainer_artifact: ModelTrainerArtifact) -> bool:
+        """
+        Evaluate the model of a cohort against its registry model and push it when it is accepted
+        """
+        blob_model_path = get_cohort_blob_path(self.cohort_training_config.blob_prefix, cohort)
+        model_evaluation_config = replace(
+            self.relocate_config(self.model_evaluation_config, cohort),
+            blob_name=self.cohort_training_config.blob_name, blob_model_key_path=blob_model_path)
+        model_evaluation_artifact = ModelEvaluation(model_eval_config=model_evaluation_config,
+                                                    data_ingestion_artifact=data_ingestion_artifact,
+                                                    model_trainer_artifact=model_trainer_artifact
+                                                    ).initiate_model_evaluation()
+        if not model_evaluation_artifact.is_model_accepted:
+            logging.info(f"Model of cohort {cohort} not accepted")
+            return False
+
+        ModelPusher(model_evaluation_artifact=model_evaluation_artifact,
+                    model_pusher_config=ModelPusherConfig(blob_name=self.cohort_training_config.blob_name,
+                                                          blob_model_key_path=blob_model_path)
+                    ).initiate_model_pusher()
+        return True
+
+    def publish_manifest(self, blob: SimpleStorageService, manifest_cohorts: Dict[str, dict]) -> None:
+        """
+        Merge the pushed cohorts into the registry manifest, cohorts not retrained this run keep their entry
+        """
+        manifest_file_name = os.path.basename(self.cohort_training_config.manifest_file_path)
+        manifest_blob_path = f"{self.cohort_training_config.blob_prefix}/{manifest_file_name}"
+        manifest = {"cohort_column": self.cohort_training_config.cohort_column, "cohorts": {}}
+        if blob.exists(manifest_blob_path, self.cohort_training_config.blob_name):
+            manifest["cohorts"].update(yaml.safe_load(blob.read_object(manifest_blob_path)).get("cohorts") or {})
+        manifest["cohorts"].update(manifest_cohorts)
+
+        write_yaml_file(file_path=self.cohort_training_config.manifest_file_path, content=manifest)
+        blob.upload_file(self.cohort_training_config.manifest_file_path, manifest_blob_path,
+                         container_name=self.cohort_training_config.blob_name, remove=False)
+        logging.info(f"Published cohort manifest with {len(manifest['cohorts'])} cohorts")
+
+    def initiate_cohort_training(self) -> CohortTrainingArtifact:
+        """
+        Method Name :   initiate_cohort_training
+        Description :   This method splits the ingested data by cohort, trains the cohort models in parallel,
+                        pushes the accepted ones and publishes the cohort manifest
+
+        Output      :   Returns cohort training artifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered initiate_cohort_training method of CohortTrainer class")
+        try:
+            cohort_artifacts, row_counts, skipped_cohorts = self.split_by_cohort()
+            training_results = self.train_cohorts(cohort_artifacts)
+
+            trained_cohorts, pushed_cohorts, failed_cohorts = [], [], []
+            manifest_cohorts = {}
+            blob = SimpleStorageService()
+            for cohort, (model_trainer_artifact, message) in training_results.items():
+                if model_trainer_artifact is None:
+                    logging.info(f"No model for cohort {cohort}: {message}")
+                    failed_cohorts.append(cohort)
+                    continue
+                trained_cohorts.append(cohort)
+                if not self.evaluate_and_push(cohort, cohort_artifacts[cohort], model_trainer_artifact):
+                    continue
+
+                pushed_cohorts.append(cohort)
+                blob_model_path = get_cohort_blob_path(self.cohort_training_config.blob_prefix, cohort)
+                manifest_cohorts[cohort] = {
+                    "slug": cohort_slug(cohort),
+                    "blob_model_path": blob_model_path,
+                    "version": blob.get_blob_version(blob_model_path, self.cohort_training_config.blob_name),
+                    "f1_score": float(model_trainer_artifact.metric_artifact.f1_score),
+                    **row_counts[cohort],
+                }
+
+            if manifest_cohorts:
+                self.publish_manifest(blob, manifest_cohorts)
+
+            cohort_training_artifact = CohortTrainingArtifact(
+                manifest_file_path=self.cohort_training_config.manifest_file_path,
+                trained_cohorts=trained_cohorts, pushed_cohorts=pushed_cohorts,
+                skipped_cohorts=skipped_cohorts, failed_cohorts=failed_cohorts)
+            logging.info(f"Cohort training artifact: {cohort_training_artifact}")
+            return cohort_training_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
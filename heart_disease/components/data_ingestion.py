@@ -1,6 +1,7 @@
 import os
 import sys
 
+import pandas as pd
 from pandas import DataFrame
 from sklearn.model_selection import train_test_split
 
@@ -8,7 +9,7 @@ from heart_disease.entity.config_entity import DataIngestionConfig
 from heart_disease.entity.artifact_entity import DataIngestionArtifact
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.data_access.heartdisease_data import HeartdiseaseData
+from heart_disease.data_access.data_source import get_data_source
 
 
 
@@ -23,19 +24,23 @@ class DataIngestion:
             raise HeartdieseaseException(e,sys)
         
     
-    def export_data_into_feature_store(self)->DataFrame:
+    def export_data_into_feature_store(self, watermark=None)->DataFrame:
         """
         Method Name :   export_data_into_feature_store
-        Description :   This method exports data from mongodb to csv file
+        Description :   This method exports data from the configured data source (mongodb, CSV / Parquet files
+                        or SQLite) to csv file, only the records after watermark when one is given
         
         Output      :   data is returned as artifact of data ingestion components
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            logging.info(f"Exporting data from mongodb")
-            heartdisease_data = HeartdiseaseData()
-            dataframe = heartdisease_data.export_collection_as_dataframe(collection_name=
-                                                                   self.data_ingestion_config.collection_name)
+            logging.info(f"Exporting data from {self.data_ingestion_config.data_source_type} data source")
+            data_source = get_data_source(data_ingestion_config=self.data_ingestion_config)
+            if watermark is None:
+                dataframe = data_source.read_dataframe()
+            else:
+                logging.info(f"Reading records with {self.data_ingestion_config.watermark_column} > {watermark}")
+                dataframe = data_source.read_dataframe_since(self.data_ingestion_config.watermark_column, watermark)
             logging.info(f"Shape of dataframe: {dataframe.shape}")
             feature_store_file_path  = self.data_ingestion_config.feature_store_file_path
             dir_path = os.path.dirname(feature_store_file_path)
@@ -75,10 +80,11 @@ class DataIngestion:
             raise HeartdieseaseException(e, sys) from e
 
 
-    def initiate_data_ingestion(self) ->DataIngestionArtifact:
+    def initiate_data_ingestion(self, watermark=None) ->DataIngestionArtifact:
         """
         Method Name :   initiate_data_ingestion
-        Description :   This method initiates the data ingestion components of training pipeline 
+        Description :   This method initiates the data ingestion components of training pipeline,
+                        incremental runs pass the watermark of the last pushed model to ingest only new records
         
         Output      :   train set and test set are returned as the artifacts of data ingestion components
         On Failure  :   Write an exception log and then raise an exception
@@ -86,10 +92,21 @@ class DataIngestion:
         logging.info("Entered initiate_data_ingestion method of Data_Ingestion class")
 
         try:
-            dataframe = self.export_data_into_feature_store()
+            dataframe = self.export_data_into_feature_store(watermark=watermark)
 
             logging.info("Got the data from mongodb")
 
+            watermark_column = self.data_ingestion_config.watermark_column
+            if watermark_column in dataframe.columns and not dataframe.empty:
+                watermark = pd.to_numeric(dataframe[watermark_column], errors="coerce").max().item()
+
+            if dataframe.empty and watermark is not None:
+                # no new records since the last pushed model, there is nothing to split
+                logging.info(f"No records after watermark {watermark}")
+                return DataIngestionArtifact(trained_file_path=self.data_ingestion_config.training_file_path,
+                                             test_file_path=self.data_ingestion_config.testing_file_path,
+                                             watermark=watermark, n_rows=0)
+
             self.split_data_as_train_test(dataframe)
 
             logging.info("Performed train test split on the dataset")
@@ -99,7 +116,7 @@ class DataIngestion:
             )
 
             data_ingestion_artifact = DataIngestionArtifact(trained_file_path=self.data_ingestion_config.training_file_path,
-            test_file_path=self.data_ingestion_config.testing_file_path)
+            test_file_path=self.data_ingestion_config.testing_file_path, watermark=watermark, n_rows=len(dataframe))
             
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
             return data_ingestion_artifact
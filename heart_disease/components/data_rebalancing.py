@@ -0,0 +1,118 @@
+import sys
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from imblearn.combine import SMOTEENN
+from imblearn.over_sampling import SMOTE, RandomOverSampler
+from imblearn.under_sampling import EditedNearestNeighbours, RandomUnderSampler
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils.class_weight import compute_sample_weight
+
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+REBALANCING_STRATEGIES = ("smoteenn", "smote", "random_over", "random_under", "class_weight", "none")
+
+
+class DataRebalancing:
+    """
+    Rebalances the transformed training set. Resampling strategies return new arrays, the class_weight
+    strategy leaves the rows untouched and returns balanced sample weights for the estimators instead.
+    The test set is never rebalanced.
+    """
+
+    def __init__(self, strategy: str = "smoteenn", k_neighbors: int = 2, neighbors_algorithm: str = "kd_tree",
+                 n_jobs: int = -1, random_state: Optional[int] = None):
+        """
+        :param strategy: one of REBALANCING_STRATEGIES
+        :param k_neighbors: neighbours used by SMOTE to synthesize samples
+        :param neighbors_algorithm: index used for the neighbour searches (kd_tree, ball_tree, auto or brute)
+        :param n_jobs: cores used by the neighbour searches, -1 uses every core
+        """
+        try:
+            if strategy not in REBALANCING_STRATEGIES:
+                raise Exception(f"Unknown rebalancing strategy '{strategy}', expected one of {REBALANCING_STRATEGIES}")
+            self.strategy = strategy
+            self.k_neighbors = k_neighbors
+            self.neighbors_algorithm = neighbors_algorithm
+            self.n_jobs = n_jobs
+            self.random_state = random_state
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_neighbors_estimator(self, n_neighbors: int) -> NearestNeighbors:
+        """
+        Tree-indexed neighbour search running on n_jobs cores, replaces the brute force default of imblearn.
+        n_neighbors includes the sample itself, as imblearn expects from a neighbours estimator
+        """
+        return NearestNeighbors(n_neighbors=n_neighbors, algorithm=self.neighbors_algorithm, n_jobs=self.n_jobs)
+
+    def get_resampler(self) -> Optional[object]:
+        """
+        Method Name :   get_resampler
+        Description :   This method creates the imblearn resampler of the configured strategy
+
+        Output      :   Resampler object, None for the class_weight and none strategies
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.strategy == "smoteenn":
+                return SMOTEENN(sampling_strategy="minority", random_state=self.random_state,
+                                smote=SMOTE(k_neighbors=self.get_neighbors_estimator(self.k_neighbors + 1),
+                                            random_state=self.random_state),
+                                enn=EditedNearestNeighbours(n_neighbors=self.get_neighbors_estimator(4)))
+            if self.strategy == "smote":
+                return SMOTE(sampling_strategy="minority", random_state=self.random_state,
+                             k_neighbors=self.get_neighbors_estimator(self.k_neighbors + 1))
+            if self.strategy == "random_over":
+                return RandomOverSampler(sampling_strategy="not majority", random_state=self.random_state)
+            if self.strategy == "random_under":
+                return RandomUnderSampler(sampling_strategy="not minority", random_state=self.random_state)
+            return None
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def rebalance(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], dict]:
+        """
+        Method Name :   rebalance
+        Description :   This method rebalances the training features and target with the configured strategy
+                        and measures the stage time (its memory is measured by the training benchmark)
+
+        Output      :   resampled features, resampled target, sample weights (class_weight strategy only) and report
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info(f"Entered rebalance method of DataRebalancing class with strategy [{self.strategy}]")
+
+        try:
+            y = np.asarray(y)
+            classes_before, counts_before = np.unique(y, return_counts=True)
+            sample_weight = None
+
+            start = time.perf_counter()
+
+            resampler = self.get_resampler()
+            if resampler is not None:
+                x, y = resampler.fit_resample(x, y)
+                y = np.asarray(y)
+            elif self.strategy == "class_weight":
+                sample_weight = compute_sample_weight(class_weight="balanced", y=y)
+
+            seconds = time.perf_counter() - start
+
+            classes_after, counts_after = np.unique(y, return_counts=True)
+            report = {
+                "strategy": self.strategy,
+                "neighbors_algorithm": self.neighbors_algorithm,
+                "n_jobs": self.n_jobs,
+                "rows_before": int(counts_before.sum()),
+                "rows_after": int(counts_after.sum()),
+                "class_counts_before": {str(label): int(count) for label, count in zip(classes_before, counts_before)},
+                "class_counts_after": {str(label): int(count) for label, count in zip(classes_after, counts_after)},
+                "seconds": float(seconds),
+            }
+            logging.info(f"Rebalancing report: {report}")
+            return x, y, sample_weight, report
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
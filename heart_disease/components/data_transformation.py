@@ -2,8 +2,6 @@ import sys
 
 import numpy as np
 import pandas as pd
-from imblearn.combine import SMOTEENN
-from imblearn.over_sampling import SMOTE
 
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, PowerTransformer
@@ -14,7 +12,9 @@ from heart_disease.entity.config_entity import DataTransformationConfig
 from heart_disease.entity.artifact_entity import DataTransformationArtifact, DataIngestionArtifact, DataValidationArtifact
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.utils.main_utils import save_object, save_numpy_array_data, read_yaml_file, drop_columns
+from heart_disease.components.data_rebalancing import DataRebalancing
+from heart_disease.utils.main_utils import save_object, save_numpy_array_data, read_yaml_file, write_yaml_file, \
+    prepare_features_and_target, split_calibration_rows
 from heart_disease.entity.estimator import TargetValueMapping
 
 class DataTransformation:
@@ -108,50 +108,26 @@ class DataTransformation:
                 train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path)
                 test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
 
-                input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
-                target_feature_train_df = train_df[TARGET_COLUMN]
-
-                logging.info("Got train features and test features of Training dataset")
-
-
-
-                # Drop unnecessary columns
-                drop_cols = self._schema_config['drop_columns']
-                logging.info("drop the columns in drop_cols of Training dataset")
-                input_feature_train_df = drop_columns(df=input_feature_train_df, cols = drop_cols)
-                
-
-
-                input_feature_test_df = test_df.drop(columns=[TARGET_COLUMN], axis=1)
-                target_feature_test_df = test_df[TARGET_COLUMN]
-
-
-
-
-                input_feature_test_df = drop_columns(df=input_feature_test_df, cols = drop_cols)
-                logging.info("drop the columns in drop_cols of Test dataset")
-     
-
                 # ================================
-                # Remove missing and duplicate rows (aligned with target)
+                # Drop unnecessary columns, remove missing and duplicate rows (aligned with target)
                 # ================================
-                logging.info("Removing missing values and duplicates (aligned with target)")
+                drop_cols = self._schema_config['drop_columns']
+                logging.info("Removing drop_cols, missing values and duplicates (aligned with target)")
 
-                # Combine -> drop -> split (TRAIN)
-                before_train = input_feature_train_df.shape[0]
-                train_combined = pd.concat([input_feature_train_df, target_feature_train_df], axis=1)
-                train_combined = train_combined.dropna().drop_duplicates()
-                input_feature_train_df = train_combined.drop(columns=[TARGET_COLUMN])
-                target_feature_train_df = train_combined[TARGET_COLUMN]
-                logging.info(f"Train cleaned: {before_train} -> {input_feature_train_df.shape[0]} rows")
+                input_feature_train_df, target_feature_train_df = prepare_features_and_target(
+                    df=train_df, target_column=TARGET_COLUMN, cols=drop_cols)
+                logging.info(f"Train cleaned: {train_df.shape[0]} -> {input_feature_train_df.shape[0]} rows")
 
-                # Combine -> drop -> split (TEST)
-                before_test = input_feature_test_df.shape[0]
-                test_combined = pd.concat([input_feature_test_df, target_feature_test_df], axis=1)
-                test_combined = test_combined.dropna().drop_duplicates()
-                input_feature_test_df = test_combined.drop(columns=[TARGET_COLUMN])
-                target_feature_test_df = test_combined[TARGET_COLUMN]
-                logging.info(f"Test cleaned: {before_test} -> {input_feature_test_df.shape[0]} rows")
+                # the risk calibrator is fitted on real rows the model was not trained on
+                input_feature_train_df, target_feature_train_df, input_feature_calibration_df, \
+                    target_feature_calibration_df = split_calibration_rows(
+                        input_feature_train_df, target_feature_train_df,
+                        ratio=self.data_transformation_config.calibration_split_ratio,
+                        random_state=self.data_transformation_config.random_state)
+
+                input_feature_test_df, target_feature_test_df = prepare_features_and_target(
+                    df=test_df, target_column=TARGET_COLUMN, cols=drop_cols)
+                logging.info(f"Test cleaned: {test_df.shape[0]} -> {input_feature_test_df.shape[0]} rows")
 
 
                 logging.info("Got train features and test features of Testing dataset")
@@ -164,23 +140,18 @@ class DataTransformation:
                 input_feature_test_arr = preprocessor.transform(input_feature_test_df)
                 logging.info("Used the preprocessor object to transform the test features")
 
-                logging.info("Applying SMOTEENN on Training dataset")
-
-                smt = SMOTEENN(sampling_strategy="minority",smote=SMOTE(k_neighbors=2))
-
-                input_feature_train_final, target_feature_train_final = smt.fit_resample(
-                    input_feature_train_arr, target_feature_train_df
-                )
-
-                logging.info("Applied SMOTEENN on training dataset")
-
-                logging.info("Applying SMOTEENN on testing dataset")
-
-                input_feature_test_final, target_feature_test_final = smt.fit_resample(
-                    input_feature_test_arr, target_feature_test_df
-                )
+                # ================================
+                # Rebalance the training set only, the test set keeps the real class distribution
+                # ================================
+                rebalancing = DataRebalancing(strategy=self.data_transformation_config.rebalancing_strategy,
+                                              k_neighbors=self.data_transformation_config.smote_k_neighbors,
+                                              neighbors_algorithm=self.data_transformation_config.neighbors_algorithm,
+                                              n_jobs=self.data_transformation_config.rebalancing_n_jobs,
+                                              random_state=self.data_transformation_config.random_state)
+                input_feature_train_final, target_feature_train_final, train_sample_weight, rebalancing_report = \
+                    rebalancing.rebalance(input_feature_train_arr, target_feature_train_df)
 
-                logging.info("Applied SMOTEENN on testing dataset")
+                logging.info(f"Applied {rebalancing.strategy} rebalancing on training dataset")
 
                 logging.info("Created train array and test array")
 
@@ -189,13 +160,26 @@ class DataTransformation:
                 ]
 
                 test_arr = np.c_[
-                    input_feature_test_final, np.array(target_feature_test_final)
+                    input_feature_test_arr, np.array(target_feature_test_df)
                 ]
 
                 save_object(self.data_transformation_config.transformed_object_file_path, preprocessor)
                 save_numpy_array_data(self.data_transformation_config.transformed_train_file_path, array=train_arr)
                 save_numpy_array_data(self.data_transformation_config.transformed_test_file_path, array=test_arr)
 
+                calibration_file_path = None
+                if input_feature_calibration_df is not None:
+                    calibration_file_path = self.data_transformation_config.transformed_calibration_file_path
+                    save_numpy_array_data(calibration_file_path, array=np.c_[
+                        preprocessor.transform(input_feature_calibration_df), np.array(target_feature_calibration_df)])
+                write_yaml_file(file_path=self.data_transformation_config.rebalancing_report_file_path,
+                                content=rebalancing_report)
+
+                sample_weight_file_path = None
+                if train_sample_weight is not None:
+                    sample_weight_file_path = self.data_transformation_config.transformed_train_sample_weight_file_path
+                    save_numpy_array_data(sample_weight_file_path, array=train_sample_weight)
+
                 logging.info("Saved the preprocessor object")
 
                 logging.info(
@@ -205,7 +189,10 @@ class DataTransformation:
                 data_transformation_artifact = DataTransformationArtifact(
                     transformed_object_file_path=self.data_transformation_config.transformed_object_file_path,
                     transformed_train_file_path=self.data_transformation_config.transformed_train_file_path,
-                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path
+                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path,
+                    rebalancing_report_file_path=self.data_transformation_config.rebalancing_report_file_path,
+                    transformed_train_sample_weight_file_path=sample_weight_file_path,
+                    transformed_calibration_file_path=calibration_file_path
                 )
                 return data_transformation_artifact
             else:
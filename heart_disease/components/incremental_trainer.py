@@ -0,0 +1,248 @@
+import hashlib
+import json
+import sys
+import time
+from dataclasses import replace
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import f1_score, precision_score, recall_score
+
+from heart_disease.components.data_rebalancing import DataRebalancing
+from heart_disease.components.model_trainer import ModelTrainer
+from heart_disease.constants import TARGET_COLUMN, SCHEMA_FILE_PATH
+from heart_disease.entity.artifact_entity import (ClassificationMetricArtifact, DataIngestionArtifact,
+                                                  DataValidationArtifact, IncrementalTrainingArtifact,
+                                                  ModelTrainerArtifact)
+from heart_disease.entity.config_entity import IncrementalTrainingConfig, ModelTrainerConfig
+from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import (read_yaml_file, write_yaml_file, save_object, prepare_features_and_target,
+                                            split_calibration_rows)
+
+# ColumnTransformer steps of DataTransformation whose output is standardized (zero mean, unit variance on the
+# data the preprocessor was fitted on)
+STANDARDIZED_TRANSFORMERS = ("Transformer", "StandardScaler")
+
+
+def get_schema_hash(schema_config: dict) -> str:
+    """
+    Fingerprint of the schema, a model can only be warm-started on data with the schema it was trained on
+    """
+    return hashlib.sha256(json.dumps(schema_config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class IncrementalTrainer:
+    """
+    Continues boosting the production model on the records ingested since its training run: the fitted
+    preprocessor is reused when the new records did not drift, CatBoost resumes from init_model and XGBoost
+    from xgb_model. Anything that prevents a warm start (schema change, unknown categories, drift, a model
+    without warm start) is reported as requiring a full retrain.
+    """
+
+    def __init__(self, incremental_training_config: IncrementalTrainingConfig,
+                 data_ingestion_artifact: DataIngestionArtifact, data_validation_artifact: DataValidationArtifact,
+                 model_trainer_config: ModelTrainerConfig, production_model: HeartDiseaseModel,
+                 training_state: dict):
+        """
+        :param production_model: model currently in the registry
+        :param training_state: watermark and schema hash published with the production model
+        """
+        try:
+            self.incremental_training_config = incremental_training_config
+            self.data_ingestion_artifact = data_ingestion_artifact
+            self.data_validation_artifact = data_validation_artifact
+            self.model_trainer_config = model_trainer_config
+            self.production_model = production_model
+            self.training_state = training_state
+            self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_drift_report(self, preprocessor, x: pd.DataFrame) -> dict:
+        """
+        Method Name :   get_drift_report
+        Description :   This method measures the drift of the new records against the data the preprocessor was
+                        fitted on: for every standardized feature the absolute mean of the transformed new
+                        records, in standard deviations of the fitted data
+
+        Output      :   Returns dict with the mean shift per feature and the largest one
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            transformed = np.asarray(preprocessor.transform(x), dtype=float)
+            columns = dict((name, columns) for name, _, columns in preprocessor.transformers_)
+            mean_shift = {}
+            for name in STANDARDIZED_TRANSFORMERS:
+                block = transformed[:, preprocessor.output_indices_[name]]
+                for column, shift in zip(columns[name], np.abs(block.mean(axis=0))):
+                    mean_shift[f"{name}.{column}"] = float(shift)
+            return {"mean_shift": mean_shift, "max_mean_shift": max(mean_shift.values(), default=0.0)}
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def continue_training(self, model_obj: object, x: np.ndarray, y: np.ndarray,
+                          sample_weight: Optional[np.ndarray] = None) -> object:
+        """
+        Method Name :   continue_training
+        Description :   This method fits a copy of the production model that starts from its trees and adds
+                        `iterations` boosting rounds fitted on the new records only. A class of the production
+                        model missing from the new records gets a zero weight row, both libraries otherwise fit
+                        fewer class dimensions than the trees they start from
+
+        Output      :   Returns the warm-started model
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            model_name = model_obj.__class__.__name__
+            params = model_obj.get_params()
+            iterations = self.incremental_training_config.iterations
+            missing_classes = np.setdiff1d(getattr(model_obj, "classes_", np.unique(y)), y)
+            if len(missing_classes):
+                logging.info(f"Classes {missing_classes.tolist()} are not in the new records, adding zero weight rows")
+                if sample_weight is None:
+                    sample_weight = np.ones(len(y))
+                # copies of existing rows, so the quantization borders do not move
+                x = np.r_[x, x[np.arange(len(missing_classes)) % len(x)]]
+                y = np.r_[y, missing_classes.astype(y.dtype)]
+                sample_weight = np.r_[sample_weight, np.zeros(len(missing_classes))]
+            if model_name == "CatBoostClassifier":
+                params.pop("n_estimators", None)
+                model = model_obj.__class__(**{**params, "iterations": iterations,
+                                               "class_names": list(model_obj.classes_)})
+                model.fit(x, y, sample_weight=sample_weight, init_model=model_obj)
+            elif model_name == "XGBClassifier":
+                model = model_obj.__class__(**{**params, "n_estimators": iterations})
+                model.fit(x, y, sample_weight=sample_weight, xgb_model=model_obj.get_booster())
+            else:
+                raise Exception(f"{model_name} does not support warm starts")
+            return model
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_full_retrain_reason(self, preprocessor, x_train: pd.DataFrame) -> Tuple[Optional[str], dict]:
+        """
+        Returns why the production model cannot be warm-started on x_train (None when it can) and the drift report
+        """
+        if self.training_state.get("schema_hash") != get_schema_hash(self._schema_config):
+            return "schema changed since the production model was trained", {}
+        if not self.data_validation_artifact.validation_status:
+            return f"data validation failed: {self.data_validation_artifact.message}", {}
+
+        expected_columns = list(getattr(preprocessor, "feature_names_in_", x_train.columns))
+        if sorted(expected_columns) != sorted(x_train.columns):
+            return f"feature columns changed: {sorted(x_train.columns)} != {sorted(expected_columns)}", {}
+
+        try:
+            drift_report = self.get_drift_report(preprocessor, x_train)
+        except Exception as e:
+            # e.g. categories the fitted encoders have never seen
+            return f"the fitted preprocessor cannot transform the new records: {e}", {}
+        if drift_report["max_mean_shift"] > self.incremental_training_config.drift_threshold:
+            return (f"drift {drift_report['max_mean_shift']:.3f} above threshold "
+                    f"{self.incremental_training_config.drift_threshold}"), drift_report
+        return None, drift_report
+
+    def initiate_incremental_training(self) -> IncrementalTrainingArtifact:
+        """
+        Method Name :   initiate_incremental_training
+        Description :   This method warm-starts the production model on the ingested new records, reusing its
+                        preprocessor, and saves it as the trained model of the run
+
+        Output      :   Returns incremental training artifact, with the model trainer artifact when the model
+                        was warm-started or the reason why a full retrain is required
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered initiate_incremental_training method of IncrementalTrainer class")
+        try:
+            start = time.perf_counter()
+            drop_cols = self._schema_config['drop_columns']
+            x_train, y_train = prepare_features_and_target(df=pd.read_csv(self.data_ingestion_artifact.trained_file_path),
+                                                           target_column=TARGET_COLUMN, cols=drop_cols)
+            x_test, y_test = prepare_features_and_target(df=pd.read_csv(self.data_ingestion_artifact.test_file_path),
+                                                         target_column=TARGET_COLUMN, cols=drop_cols)
+
+            preprocessor = self.production_model.preprocessing_object
+            reason, drift_report = self.get_full_retrain_reason(preprocessor, x_train)
+            report = {"rows": int(len(x_train) + len(x_test)), "drift": drift_report,
+                      "base_model": repr(self.production_model),
+                      "base_watermark": self.training_state.get("watermark"),
+                      "watermark": self.data_ingestion_artifact.watermark}
+
+            model_trainer_artifact = None
+            if reason is None:
+                # the risk calibrator is fitted on new rows the model is not trained on
+                x_train, y_train, x_calibration, y_calibration = split_calibration_rows(
+                    x_train, y_train, ratio=self.incremental_training_config.calibration_split_ratio,
+                    random_state=self.incremental_training_config.random_state)
+                x_train_arr = preprocessor.transform(x_train)
+                x_test_arr = preprocessor.transform(x_test)
+                rebalancing = DataRebalancing(strategy=self.incremental_training_config.rebalancing_strategy,
+                                              random_state=self.incremental_training_config.random_state)
+                x_train_arr, y_train_arr, sample_weight, report["rebalancing"] = rebalancing.rebalance(
+                    x_train_arr, y_train)
+                try:
+                    # full training fits on the float target column of the transformed train array
+                    model_obj = self.continue_training(self.production_model.trained_model_object,
+                                                       x_train_arr, np.asarray(y_train_arr, dtype=float),
+                                                       sample_weight)
+                except Exception as e:
+                    logging.warning(f"Warm start of {self.production_model.trained_model_object.__class__.__name__}"
+                                    f" failed, a full retrain is required: {e}")
+                    reason = f"warm start failed: {e}"
+
+            if reason is None:
+                y_pred = np.asarray(model_obj.predict(x_test_arr)).ravel()
+                metric_artifact = ClassificationMetricArtifact(
+                    f1_score=f1_score(y_test, y_pred, average='weighted'),
+                    precision_score=precision_score(y_test, y_pred, average='weighted', zero_division=0),
+                    recall_score=recall_score(y_test, y_pred, average='weighted', zero_division=0))
+
+                risk_calibrator = getattr(self.production_model, "risk_calibrator", None)
+                if self.model_trainer_config.calibrate_risk_score and x_calibration is not None:
+                    model_trainer = ModelTrainer(data_transformation_artifact=None,
+                                                 model_trainer_config=self.model_trainer_config)
+                    risk_calibrator = model_trainer.get_risk_calibrator(
+                        model_obj=model_obj, x_calibration=preprocessor.transform(x_calibration),
+                        y_calibration=np.asarray(y_calibration))
+
+                heartdiseases_model = HeartDiseaseModel(preprocessing_object=preprocessor,
+                                                        trained_model_object=model_obj,
+                                                        risk_calibrator=risk_calibrator)
+                save_object(self.incremental_training_config.trained_model_file_path, heartdiseases_model)
+
+                # the NumPy variant is rebuilt from the warm-started trees, the compact one needs a full retrain
+                numpy_model_file_path = None
+                if self.model_trainer_config.export_numpy_model:
+                    model_trainer = ModelTrainer(data_transformation_artifact=None, model_trainer_config=replace(
+                        self.model_trainer_config,
+                        catboost_json_file_path=self.incremental_training_config.catboost_json_file_path))
+                    numpy_model_obj = model_trainer.get_numpy_model_object(model_obj=model_obj, x_test=x_test_arr)
+                    if numpy_model_obj is not None:
+                        numpy_model_file_path = self.incremental_training_config.numpy_model_file_path
+                        save_object(numpy_model_file_path,
+                                    HeartDiseaseModel(preprocessing_object=preprocessor,
+                                                      trained_model_object=numpy_model_obj,
+                                                      risk_calibrator=risk_calibrator))
+                model_trainer_artifact = ModelTrainerArtifact(
+                    trained_model_file_path=self.incremental_training_config.trained_model_file_path,
+                    metric_artifact=metric_artifact, numpy_model_file_path=numpy_model_file_path)
+                report["f1_score"] = float(metric_artifact.f1_score)
+                logging.info(f"Warm-started {model_obj.__class__.__name__} on {report['rows']} new rows")
+            else:
+                logging.info(f"Full retrain required: {reason}")
+
+            report.update({"is_full_retrain_required": reason is not None, "reason": reason or "",
+                           "seconds": time.perf_counter() - start})
+            write_yaml_file(file_path=self.incremental_training_config.report_file_path, content=report)
+
+            incremental_training_artifact = IncrementalTrainingArtifact(
+                is_full_retrain_required=reason is not None, reason=reason or "",
+                report_file_path=self.incremental_training_config.report_file_path,
+                model_trainer_artifact=model_trainer_artifact)
+            logging.info(f"Incremental training artifact: {incremental_training_artifact}")
+            return incremental_training_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
@@ -0,0 +1,193 @@
+import sys
+from dataclasses import asdict
+from typing import List, Tuple
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+from heart_disease.components.model_profiler import ModelProfiler
+from heart_disease.components.model_trainer import ModelTrainer
+from heart_disease.entity.artifact_entity import (DataTransformationArtifact, ModelCompactionArtifact,
+                                                  ModelTrainerArtifact)
+from heart_disease.entity.config_entity import ModelCompactionConfig, ModelTrainerConfig
+from heart_disease.entity.estimator import DistilledClassifier, HeartDiseaseModel
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import load_numpy_array_data, load_object, save_object, write_yaml_file
+
+COMPACTION_METHODS = ("truncation", "distillation", "both")
+
+
+def get_tree_count(model_obj: object) -> int:
+    if model_obj.__class__.__name__ == "CatBoostClassifier":
+        return int(model_obj.tree_count_)
+    if model_obj.__class__.__name__ == "XGBClassifier":
+        return int(model_obj.get_booster().num_boosted_rounds())
+    return 0
+
+
+def truncate_model(model_obj: object, n_trees: int) -> object:
+    """
+    Copy of a boosted model keeping its first n_trees boosting rounds
+    """
+    model_name = model_obj.__class__.__name__
+    if model_name == "CatBoostClassifier":
+        model = model_obj.copy()
+        model.shrink(ntree_end=n_trees)
+        return model
+    if model_name == "XGBClassifier":
+        model = model_obj.__class__(**{**model_obj.get_params(), "n_estimators": n_trees})
+        model.load_model(bytearray(model_obj.get_booster()[:n_trees].save_raw("ubj")))
+        return model
+    raise Exception(f"{model_name} cannot be truncated")
+
+
+class ModelCompaction:
+    """
+    Builds a compact serving variant of the trained model for weak CPUs: the trained model truncated to its first
+    trees and / or a shallow CatBoost student distilled from its probabilities. The smallest candidate whose test
+    F1 is within max_f1_loss of the trained model is kept, every candidate is reported with its latency gain.
+    """
+
+    def __init__(self, model_compaction_config: ModelCompactionConfig,
+                 data_transformation_artifact: DataTransformationArtifact,
+                 model_trainer_artifact: ModelTrainerArtifact,
+                 model_trainer_config: ModelTrainerConfig = ModelTrainerConfig()):
+        """
+        :param model_compaction_config: Configuration for model compaction
+        :param data_transformation_artifact: transformed train and test arrays of the trained model
+        :param model_trainer_artifact: Output reference of model trainer artifact stage
+        :param model_trainer_config: latency measurement and risk calibration settings of the trained model
+        """
+        try:
+            if model_compaction_config.method not in COMPACTION_METHODS:
+                raise ValueError(f"Unknown compaction method {model_compaction_config.method}, "
+                                 f"expected one of {COMPACTION_METHODS}")
+            self.model_compaction_config = model_compaction_config
+            self.data_transformation_artifact = data_transformation_artifact
+            self.model_trainer_artifact = model_trainer_artifact
+            self.model_trainer_config = model_trainer_config
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_truncated_models(self, model_obj: object) -> List[Tuple[str, object]]:
+        n_trees = get_tree_count(model_obj)
+        if n_trees == 0:
+            logging.info(f"{model_obj.__class__.__name__} is not a boosted tree model, skipping truncation")
+            return []
+        tree_counts = sorted({max(1, int(round(n_trees * fraction)))
+                              for fraction in self.model_compaction_config.tree_fractions} - {n_trees})
+        return [(f"truncation_{count}_of_{n_trees}_trees", truncate_model(model_obj, count)) for count in tree_counts]
+
+    def get_student_model(self, model_obj: object, x_train: np.ndarray) -> DistilledClassifier:
+        """
+        Method Name :   get_student_model
+        Description :   This method fits a shallow CatBoost MultiRMSE regressor on the centered log-probabilities
+                        of the trained model on the training rows
+
+        Output      :   Returns the distilled student
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            from catboost import CatBoostRegressor
+
+            probabilities = np.asarray(model_obj.predict_proba(x_train))
+            logits = np.log(np.clip(probabilities, 1e-7, 1.0))
+            logits -= logits.mean(axis=1, keepdims=True)
+            regressor = CatBoostRegressor(loss_function="MultiRMSE",
+                                          depth=self.model_compaction_config.student_depth,
+                                          iterations=self.model_compaction_config.student_iterations,
+                                          learning_rate=self.model_compaction_config.student_learning_rate,
+                                          random_seed=self.model_compaction_config.random_state, verbose=0)
+            regressor.fit(x_train, logits)
+            classes = getattr(model_obj, "classes_", np.arange(probabilities.shape[1]))
+            return DistilledClassifier(regressor=regressor, classes=classes)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def initiate_model_compaction(self) -> ModelCompactionArtifact:
+        """
+        Method Name :   initiate_model_compaction
+        Description :   This method builds the compact candidates of the trained model, scores and profiles them
+                        on the test set and saves the smallest one within the accepted F1 loss, with the
+                        preprocessor of the trained model and a risk calibrator fitted for it
+
+        Output      :   Returns model compaction artifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered initiate_model_compaction method of ModelCompaction class")
+        try:
+            train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
+            test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
+            x_train, x_test, y_test = train_arr[:, :-1], test_arr[:, :-1], test_arr[:, -1].astype(int)
+            trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
+            model_obj = trained_model.trained_model_object
+
+            candidates = []
+            if self.model_compaction_config.method in ("truncation", "both"):
+                candidates += self.get_truncated_models(model_obj)
+            if self.model_compaction_config.method in ("distillation", "both"):
+                candidates.append(("distillation", self.get_student_model(model_obj, x_train)))
+
+            model_profiler = ModelProfiler(model_trainer_config=self.model_trainer_config)
+
+            def get_f1(model) -> float:
+                return float(f1_score(y_test, np.asarray(model.predict(x_test)).ravel().astype(int),
+                                      average="weighted"))
+
+            full_f1 = get_f1(model_obj)
+            full_profile = model_profiler.profile(model_obj, x_test)
+            report = {"method": self.model_compaction_config.method,
+                      "max_f1_loss": self.model_compaction_config.max_f1_loss,
+                      "full_model": {"model": repr(trained_model), "trees": get_tree_count(model_obj),
+                                     "f1_score": full_f1, **asdict(full_profile)},
+                      "candidates": []}
+
+            for name, candidate in candidates:
+                profile = model_profiler.profile(candidate, x_test)
+                f1 = get_f1(candidate)
+                report["candidates"].append({
+                    "name": name, "f1_score": f1, "f1_loss": full_f1 - f1, **asdict(profile),
+                    "single_row_latency_gain": full_profile.single_row_p50_ms / profile.single_row_p50_ms,
+                    "batch_latency_gain": full_profile.batch_p50_ms / profile.batch_p50_ms,
+                    "size_ratio": profile.serialized_size_bytes / full_profile.serialized_size_bytes})
+
+            # the serialized size follows the number of tree evaluations and does not vary between runs
+            accepted = [i for i, candidate_report in enumerate(report["candidates"])
+                        if candidate_report["f1_loss"] <= self.model_compaction_config.max_f1_loss and
+                        candidate_report["serialized_size_bytes"] < full_profile.serialized_size_bytes]
+            if not accepted:
+                report["selected"] = None
+                write_yaml_file(file_path=self.model_compaction_config.report_file_path, content=report)
+                logging.info(f"No compact model within {self.model_compaction_config.max_f1_loss} F1 loss")
+                return ModelCompactionArtifact(is_compact_model_created=False, method="",
+                                               report_file_path=self.model_compaction_config.report_file_path)
+
+            selected = min(accepted, key=lambda i: report["candidates"][i]["serialized_size_bytes"])
+            name, compact_model_obj = candidates[selected]
+            report["selected"] = name
+
+            risk_calibrator = None
+            if getattr(trained_model, "risk_calibrator", None) is not None:
+                # the calibrator of the trained model was fitted on these rows too
+                calibration_arr = load_numpy_array_data(
+                    file_path=self.data_transformation_artifact.transformed_calibration_file_path)
+                model_trainer = ModelTrainer(data_transformation_artifact=None,
+                                             model_trainer_config=self.model_trainer_config)
+                risk_calibrator = model_trainer.get_risk_calibrator(model_obj=compact_model_obj,
+                                                                    x_calibration=calibration_arr[:, :-1],
+                                                                    y_calibration=calibration_arr[:, -1])
+            compact_model = HeartDiseaseModel(preprocessing_object=trained_model.preprocessing_object,
+                                              trained_model_object=compact_model_obj,
+                                              risk_calibrator=risk_calibrator)
+            save_object(self.model_compaction_config.compact_model_file_path, compact_model)
+            write_yaml_file(file_path=self.model_compaction_config.report_file_path, content=report)
+
+            model_compaction_artifact = ModelCompactionArtifact(
+                is_compact_model_created=True, method=name,
+                report_file_path=self.model_compaction_config.report_file_path,
+                compact_model_file_path=self.model_compaction_config.compact_model_file_path)
+            logging.info(f"Model compaction artifact: {model_compaction_artifact}, {report['candidates'][selected]}")
+            return model_compaction_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
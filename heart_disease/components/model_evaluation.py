@@ -1,16 +1,19 @@
 from heart_disease.entity.config_entity import ModelEvaluationConfig
 from heart_disease.entity.artifact_entity import ModelTrainerArtifact, DataIngestionArtifact, ModelEvaluationArtifact
-from sklearn.metrics import f1_score
 from heart_disease.exception import HeartdieseaseException
-from heart_disease.constants import TARGET_COLUMN, CURRENT_YEAR
+from heart_disease.constants import TARGET_COLUMN, SCHEMA_FILE_PATH
 from heart_disease.logger import logging
+from heart_disease.utils.main_utils import load_object, read_yaml_file, write_yaml_file, prepare_features_and_target
+from heart_disease.utils.evaluation_utils import (encode_labels, confusion_matrices, metrics_from_confusion_matrices,
+                                                  weighted_roc_auc, bootstrap_confidence_intervals)
 import sys
+import numpy as np
 import pandas as pd
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from heart_disease.entity.blob_estimator import HeartDieseaseEstimator
 from dataclasses import dataclass
 from heart_disease.entity.estimator import HeartDiseaseModel
-from heart_disease.entity.estimator import TargetValueMapping
 
 @dataclass
 class EvaluateModelResponse:
@@ -18,6 +21,8 @@ class EvaluateModelResponse:
     best_model_f1_score: float
     is_model_accepted: bool
     difference: float
+    trained_model_report: dict
+    best_model_report: Optional[dict]
 
 
 class ModelEvaluation:
@@ -28,6 +33,7 @@ class ModelEvaluation:
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
@@ -51,38 +57,102 @@ class ModelEvaluation:
         except Exception as e:
             raise  HeartdieseaseException(e,sys)
 
+    def get_test_data(self) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Method Name :   get_test_data
+        Description :   This function reads the ingested test set and applies the same drop_columns,
+                        missing value and duplicate removal as data transformation. It is not resampled,
+                        so the trained and the production model are scored on identical rows
+
+        Output      :   Returns input features and target of the test set
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            return prepare_features_and_target(df=test_df, target_column=TARGET_COLUMN,
+                                               cols=self._schema_config['drop_columns'])
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_model_report(self, model: HeartDiseaseModel, x: pd.DataFrame, y: pd.Series) -> dict:
+        """
+        Method Name :   get_model_report
+        Description :   This function scores a model with one predict_proba pass and derives the confusion matrix,
+                        weighted f1 / precision / recall, roc auc and bootstrap confidence intervals from it
+
+        Output      :   Returns dict with the metrics of the model
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            scores_df = model.predict_with_scores(x)
+            probability_columns = [column for column in scores_df.columns if column.startswith("probability_")]
+            model_classes = np.array([int(column.replace("probability_", "")) for column in probability_columns])
+
+            labels = np.union1d(np.asarray(y).astype(int), model_classes)
+            n_classes = len(labels)
+            y_true = encode_labels(y, labels)
+            y_pred = encode_labels(scores_df["prediction"], labels)
+
+            probabilities = np.zeros((len(scores_df), n_classes))
+            probabilities[:, encode_labels(model_classes, labels)] = scores_df[probability_columns].to_numpy()
+
+            confusion_matrix = confusion_matrices(y_true, y_pred, n_classes)
+            report = metrics_from_confusion_matrices(confusion_matrix)
+            report["roc_auc"] = weighted_roc_auc(y_true, probabilities, n_classes)
+            report["labels"] = labels.tolist()
+            report["confusion_matrix"] = confusion_matrix.tolist()
+            report["confidence_intervals"] = bootstrap_confidence_intervals(
+                y_true, y_pred, n_classes,
+                n_rounds=self.model_eval_config.bootstrap_rounds,
+                confidence_level=self.model_eval_config.confidence_level,
+                n_jobs=self.model_eval_config.n_jobs)
+            return report
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_trained_model_report(self, x: pd.DataFrame, y: pd.Series) -> dict:
+        trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
+        return self.get_model_report(trained_model, x, y)
+
+    def get_best_model_report(self, x: pd.DataFrame, y: pd.Series) -> Optional[dict]:
+        best_model = self.get_best_model()
+        if best_model is None:
+            return None
+        return self.get_model_report(best_model.load_model(), x, y)
+
     def evaluate_model(self) -> EvaluateModelResponse:
         """
         Method Name :   evaluate_model
         Description :   This function is used to evaluate trained model 
-                        with production model and choose best model 
+                        with production model and choose best model.
+                        Both models are scored concurrently on the same cleaned test set
         
         Output      :   Returns bool value based on validation results
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            # test_df['company_age'] = CURRENT_YEAR-test_df['yr_of_estab']
+            x, y = self.get_test_data()
 
-            x, y = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
-            # y = y.replace(
-            #     TargetValueMapping()._asdict()
-            # )
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                trained_future = executor.submit(self.get_trained_model_report, x, y)
+                best_future = executor.submit(self.get_best_model_report, x, y)
+                trained_model_report = trained_future.result()
+                best_model_report = best_future.result()
 
-            # trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
-            trained_model_f1_score = self.model_trainer_artifact.metric_artifact.f1_score
+            trained_model_f1_score = trained_model_report["f1"]
+            best_model_f1_score = None if best_model_report is None else best_model_report["f1"]
+
+            write_yaml_file(file_path=self.model_eval_config.evaluation_report_file_path,
+                            content={"trained_model": trained_model_report, "best_model": best_model_report})
 
-            best_model_f1_score=None
-            best_model = self.get_best_model()
-            if best_model is not None:
-                y_hat_best_model = best_model.predict(x)
-                best_model_f1_score = f1_score(y, y_hat_best_model)
-            
             tmp_best_model_score = 0 if best_model_f1_score is None else best_model_f1_score
             result = EvaluateModelResponse(trained_model_f1_score=trained_model_f1_score,
                                            best_model_f1_score=best_model_f1_score,
                                            is_model_accepted=trained_model_f1_score > tmp_best_model_score,
-                                           difference=trained_model_f1_score - tmp_best_model_score
+                                           difference=trained_model_f1_score - tmp_best_model_score,
+                                           trained_model_report=trained_model_report,
+                                           best_model_report=best_model_report
                                            )
             logging.info(f"Result: {result}")
             return result
@@ -105,7 +175,8 @@ class ModelEvaluation:
                 is_model_accepted=evaluate_model_response.is_model_accepted,
                 blob_model_path=self.model_eval_config.blob_model_key_path,  # ✅ fixed name
                 trained_model_path=self.model_trainer_artifact.trained_model_file_path,
-                changed_accuracy=evaluate_model_response.difference
+                changed_accuracy=evaluate_model_response.difference,
+                evaluation_report_file_path=self.model_eval_config.evaluation_report_file_path
             )
 
             logging.info(f"Model evaluation artifact: {model_evaluation_artifact}")
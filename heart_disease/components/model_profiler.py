@@ -0,0 +1,123 @@
+import pickle
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from heart_disease.entity.artifact_entity import ModelProfileArtifact
+from heart_disease.entity.config_entity import ModelTrainerConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+SELECTION_RULES = ("score", "latency_budget", "score_tolerance")
+
+
+class ModelProfiler:
+    """
+    Measures what a candidate model costs to serve (single-row and batch predict_proba latency, pickled size)
+    and picks one candidate on the Pareto front of cross-validated score, p99 single-row latency and size by the
+    selection rule of the model trainer config. The test set plays no part in the choice
+    """
+
+    def __init__(self, model_trainer_config: ModelTrainerConfig):
+        """
+        :param model_trainer_config: selection rule, budgets and number of measured calls
+        """
+        try:
+            if model_trainer_config.selection_rule not in SELECTION_RULES:
+                raise ValueError(f"Unknown model selection rule {model_trainer_config.selection_rule}, "
+                                 f"expected one of {SELECTION_RULES}")
+            self.model_trainer_config = model_trainer_config
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def time_calls(func, inputs: List[np.ndarray], n_calls: int, warmup_calls: int = 5) -> np.ndarray:
+        for i in range(warmup_calls):
+            func(inputs[i % len(inputs)])
+        latencies = np.empty(n_calls)
+        for i in range(n_calls):
+            start = time.perf_counter()
+            func(inputs[i % len(inputs)])
+            latencies[i] = time.perf_counter() - start
+        return latencies * 1000
+
+    def profile(self, model_obj: object, x: np.ndarray) -> ModelProfileArtifact:
+        """
+        Method Name :   profile
+        Description :   This method measures the p50 / p99 predict_proba latency of model_obj on single rows and on
+                        batches of batch_size rows drawn from x, and its pickled size
+
+        Output      :   Returns model profile artifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            rows = [x[i:i + 1] for i in range(min(len(x), self.model_trainer_config.latency_calls))]
+            single_row = self.time_calls(model_obj.predict_proba, rows, self.model_trainer_config.latency_calls)
+
+            batch_size = self.model_trainer_config.batch_size
+            batch = x[np.arange(batch_size) % len(x)]
+            batches = self.time_calls(model_obj.predict_proba, [batch], self.model_trainer_config.batch_calls,
+                                      warmup_calls=1)
+
+            return ModelProfileArtifact(single_row_p50_ms=float(np.percentile(single_row, 50)),
+                                        single_row_p99_ms=float(np.percentile(single_row, 99)),
+                                        batch_p50_ms=float(np.percentile(batches, 50)),
+                                        batch_p99_ms=float(np.percentile(batches, 99)),
+                                        batch_size=batch_size,
+                                        serialized_size_bytes=len(pickle.dumps(model_obj)))
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    @staticmethod
+    def get_pareto_front(candidate_reports: List[dict]) -> List[int]:
+        """
+        Returns the positions of the candidates no other candidate beats on cross-validated score, p99 latency and
+        size at once
+        """
+        objectives = [(-report["cv_score"], report["single_row_p99_ms"], report["serialized_size_bytes"])
+                      for report in candidate_reports]
+        front = []
+        for i, objective in enumerate(objectives):
+            dominated = any(all(a <= b for a, b in zip(other, objective)) and other != objective
+                            for other in objectives)
+            if not dominated:
+                front.append(i)
+        return front
+
+    def select(self, candidate_reports: List[dict]) -> int:
+        """
+        Method Name :   select
+        Description :   This method picks a candidate by the selection rule, among the Pareto optimal ones.
+                        candidate_reports are ordered by cross-validated score, best first
+
+        Output      :   Returns the position of the chosen candidate
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.model_trainer_config
+            if config.selection_rule == "score":
+                return 0
+
+            front = self.get_pareto_front(candidate_reports)
+
+            def latency(i: int) -> tuple:
+                return candidate_reports[i]["single_row_p99_ms"], candidate_reports[i]["serialized_size_bytes"]
+
+            if config.selection_rule == "latency_budget":
+                within_budget = [i for i in front
+                                 if candidate_reports[i]["single_row_p99_ms"] <= config.latency_budget_ms and
+                                 candidate_reports[i]["serialized_size_bytes"] <= config.size_budget_mb * 1024 * 1024]
+                if not within_budget:
+                    logging.warning(f"No candidate within {config.latency_budget_ms} ms and {config.size_budget_mb} MB,"
+                                    f" choosing the fastest one")
+                    return min(front, key=latency)
+                return max(within_budget, key=lambda i: (candidate_reports[i]["cv_score"],
+                                                         -candidate_reports[i]["single_row_p99_ms"]))
+
+            best_score = max(candidate_reports[i]["cv_score"] for i in front)
+            return min((i for i in front if candidate_reports[i]["cv_score"] >= best_score - config.score_tolerance),
+                       key=latency)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
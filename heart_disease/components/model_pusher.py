@@ -1,25 +1,38 @@
 import sys
+from typing import Optional
 
 from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.entity.artifact_entity import ModelPusherArtifact, ModelEvaluationArtifact
+from heart_disease.entity.artifact_entity import (ModelPusherArtifact, ModelEvaluationArtifact, ModelCompactionArtifact,
+                                                  ModelTrainerArtifact)
 from heart_disease.entity.config_entity import ModelPusherConfig
 from heart_disease.entity.blob_estimator import HeartDieseaseEstimator
 
 
 class ModelPusher:
     def __init__(self, model_evaluation_artifact: ModelEvaluationArtifact,
-                 model_pusher_config: ModelPusherConfig):
+                 model_pusher_config: ModelPusherConfig,
+                 model_compaction_artifact: Optional[ModelCompactionArtifact] = None,
+                 model_trainer_artifact: Optional[ModelTrainerArtifact] = None,
+                 blob_storage: Optional[SimpleStorageService] = None):
         """
         :param model_evaluation_artifact: Output reference of data evaluation artifact stage
         :param model_pusher_config: Configuration for model pusher
+        :param model_compaction_artifact: compact serving variant of the model, pushed next to it when created and
+        removed from the registry otherwise
+        :param model_trainer_artifact: NumPy serving variant of the model, pushed next to it when created and removed
+        from the registry otherwise
+        :param blob_storage: storage service of the registry, defaults to the configured storage backend
         """
-        self.blob = SimpleStorageService()
+        self.blob = blob_storage if blob_storage is not None else SimpleStorageService()
         self.model_evaluation_artifact = model_evaluation_artifact
         self.model_pusher_config = model_pusher_config
+        self.model_compaction_artifact = model_compaction_artifact
+        self.model_trainer_artifact = model_trainer_artifact
         self.heartdiesease_estimator = HeartDieseaseEstimator(blob_name=model_pusher_config.blob_name,
-                                model_path=model_pusher_config.blob_model_key_path)
+                                model_path=model_pusher_config.blob_model_key_path,
+                                blob_storage=self.blob)
 
     def initiate_model_pusher(self) -> ModelPusherArtifact:
         """
@@ -36,9 +49,35 @@ class ModelPusher:
 
             self.heartdiesease_estimator.save_model(from_file=self.model_evaluation_artifact.trained_model_path)
 
+            blob_compact_model_path = None
+            compact_model_estimator = HeartDieseaseEstimator(
+                blob_name=self.model_pusher_config.blob_name,
+                model_path=self.model_pusher_config.blob_compact_model_key_path,
+                blob_storage=self.blob)
+            if self.model_compaction_artifact is not None and self.model_compaction_artifact.is_compact_model_created:
+                compact_model_estimator.save_model(from_file=self.model_compaction_artifact.compact_model_file_path)
+                blob_compact_model_path = self.model_pusher_config.blob_compact_model_key_path
+            else:
+                # a variant of a previous push would be served in place of the pushed model
+                logging.info(f"No compact model in this push, removing {compact_model_estimator.model_path}")
+                compact_model_estimator.remove_model()
+
+            blob_numpy_model_path = None
+            numpy_model_estimator = HeartDieseaseEstimator(
+                blob_name=self.model_pusher_config.blob_name,
+                model_path=self.model_pusher_config.blob_numpy_model_key_path,
+                blob_storage=self.blob)
+            if self.model_trainer_artifact is not None and self.model_trainer_artifact.numpy_model_file_path:
+                numpy_model_estimator.save_model(from_file=self.model_trainer_artifact.numpy_model_file_path)
+                blob_numpy_model_path = self.model_pusher_config.blob_numpy_model_key_path
+            else:
+                logging.info(f"No NumPy model in this push, removing {numpy_model_estimator.model_path}")
+                numpy_model_estimator.remove_model()
 
             model_pusher_artifact = ModelPusherArtifact(blob_name=self.model_pusher_config.blob_name,
-                                                        blob_model_path=self.model_pusher_config.blob_model_key_path)
+                                                        blob_model_path=self.model_pusher_config.blob_model_key_path,
+                                                        blob_compact_model_path=blob_compact_model_path,
+                                                        blob_numpy_model_path=blob_numpy_model_path)
 
             logging.info("Uploaded artifacts folder to blob bucket")
             logging.info(f"Model pusher artifact: [{model_pusher_artifact}]")
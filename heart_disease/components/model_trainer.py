@@ -1,22 +1,29 @@
 import sys
-from typing import Tuple
+import time
+from dataclasses import asdict
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
-from neuro_mf  import ModelFactory
+from neuro_mf  import BestModel, ModelFactory
 
 from sklearn.preprocessing import LabelEncoder
+from sklearn.isotonic import IsotonicRegression
 from sklearn.model_selection import train_test_split
 
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.utils.main_utils import load_numpy_array_data, read_yaml_file, load_object, save_object
+from heart_disease.utils.main_utils import (load_numpy_array_data, read_yaml_file, load_object, save_object,
+                                            write_yaml_file)
+from heart_disease.components.model_profiler import ModelProfiler
+from heart_disease.components.model_tuning import FoldCachedModelSearch
 from heart_disease.entity.config_entity import ModelTrainerConfig
 from heart_disease.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ClassificationMetricArtifact
 from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.entity.oblivious_tree_evaluator import ObliviousTreeEvaluator
 
 class ModelTrainer:
     def __init__(self, data_transformation_artifact: DataTransformationArtifact,
@@ -28,12 +35,20 @@ class ModelTrainer:
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
 
-    def get_model_object_and_report(self, train: np.array, test: np.array) -> Tuple[object, object]:
+    def get_model_object_and_report(self, train: np.array, test: np.array,
+                                    sample_weight: Optional[np.array] = None) -> Tuple[object, object, object]:
         """
         Method Name :   get_model_object_and_report
-        Description :   This function uses neuro_mf to get the best model object and report of the best model
+        Description :   This function uses neuro_mf to get the best model object and report of the best model.
+                        neuro_mf does not pass fit parameters, so with class weights the best model is refit
+                        on the training set with the per-row sample weights. With fold_cached_tuning the grid
+                        is searched by FoldCachedModelSearch on quantized folds, which refits with the weights.
+                        The best candidates are profiled for latency and size on training rows and the model
+                        selection rule chooses one of the Pareto optimal ones, on its cross-validated score and
+                        profile. Only the chosen model is scored on the test set, for the final report. The tuning
+                        time is written to the tuning report
         
-        Output      :   Returns metric artifact object and best model object
+        Output      :   Returns best model object, its test metric artifact and its profile artifact
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
@@ -57,25 +72,139 @@ class ModelTrainer:
             le = LabelEncoder()
             y_test_encoded = le.fit_transform(y_test)
 
-            best_model_detail = model_factory.get_best_model(
-                X=x_train, y=y_train, base_accuracy=self.model_trainer_config.expected_accuracy
-            )
-            model_obj = best_model_detail.best_model
+            start = time.perf_counter()
+            expected_accuracy = self.model_trainer_config.expected_accuracy
+            # every rule profiles the top candidates, so the report records the score / latency / size tradeoff
+            n_candidates = self.model_trainer_config.selection_top_k
+            if self.model_trainer_config.fold_cached_tuning:
+                cache_dir = self.model_trainer_config.fold_cache_dir \
+                    if self.model_trainer_config.persist_fold_cache else None
+                model_search = FoldCachedModelSearch(
+                    model_config_file_path=self.model_trainer_config.model_config_file_path,
+                    share_iteration_trials=self.model_trainer_config.share_iteration_trials,
+                    cache_dir=cache_dir)
+                candidates = model_search.get_top_candidates(model_search.search(x_train, y_train),
+                                                             n_candidates, base_accuracy=expected_accuracy)
+                candidates = [model_search.fit_candidate(candidate, x_train, y_train, sample_weight)
+                              for candidate in candidates]
+                tuning_report = model_search.report
+            else:
+                # the best candidate of every model, refitted on the training set by GridSearchCV
+                grid_searched_best_model_list = model_factory.initiate_best_parameter_search_for_initialized_models(
+                    initialized_model_list=model_factory.get_initialized_model_list(),
+                    input_feature=x_train, output_feature=y_train)
+                candidates = FoldCachedModelSearch.get_top_candidates(
+                    [BestModel(*grid_searched_best_model) for grid_searched_best_model in grid_searched_best_model_list],
+                    n_candidates, base_accuracy=expected_accuracy)
+
+                if sample_weight is not None:
+                    for candidate in candidates:
+                        logging.info(f"Refitting {candidate.best_model.__class__.__name__} with class-balanced "
+                                     f"sample weights")
+                        candidate.best_model.fit(x_train, y_train, sample_weight=sample_weight)
+                tuning_report = {"method": "grid_search_cv", "rows": int(len(y_train)),
+                                 "seconds": time.perf_counter() - start}
+            if not candidates:
+                raise Exception(f"None of Model has base accuracy: {expected_accuracy}")
 
-            y_pred = model_obj.predict(x_test)
+            model_profiler = ModelProfiler(model_trainer_config=self.model_trainer_config)
+            candidate_reports, profile_artifacts = [], []
+            for candidate in candidates:
+                model_obj = candidate.best_model
+                profile_artifacts.append(model_profiler.profile(model_obj, x_train))
+                candidate_reports.append({"model": model_obj.__class__.__name__,
+                                          "parameters": dict(candidate.best_parameters),
+                                          "cv_score": float(candidate.best_score), **asdict(profile_artifacts[-1])})
 
+            selected = model_profiler.select(candidate_reports)
+            pareto_front = model_profiler.get_pareto_front(candidate_reports)
+            for i, candidate_report in enumerate(candidate_reports):
+                candidate_report.update({"pareto_optimal": i in pareto_front, "selected": i == selected})
+            best_model_detail = candidates[selected]
+
+            # the test set only scores the chosen model
+            y_pred = best_model_detail.best_model.predict(x_test)
             accuracy = accuracy_score(y_test_encoded, y_pred)
             f1 = f1_score(y_test_encoded, y_pred,average='weighted')
             precision = precision_score(y_test_encoded, y_pred,average='weighted')
             recall = recall_score(y_test_encoded, y_pred,average='weighted')
             metric_artifact = ClassificationMetricArtifact(f1_score=f1, precision_score=precision, recall_score=recall)
-            
-            return best_model_detail, metric_artifact
+            candidate_reports[selected].update({"test_accuracy": float(accuracy), "test_f1_score": float(f1)})
+            write_yaml_file(file_path=self.model_trainer_config.model_selection_report_file_path,
+                            content={"rule": self.model_trainer_config.selection_rule,
+                                     "latency_budget_ms": self.model_trainer_config.latency_budget_ms,
+                                     "size_budget_mb": self.model_trainer_config.size_budget_mb,
+                                     "score_tolerance": self.model_trainer_config.score_tolerance,
+                                     "candidates": candidate_reports})
+            logging.info(f"Selected {candidate_reports[selected]} by the {self.model_trainer_config.selection_rule}"
+                         f" rule out of {len(candidates)} candidates")
+
+            tuning_report["best_model"] = best_model_detail.best_model.__class__.__name__
+            tuning_report["best_parameters"] = dict(best_model_detail.best_parameters)
+            tuning_report["best_score"] = float(best_model_detail.best_score)
+            write_yaml_file(file_path=self.model_trainer_config.tuning_report_file_path, content=tuning_report)
+            logging.info(f"Tuning ({tuning_report['method']}) took {tuning_report['seconds']:.2f}s")
+
+            return best_model_detail, metric_artifact, profile_artifacts[selected]
         
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
         
 
+    def get_risk_calibrator(self, model_obj: object, x_calibration: np.array,
+                            y_calibration: np.array) -> IsotonicRegression:
+        """
+        Method Name :   get_risk_calibrator
+        Description :   This function fits an isotonic calibrator that maps the raw risk score
+                        (1 - probability of "no heart disease") onto the observed disease rate of the calibration
+                        rows, held out of the training set before rebalancing
+
+        Output      :   Returns fitted IsotonicRegression object
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            logging.info("Fitting isotonic calibrator for the risk score")
+            probabilities = np.asarray(model_obj.predict_proba(x_calibration))
+            classes = getattr(model_obj, "classes_", np.arange(probabilities.shape[1]))
+            no_disease = np.asarray(classes).astype(int) == 0
+            raw_risk_score = 1.0 - probabilities[:, no_disease].sum(axis=1)
+
+            calibrator = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip")
+            calibrator.fit(raw_risk_score, (y_calibration > 0).astype(int))
+            return calibrator
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_numpy_model_object(self, model_obj: object, x_test: np.array) -> Optional[ObliviousTreeEvaluator]:
+        """
+        Method Name :   get_numpy_model_object
+        Description :   This function exports a CatBoost model to JSON and loads it in the NumPy oblivious tree
+                        evaluator, which is kept only when its raw formula values on the test set are bit-exact
+                        with CatBoost's
+
+        Output      :   Returns the evaluator, None for other models or when it does not match CatBoost
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if model_obj.__class__.__name__ != "CatBoostClassifier":
+                logging.info(f"{model_obj.__class__.__name__} has no NumPy serving variant")
+                return None
+            evaluator = ObliviousTreeEvaluator.from_catboost_model(
+                model_obj, file_path=self.model_trainer_config.catboost_json_file_path)
+
+            expected_raw = np.asarray(model_obj.predict(x_test, prediction_type="RawFormulaVal"), dtype=np.float64)
+            raw = evaluator.predict_raw(x_test)
+            if not np.array_equal(expected_raw.reshape(raw.shape), raw):
+                logging.warning(f"{evaluator} does not reproduce the CatBoost raw values, max difference "
+                                f"{np.abs(expected_raw.reshape(raw.shape) - raw).max()}")
+                return None
+            max_proba_diff = np.abs(np.asarray(model_obj.predict_proba(x_test)) - evaluator.predict_proba(x_test)).max()
+            logging.info(f"{evaluator} matches CatBoost raw values exactly on {len(x_test)} test rows, "
+                         f"max probability difference {max_proba_diff:.3g}")
+            return evaluator
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
     def initiate_model_trainer(self, ) -> ModelTrainerArtifact:
         logging.info("Entered initiate_model_trainer method of ModelTrainer class")
         """
@@ -89,7 +218,13 @@ class ModelTrainer:
             train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
             test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
             
-            best_model_detail ,metric_artifact = self.get_model_object_and_report(train=train_arr, test=test_arr)
+            sample_weight = None
+            if self.data_transformation_artifact.transformed_train_sample_weight_file_path is not None:
+                sample_weight = load_numpy_array_data(
+                    file_path=self.data_transformation_artifact.transformed_train_sample_weight_file_path)
+
+            best_model_detail, metric_artifact, model_profile_artifact = self.get_model_object_and_report(
+                train=train_arr, test=test_arr, sample_weight=sample_weight)
             
             preprocessing_obj = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
 
@@ -98,15 +233,42 @@ class ModelTrainer:
                 logging.info("No best model found with score more than base score")
                 raise Exception("No best model found with score more than base score")
 
+            risk_calibrator = None
+            calibration_file_path = self.data_transformation_artifact.transformed_calibration_file_path
+            if self.model_trainer_config.calibrate_risk_score and calibration_file_path is None:
+                logging.warning("No calibration rows were held out, the risk score is not calibrated")
+            elif self.model_trainer_config.calibrate_risk_score:
+                calibration_arr = load_numpy_array_data(file_path=calibration_file_path)
+                risk_calibrator = self.get_risk_calibrator(model_obj=best_model_detail.best_model,
+                                                           x_calibration=calibration_arr[:, :-1],
+                                                           y_calibration=calibration_arr[:, -1])
+
             heartdiseases_model = HeartDiseaseModel(preprocessing_object=preprocessing_obj,
-                                       trained_model_object=best_model_detail.best_model)
+                                       trained_model_object=best_model_detail.best_model,
+                                       risk_calibrator=risk_calibrator)
             logging.info("Created heartdiseases model object with preprocessor and model")
             logging.info("Created best model file path.")
             save_object(self.model_trainer_config.trained_model_file_path, heartdiseases_model)
 
+            numpy_model_file_path = None
+            if self.model_trainer_config.export_numpy_model:
+                numpy_model_obj = self.get_numpy_model_object(model_obj=best_model_detail.best_model,
+                                                              x_test=test_arr[:, :-1])
+                if numpy_model_obj is not None:
+                    # the probabilities agree to the last bit or so, the risk calibrator of the model is reused
+                    save_object(self.model_trainer_config.numpy_model_file_path,
+                                HeartDiseaseModel(preprocessing_object=preprocessing_obj,
+                                                  trained_model_object=numpy_model_obj,
+                                                  risk_calibrator=risk_calibrator))
+                    numpy_model_file_path = self.model_trainer_config.numpy_model_file_path
+
             model_trainer_artifact = ModelTrainerArtifact(
                 trained_model_file_path=self.model_trainer_config.trained_model_file_path,
                 metric_artifact=metric_artifact,
+                tuning_report_file_path=self.model_trainer_config.tuning_report_file_path,
+                model_profile_artifact=model_profile_artifact,
+                model_selection_report_file_path=self.model_trainer_config.model_selection_report_file_path,
+                numpy_model_file_path=numpy_model_file_path,
             )
             logging.info(f"Model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from neuro_mf import BestModel, InitializedModelDetail, ModelFactory
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+# parameters that change how the features are binned, a grid over them cannot share quantized folds
+QUANTIZATION_PARAMS = {
+    "CatBoostClassifier": ("border_count", "max_bin", "feature_border_type", "per_float_feature_quantization",
+                           "nan_mode", "input_borders"),
+    "XGBClassifier": ("max_bin", "tree_method", "missing"),
+}
+# parameter holding the number of trees, trials that only differ in it are scored on one fit
+ITERATION_PARAMS = {"CatBoostClassifier": "iterations", "XGBClassifier": "n_estimators"}
+# number of trees of a model whose parameters do not set it
+DEFAULT_ITERATIONS = {"CatBoostClassifier": 1000, "XGBClassifier": 100}
+# CatBoost picks its learning rate from the number of iterations when none is given and stops early on
+# overfitting detection, a truncated model then differs from one trained with fewer trees
+CATBOOST_ITERATION_DEPENDENT_PARAMS = ("od_type", "od_wait", "od_pval", "early_stopping_rounds", "use_best_model")
+
+
+class FoldCache:
+    """
+    The CV fold splits of one training set and the quantized CatBoost Pools / XGBoost QuantileDMatrix of every
+    fold, built on first use and shared by every trial of the search and the final refit. CatBoost Pools are
+    also saved under cache_dir when given, keyed by a hash of the training data. XGBoost QuantileDMatrix
+    cannot be serialized and is cached in memory only.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cv, cache_dir: Optional[str] = None):
+        self.x = x
+        self.y = y
+        # the same splits GridSearchCV uses for a classifier (StratifiedKFold for an int cv)
+        self.folds: List[Tuple[np.ndarray, np.ndarray]] = list(check_cv(cv, y, classifier=True).split(x, y))
+        self.cache_dir = cache_dir
+        self._data_key = None
+        self._cache: Dict[tuple, object] = {}
+        self.builds = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.build_seconds = 0.0
+
+    @property
+    def n_splits(self) -> int:
+        return len(self.folds)
+
+    @property
+    def data_key(self) -> str:
+        if self._data_key is None:
+            digest = hashlib.sha256()
+            for array in (self.x, self.y):
+                digest.update(str((array.shape, array.dtype)).encode("utf-8"))
+                digest.update(np.ascontiguousarray(array).tobytes())
+            digest.update(json.dumps([test.tolist() for _, test in self.folds]).encode("utf-8"))
+            self._data_key = digest.hexdigest()[:16]
+        return self._data_key
+
+    def _get(self, key: tuple, build):
+        if key in self._cache:
+            self.hits += 1
+            return self._cache[key]
+        start = time.perf_counter()
+        value = build()
+        self.build_seconds += time.perf_counter() - start
+        self.builds += 1
+        self._cache[key] = value
+        return value
+
+    def _get_fold_data(self, fold: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        if fold is None:
+            return self.x, self.y
+        train_index = self.folds[fold][0]
+        return self.x[train_index], self.y[train_index]
+
+    def get_validation_set(self, fold: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self._get(("validation", fold), lambda: (self.x[self.folds[fold][1]], self.y[self.folds[fold][1]]))
+
+    def get_catboost_pool(self, fold: Optional[int], quantization_params: dict,
+                          sample_weight: Optional[np.ndarray] = None):
+        """
+        Returns the quantized Pool of the training part of a fold, of the whole training set when fold is None
+        """
+        from catboost import Pool
+
+        def build():
+            x, y = self._get_fold_data(fold)
+            file_path = None
+            if self.cache_dir is not None and sample_weight is None:
+                params_key = hashlib.sha256(json.dumps(quantization_params, sort_keys=True, default=str)
+                                            .encode("utf-8")).hexdigest()[:8]
+                name = "full" if fold is None else f"fold_{fold}_of_{self.n_splits}"
+                file_path = os.path.join(self.cache_dir, self.data_key, f"catboost_{params_key}_{name}.pool")
+                if os.path.exists(file_path):
+                    self.disk_hits += 1
+                    return Pool(f"quantized://{file_path}")
+            pool = Pool(x, y, weight=sample_weight)
+            pool.quantize(**quantization_params)
+            if file_path is not None:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                pool.save(file_path)
+            return pool
+
+        weight_key = None if sample_weight is None else id(sample_weight)
+        return self._get(("catboost", fold, json.dumps(quantization_params, sort_keys=True, default=str),
+                          weight_key), build)
+
+    def get_xgboost_dmatrix(self, fold: Optional[int], max_bin: int,
+                            sample_weight: Optional[np.ndarray] = None):
+        """
+        Returns the QuantileDMatrix of the training part of a fold, of the whole training set when fold is None
+        """
+        import xgboost
+
+        def build():
+            x, y = self._get_fold_data(fold)
+            return xgboost.QuantileDMatrix(x, y, weight=sample_weight, max_bin=max_bin)
+
+        weight_key = None if sample_weight is None else id(sample_weight)
+        return self._get(("xgboost", fold, max_bin, weight_key), build)
+
+    def get_xgboost_validation_dmatrix(self, fold: int, max_bin: int):
+        import xgboost
+
+        def build():
+            x_val, _ = self.get_validation_set(fold)
+            # binned with the cuts of the training part of the fold
+            return xgboost.QuantileDMatrix(x_val, ref=self.get_xgboost_dmatrix(fold, max_bin), max_bin=max_bin)
+
+        return self._get(("xgboost_validation", fold, max_bin), build)
+
+    def stats(self) -> dict:
+        return {"n_splits": self.n_splits, "builds": self.builds, "hits": self.hits, "disk_hits": self.disk_hits,
+                "build_seconds": self.build_seconds}
+
+
+class FoldCachedModelSearch:
+    """
+    Grid search over the models of config/model.yaml with the semantics of neuro_mf.ModelFactory.get_best_model
+    (GridSearchCV folds and clone parameters, accuracy scoring, first best candidate wins, best model above
+    base_accuracy), but
+    CatBoost and XGBoost trials are fitted on the quantized folds of a FoldCache instead of re-binning the raw
+    matrix on every fit. Other models, and grids over the binning parameters, fall back to GridSearchCV.
+    """
+
+    def __init__(self, model_config_file_path: str, share_iteration_trials: bool = True,
+                 cache_dir: Optional[str] = None):
+        """
+        :param model_config_file_path: model.yaml with the grid_search and model_selection sections
+        :param share_iteration_trials: fit trials that only differ in the number of trees once and score them
+                                       on the truncated model
+        :param cache_dir: directory where the quantized CatBoost folds are persisted, in memory only when None
+        """
+        try:
+            self.model_factory = ModelFactory(model_config_path=model_config_file_path)
+            self.share_iteration_trials = share_iteration_trials
+            self.cache_dir = cache_dir
+            self.report: dict = {}
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def get_model_params(model) -> dict:
+        """
+        Returns the parameters GridSearchCV trains the clones of an initialized model with. neuro_mf sets the
+        model.yaml params with setattr, which CatBoost keeps out of get_params, so its clones drop them
+        """
+        return clone(model).get_params()
+
+    def is_cacheable(self, initialized_model: InitializedModelDetail) -> bool:
+        model_name = initialized_model.model.__class__.__name__
+        if model_name not in QUANTIZATION_PARAMS:
+            return False
+        grid_search_params = self.model_factory.grid_search_property_data
+        if grid_search_params.get("scoring") is not None:
+            return False
+        search_params = set(initialized_model.param_grid_search)
+        if search_params & set(QUANTIZATION_PARAMS[model_name]):
+            return False
+        if model_name == "XGBClassifier":
+            tree_method = self.get_model_params(initialized_model.model).get("tree_method")
+            return tree_method in (None, "hist", "auto")
+        return True
+
+    def get_trial_groups(self, model_name: str, fixed_params: dict, param_grid: dict) -> List[Tuple[dict, List[int]]]:
+        """
+        Returns the candidates of the grid grouped into fits: (params of the fit, tree counts scored on it).
+        Without sharing every candidate is a fit of its own.
+        """
+        iteration_param = ITERATION_PARAMS[model_name]
+        groups: Dict[str, Tuple[dict, List[int]]] = {}
+        order = []
+        for candidate in ParameterGrid(param_grid):
+            params = {**fixed_params, **candidate}
+            n_trees = int(params.get(iteration_param) or DEFAULT_ITERATIONS[model_name])
+            shareable = self.share_iteration_trials
+            if model_name == "CatBoostClassifier":
+                shareable = shareable and params.get("learning_rate") is not None and \
+                            not set(params) & set(CATBOOST_ITERATION_DEPENDENT_PARAMS)
+            base_params = {key: value for key, value in params.items() if key != iteration_param}
+            group_key = json.dumps(base_params, sort_keys=True, default=str) if shareable else str(len(order))
+            if group_key not in groups:
+                groups[group_key] = (base_params, [])
+                order.append(group_key)
+            groups[group_key][1].append(n_trees)
+        return [groups[key] for key in order]
+
+    @staticmethod
+    def get_catboost_quantization_params(params: dict) -> dict:
+        return {key: params[key] for key in QUANTIZATION_PARAMS["CatBoostClassifier"] if key in params}
+
+    @staticmethod
+    def get_xgboost_train_params(model, n_classes: int) -> dict:
+        # the booster parameters XGBClassifier.fit would train with on n_classes labels
+        params = {key: value for key, value in model.get_xgb_params().items() if value is not None}
+        if n_classes > 2:
+            if not str(params.get("objective", "")).startswith("multi:"):
+                params["objective"] = "multi:softprob"
+            params["num_class"] = n_classes
+        return params
+
+    @staticmethod
+    def predict_xgboost_classes(booster, dmatrix, n_trees: int) -> np.ndarray:
+        probabilities = booster.predict(dmatrix, iteration_range=(0, n_trees))
+        if probabilities.ndim == 1:
+            return (probabilities > 0.5).astype(int)
+        return probabilities.argmax(axis=1)
+
+    def score_fits(self, model_name: str, model_class, fixed_params: dict, param_grid: dict,
+                   fold_cache: FoldCache) -> Tuple[List[Tuple[dict, float]], int]:
+        """
+        Returns every candidate of the grid with its mean validation accuracy over the folds, in grid order,
+        and the number of fits
+        """
+        iteration_param = ITERATION_PARAMS[model_name]
+        scores: Dict[str, List[float]] = {}
+        candidates: Dict[str, dict] = {}
+        n_fits = 0
+        for base_params, tree_counts in self.get_trial_groups(model_name, fixed_params, param_grid):
+            max_trees = max(tree_counts)
+            for fold in range(fold_cache.n_splits):
+                model = model_class(**{**base_params, iteration_param: max_trees})
+                x_val, y_val = fold_cache.get_validation_set(fold)
+                if model_name == "CatBoostClassifier":
+                    quantization_params = self.get_catboost_quantization_params(base_params)
+                    model.fit(fold_cache.get_catboost_pool(fold, quantization_params))
+
+                    def predict(n_trees: int) -> np.ndarray:
+                        return np.asarray(model.predict(x_val, ntree_end=n_trees)).ravel()
+                else:
+                    import xgboost
+
+                    max_bin = int(base_params.get("max_bin") or 256)
+                    dtrain = fold_cache.get_xgboost_dmatrix(fold, max_bin)
+                    n_classes = len(np.unique(fold_cache._get_fold_data(fold)[1]))
+                    booster = xgboost.train(self.get_xgboost_train_params(model, n_classes), dtrain,
+                                            num_boost_round=max_trees)
+                    dval = fold_cache.get_xgboost_validation_dmatrix(fold, max_bin)
+
+                    def predict(n_trees: int) -> np.ndarray:
+                        return self.predict_xgboost_classes(booster, dval, n_trees)
+                n_fits += 1
+                for n_trees in tree_counts:
+                    key = json.dumps({**base_params, iteration_param: n_trees}, sort_keys=True, default=str)
+                    candidates[key] = {**base_params, iteration_param: n_trees}
+                    accuracy = float(np.mean(predict(n_trees) == y_val.astype(float)))
+                    scores.setdefault(key, []).append(accuracy)
+
+        results = []
+        for candidate in ParameterGrid(param_grid):
+            params = {**fixed_params, **candidate}
+            params[iteration_param] = int(params.get(iteration_param) or DEFAULT_ITERATIONS[model_name])
+            key = json.dumps(params, sort_keys=True, default=str)
+            results.append((candidate, float(np.mean(scores[key]))))
+        return results, n_fits
+
+    def refit(self, model_name: str, model_class, params: dict, fold_cache: FoldCache,
+              sample_weight: Optional[np.ndarray] = None):
+        """
+        Fit the chosen candidate on the cached quantized whole training set
+        """
+        model = model_class(**params)
+        if model_name == "CatBoostClassifier":
+            model.fit(fold_cache.get_catboost_pool(None, self.get_catboost_quantization_params(params),
+                                                   sample_weight))
+        else:
+            import xgboost
+
+            dtrain = fold_cache.get_xgboost_dmatrix(None, int(params.get("max_bin") or 256), sample_weight)
+            booster = xgboost.train(self.get_xgboost_train_params(model, len(np.unique(fold_cache.y))), dtrain,
+                                    num_boost_round=int(model.n_estimators or DEFAULT_ITERATIONS[model_name]))
+            # the sklearn wrapper restores classes_ and n_classes_ from the booster
+            model.load_model(bytearray(booster.save_raw("ubj")))
+        return model
+
+    def search(self, x: np.ndarray, y: np.ndarray) -> List[BestModel]:
+        """
+        Method Name :   search
+        Description :   This method scores the grid of every model of the model config on the cached folds.
+                        Models that fall back to GridSearchCV only contribute their best, already fitted, candidate
+
+        Output      :   Returns a neuro_mf BestModel per candidate in config and grid order, best_model is None
+                        until the candidate is fitted with fit_candidate
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            start = time.perf_counter()
+            cv = self.model_factory.grid_search_property_data.get("cv", 5)
+            self.fold_cache = FoldCache(x, y, cv=cv, cache_dir=self.cache_dir)
+            candidates, model_reports = [], []
+
+            for initialized_model in self.model_factory.get_initialized_model_list():
+                model_start = time.perf_counter()
+                model_class = initialized_model.model.__class__
+                model_name = model_class.__name__
+                if self.is_cacheable(initialized_model):
+                    fixed_params = self.get_model_params(initialized_model.model)
+                    results, n_fits = self.score_fits(model_name, model_class, fixed_params,
+                                                      initialized_model.param_grid_search, self.fold_cache)
+                    model_candidates = [BestModel(model_serial_number=initialized_model.model_serial_number,
+                                                  model=initialized_model.model, best_model=None,
+                                                  best_parameters=parameters, best_score=score)
+                                        for parameters, score in results]
+                    method = "fold_cached"
+                else:
+                    grid_searched_best_model = self.model_factory.execute_grid_search_operation(
+                        initialized_model=initialized_model, input_feature=x, output_feature=y)
+                    model_candidates = [BestModel(*grid_searched_best_model)]
+                    n_fits = len(ParameterGrid(initialized_model.param_grid_search)) * self.fold_cache.n_splits + 1
+                    method = "grid_search_cv"
+
+                # GridSearchCV keeps the first of equally scored candidates
+                best = max(model_candidates, key=lambda candidate: candidate.best_score)
+                candidates.extend(model_candidates)
+                model_reports.append({"model": initialized_model.model_name, "method": method,
+                                      "trials": len(ParameterGrid(initialized_model.param_grid_search)),
+                                      "fits": n_fits, "best_parameters": dict(best.best_parameters),
+                                      "best_score": float(best.best_score),
+                                      "seconds": time.perf_counter() - model_start})
+                logging.info(f"Searched {model_name} ({method}): {n_fits} fits, best score {best.best_score:.4f} "
+                             f"with {best.best_parameters}")
+
+            self.report = {"method": "fold_cached", "rows": int(len(y)), "seconds": time.perf_counter() - start,
+                           "refit_seconds": 0.0, "models": model_reports}
+            return candidates
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def fit_candidate(self, candidate: BestModel, x: np.ndarray, y: np.ndarray,
+                      sample_weight: Optional[np.ndarray] = None) -> BestModel:
+        """
+        Fit a searched candidate on the whole training set of the search, with sample_weight when given
+        """
+        try:
+            start = time.perf_counter()
+            best_model = candidate.best_model
+            if best_model is None:
+                model_class = candidate.model.__class__
+                params = {**self.get_model_params(candidate.model), **candidate.best_parameters}
+                best_model = self.refit(model_class.__name__, model_class, params, self.fold_cache, sample_weight)
+            elif sample_weight is not None:
+                best_model.fit(x, y, sample_weight=sample_weight)
+            self.report["refit_seconds"] = self.report.get("refit_seconds", 0.0) + time.perf_counter() - start
+            self.report["seconds"] = self.report.get("seconds", 0.0) + time.perf_counter() - start
+            self.report["fold_cache"] = self.fold_cache.stats()
+            return candidate._replace(best_model=best_model)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    @staticmethod
+    def get_top_candidates(candidates: List[BestModel], n: int, base_accuracy: float = 0.6) -> List[BestModel]:
+        """
+        Returns the n candidates with the highest cross-validated score above base_accuracy, best first
+        """
+        accepted = [candidate for candidate in candidates if candidate.best_score > base_accuracy]
+        return sorted(accepted, key=lambda candidate: candidate.best_score, reverse=True)[:n]
+
+    def get_best_model(self, x: np.ndarray, y: np.ndarray, base_accuracy: float = 0.6,
+                       sample_weight: Optional[np.ndarray] = None) -> BestModel:
+        """
+        Method Name :   get_best_model
+        Description :   This method searches the grid of every model of the model config on the cached folds
+                        and refits the best candidate on the whole training set, with sample_weight when given
+
+        Output      :   Returns neuro_mf BestModel of the best candidate, the search is reported in self.report
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            candidates = self.search(x, y)
+
+            # ModelFactory.get_best_model_from_grid_searched_best_model_list on the best candidate of every model
+            best = None
+            for serial_number in dict.fromkeys(candidate.model_serial_number for candidate in candidates):
+                model_best = max((candidate for candidate in candidates
+                                  if candidate.model_serial_number == serial_number),
+                                 key=lambda candidate: candidate.best_score)
+                if base_accuracy < model_best.best_score:
+                    base_accuracy = model_best.best_score
+                    best = model_best
+            if best is None:
+                raise Exception(f"None of Model has base accuracy: {base_accuracy}")
+
+            # only the winner is refitted, the scores that select it are cross-validated
+            best = self.fit_candidate(best, x, y, sample_weight)
+            self.report["best_model"] = best.model.__class__.__name__
+            logging.info(f"Fold cached search took {self.report['seconds']:.2f}s: {self.report['fold_cache']}")
+            return best
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
@@ -0,0 +1,215 @@
+import random
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+import certifi
+import pymongo
+import requests
+from azure.core.exceptions import ResourceExistsError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, ExponentialRetry
+from requests.adapters import HTTPAdapter
+
+from heart_disease.constants import MONGODB_URL_KEY, STORAGE_ACCOUNT_CONNECTION, STORAGE_ACCOUNT_CONTAINER
+from heart_disease.entity.config_entity import ClientManagerConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+
+def retry_with_backoff(func: Callable, retry_total: int, backoff_seconds: float, max_backoff_seconds: float,
+                       description: str = "operation"):
+    """
+    call func and retry it up to retry_total times with exponential backoff and jitter
+    the last exception is re-raised when every attempt failed
+    """
+    for attempt in range(retry_total + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retry_total:
+                raise
+            delay = min(max_backoff_seconds, backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logging.warning(f"{description} failed (attempt {attempt + 1}/{retry_total + 1}): {e}. "
+                            f"Retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+class ClientManager:
+    """
+    Process-wide owner of the pooled Mongo and blob clients.
+    Clients are created once with tuned pool sizes, timeouts and retry policies, warmed up at
+    application startup (so the first request never pays connection setup) and closed on shutdown.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, client_manager_config: ClientManagerConfig = ClientManagerConfig()):
+        """
+        :param client_manager_config: pool size, timeout and retry configuration of the clients
+        """
+        self.client_manager_config = client_manager_config
+        self._lock = threading.RLock()
+        self._mongo_client: Optional[pymongo.MongoClient] = None
+        self._blob_session: Optional[requests.Session] = None
+        self._blob_clients: Optional[dict] = None
+        self._container_ready = False
+
+    @classmethod
+    def get_instance(cls) -> "ClientManager":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ClientManager()
+            return cls._instance
+
+    def retry(self, func: Callable, description: str):
+        config = self.client_manager_config
+        return retry_with_backoff(func, retry_total=config.retry_total,
+                                  backoff_seconds=config.retry_backoff_seconds,
+                                  max_backoff_seconds=config.retry_max_backoff_seconds,
+                                  description=description)
+
+    def get_mongo_client(self) -> pymongo.MongoClient:
+        """
+        Returns the pooled MongoClient, creating it on first use. Creating the client does not block,
+        connections are opened by warm_up or the first operation.
+        """
+        try:
+            with self._lock:
+                if self._mongo_client is None:
+                    mongo_db_url = MONGODB_URL_KEY
+                    if mongo_db_url is None:
+                        raise Exception(f"Environment key: {MONGODB_URL_KEY} is not set.")
+                    config = self.client_manager_config
+                    self._mongo_client = pymongo.MongoClient(
+                        mongo_db_url,
+                        tlsCAFile=certifi.where(),
+                        maxPoolSize=config.mongo_max_pool_size,
+                        minPoolSize=config.mongo_min_pool_size,
+                        maxIdleTimeMS=config.mongo_max_idle_time_ms,
+                        serverSelectionTimeoutMS=config.mongo_server_selection_timeout_ms,
+                        connectTimeoutMS=config.mongo_connect_timeout_ms,
+                        socketTimeoutMS=config.mongo_socket_timeout_ms,
+                        retryReads=True,
+                        retryWrites=True,
+                    )
+                    logging.info("Created pooled MongoClient")
+                return self._mongo_client
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_blob_clients(self, ensure_container: bool = True) -> dict:
+        """
+        Returns the blob service client, container client and container name. The clients share one
+        keep-alive HTTP session with a bounded connection pool and retry with exponential backoff.
+        :param ensure_container: create the container if it is missing (done once per process, concurrent first
+        callers may each try, an existing container is not an error)
+        """
+        try:
+            with self._lock:
+                if self._blob_clients is None:
+                    connection_string = STORAGE_ACCOUNT_CONNECTION
+                    container_name = STORAGE_ACCOUNT_CONTAINER
+                    if not connection_string:
+                        raise Exception(f"Storage connection string (STORAGE_ACCOUNT_CONNECTION) is not set.")
+                    if not container_name:
+                        raise Exception(f"Storage container (STORAGE_ACCOUNT_CONTAINER) is not set.")
+
+                    config = self.client_manager_config
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=config.blob_connection_pool_size,
+                                          pool_maxsize=config.blob_connection_pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+
+                    transport = RequestsTransport(session=session, session_owner=False,
+                                                  connection_timeout=config.blob_connection_timeout,
+                                                  read_timeout=config.blob_read_timeout)
+                    retry_policy = ExponentialRetry(initial_backoff=config.retry_backoff_seconds,
+                                                    increment_base=2, retry_total=config.retry_total,
+                                                    random_jitter_range=1)
+                    blob_service_client = BlobServiceClient.from_connection_string(
+                        connection_string, transport=transport, retry_policy=retry_policy)
+
+                    self._blob_session = session
+                    self._blob_clients = {
+                        "blob_service_client": blob_service_client,
+                        "container_client": blob_service_client.get_container_client(container_name),
+                        "container_name": container_name,
+                    }
+                    logging.info("Created pooled BlobServiceClient")
+
+                blob_clients = self._blob_clients
+            # the container is created outside the lock, a slow create must not block the other callers
+            if ensure_container and not self._container_ready:
+                self.ensure_container(blob_clients["container_client"])
+            return blob_clients
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def ensure_container(self, container_client) -> None:
+        # transient failures are retried by the ExponentialRetry policy of the client
+        try:
+            container_client.create_container()
+            logging.info(f"Created container '{container_client.container_name}'")
+        except ResourceExistsError:
+            logging.info(f"Container '{container_client.container_name}' already exists")
+        self._container_ready = True
+
+    def warm_up(self) -> dict:
+        """
+        Open the connections of the configured clients so the first request does not pay for connection
+        setup. Failures are logged and reported instead of raised so the app can still start.
+        """
+        logging.info("Warming up Mongo and blob clients")
+        if self.client_manager_config.warm_up_blob:
+            try:
+                self.get_blob_clients(ensure_container=True)
+            except Exception as e:
+                logging.error(f"Blob warm up failed: {e}")
+        if self.client_manager_config.warm_up_mongo:
+            try:
+                self.retry(lambda: self.get_mongo_client().admin.command("ping"), description="Mongo warm up")
+            except Exception as e:
+                logging.error(f"Mongo warm up failed: {e}")
+        return self.health()
+
+    @staticmethod
+    def _probe(func: Callable) -> dict:
+        start = time.perf_counter()
+        try:
+            func()
+            return {"ok": True, "latency_ms": (time.perf_counter() - start) * 1000}
+        except Exception as e:
+            return {"ok": False, "latency_ms": (time.perf_counter() - start) * 1000, "error": str(e)}
+
+    def health(self) -> dict:
+        """
+        Health probes of the clients: a Mongo ping and a single-page container listing, read-only
+        """
+        result = {}
+        if self._mongo_client is not None or self.client_manager_config.warm_up_mongo:
+            result["mongo"] = self._probe(lambda: self.get_mongo_client().admin.command("ping"))
+        if self._blob_clients is not None or self.client_manager_config.warm_up_blob:
+            result["blob"] = self._probe(
+                lambda: next(iter(self.get_blob_clients(ensure_container=False)["container_client"].list_blobs(
+                    results_per_page=1)), None))
+        return result
+
+    def close(self) -> None:
+        """
+        Close the pooled clients, called from the application shutdown hook
+        """
+        with self._lock:
+            if self._mongo_client is not None:
+                self._mongo_client.close()
+                self._mongo_client = None
+            if self._blob_clients is not None:
+                self._blob_clients["blob_service_client"].close()
+                self._blob_clients = None
+            if self._blob_session is not None:
+                self._blob_session.close()
+                self._blob_session = None
+            self._container_ready = False
+        logging.info("Closed Mongo and blob clients")
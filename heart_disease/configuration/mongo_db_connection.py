@@ -2,42 +2,31 @@ import sys
 
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-import ssl
-import os
-from heart_disease.constants import DATABASE_NAME, MONGODB_URL_KEY
+from heart_disease.constants import DATABASE_NAME
+from heart_disease.configuration.client_manager import ClientManager
 import pymongo
-import certifi
 
-ca = certifi.where()
 
 class MongoDBClient:
     """
-    Class Name :   export_data_into_feature_store
-    Description :   This method exports the dataframe from mongodb feature store as dataframe 
+    Class Name :   MongoDBClient
+    Description :   Gives access to a database of the pooled MongoClient owned by ClientManager
     
     Output      :   connection to mongodb database
     On Failure  :   raises an exception
     """
-    client = None
+    client: pymongo.MongoClient = None
 
     def __init__(self, database_name=DATABASE_NAME) -> None:
         try:
-            if MongoDBClient.client is None:
-                # mongo_db_url = os.getenv(MONGODB_URL_KEY)
-                mongo_db_url = MONGODB_URL_KEY
-                if mongo_db_url is None:
-                    raise Exception(f"Environment key: {MONGODB_URL_KEY} is not set.")
-                MongoDBClient.client = pymongo.MongoClient(mongo_db_url, tlsCAFile=ca,serverSelectionTimeoutMS=30000,connectTimeoutMS=30000)
-                # verify connection immediately
-                self.client.admin.command("ping")
-
-            self.database = self.client[database_name]
-            print(f"✅ MongoDB connection to '{database_name}' established successfully!")
+            # the client is created once per process, connections are opened by the
+            # ClientManager warm up or lazily by the first operation
+            MongoDBClient.client = ClientManager.get_instance().get_mongo_client()
 
             self.client = MongoDBClient.client
             self.database = self.client[database_name]
             self.database_name = database_name
-            logging.info("MongoDB connection succesfull")
+            logging.info(f"MongoDB client ready for database '{database_name}'")
         except Exception as e:
             raise HeartdieseaseException(e,sys)
         
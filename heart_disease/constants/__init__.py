@@ -33,6 +33,25 @@ TEST_FILE_NAME: str = "test.csv"
 SCHEMA_FILE_PATH = os.path.join("config", "schema.yaml")
 
 
+"""
+Connection pool related constant for the shared Mongo and blob clients
+"""
+MONGODB_MAX_POOL_SIZE: int = 50
+MONGODB_MIN_POOL_SIZE: int = 2
+MONGODB_MAX_IDLE_TIME_MS: int = 300000
+MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 10000
+MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+MONGODB_SOCKET_TIMEOUT_MS: int = 60000
+BLOB_CONNECTION_POOL_SIZE: int = 32
+BLOB_CONNECTION_TIMEOUT_SECONDS: int = 10
+BLOB_READ_TIMEOUT_SECONDS: int = 120
+CLIENT_RETRY_TOTAL: int = 3
+CLIENT_RETRY_BACKOFF_SECONDS: float = 0.5
+CLIENT_RETRY_MAX_BACKOFF_SECONDS: float = 8.0
+# the app never reads Mongo, a retried ping would only delay the startup of every (prefork) worker
+CLIENT_WARM_UP_MONGO: bool = False
+CLIENT_WARM_UP_BLOB: bool = True
+
 # AWS_ACCESS_KEY_ID_ENV_KEY = "AWS_ACCESS_KEY_ID"
 # AWS_SECRET_ACCESS_KEY_ENV_KEY = "AWS_SECRET_ACCESS_KEY"
 # REGION_NAME = "us-east-1"
@@ -42,6 +61,14 @@ Azure Blob Storage
 """
 STORAGE_ACCOUNT_CONNECTION="DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
 STORAGE_ACCOUNT_CONTAINER="cvd-uploads"
+# one of: azure, local (containers are directories under STORAGE_LOCAL_ROOT_DIR), memory
+STORAGE_BACKEND_TYPE: str = "azure"
+STORAGE_LOCAL_ROOT_DIR: str = "blob_storage"
+# latency injected in front of every storage call, for measuring the effect of blob latency
+STORAGE_INJECTED_LATENCY_SECONDS: float = 0.0
+STORAGE_INJECTED_JITTER_SECONDS: float = 0.0
+STORAGE_INJECTED_TAIL_PROBABILITY: float = 0.0
+STORAGE_INJECTED_TAIL_LATENCY_SECONDS: float = 0.0
 
 """
 Data Ingestion related constant start with DATA_INGESTION VAR NAME
@@ -51,6 +78,20 @@ DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE_DIR: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO: float = 0.2
+DATA_INGESTION_EXPORT_PARTITIONS: int = os.cpu_count() or 1
+DATA_INGESTION_EXPORT_BATCH_SIZE: int = 10000
+DATA_INGESTION_EXPORT_MIN_PARTITION_ROWS: int = 50000
+# one of: mongo, file (CSV / Parquet file or directory), sqlite (database file, table DATA_INGESTION_COLLECTION_NAME)
+DATA_INGESTION_SOURCE_TYPE: str = "mongo"
+DATA_INGESTION_SOURCE_PATH: str = os.path.join("data", DATA_INGESTION_COLLECTION_NAME)
+
+"""
+Bulk loader related constant start with BULK_LOADER VAR NAME
+"""
+BULK_LOADER_KEY: str = "id"
+BULK_LOADER_INDEX_FIELDS: list = ["id", "dataset"]
+BULK_LOADER_BATCH_SIZE: int = 5000
+BULK_LOADER_WORKERS: int = 4
 
 
 
@@ -69,6 +110,17 @@ Data Transformation ralated constant start with DATA_TRANSFORMATION VAR NAME
 DATA_TRANSFORMATION_DIR_NAME: str = "data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR: str = "transformed"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR: str = "transformed_object"
+DATA_TRANSFORMATION_SAMPLE_WEIGHT_FILE_NAME: str = "train_sample_weight.npy"
+DATA_TRANSFORMATION_REBALANCING_REPORT_FILE_NAME: str = "rebalancing_report.yaml"
+DATA_TRANSFORMATION_CALIBRATION_FILE_NAME: str = "calibration.npy"
+# rows of the training set held out (before rebalancing) to fit the risk calibrator on, 0 disables calibration
+DATA_TRANSFORMATION_CALIBRATION_SPLIT_RATIO: float = 0.2
+# one of: smoteenn, smote, random_over, random_under, class_weight, none
+DATA_TRANSFORMATION_REBALANCING_STRATEGY: str = "smoteenn"
+DATA_TRANSFORMATION_SMOTE_K_NEIGHBORS: int = 2
+DATA_TRANSFORMATION_NEIGHBORS_ALGORITHM: str = "kd_tree"
+DATA_TRANSFORMATION_REBALANCING_N_JOBS: int = -1
+DATA_TRANSFORMATION_RANDOM_STATE: int = 42
 
 
 
@@ -80,13 +132,193 @@ MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str = "model.pkl"
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.6
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join("config", "model.yaml")
+MODEL_TRAINER_CALIBRATE_RISK_SCORE: bool = True
+# tune CatBoost / XGBoost on quantized Pools / QuantileDMatrix built once per CV fold instead of GridSearchCV
+MODEL_TRAINER_FOLD_CACHED_TUNING: bool = True
+# trials that only differ in the number of trees share one fit, scored at every tree count
+MODEL_TRAINER_SHARE_ITERATION_TRIALS: bool = True
+# quantized CatBoost fold Pools are saved here, keyed by the training data, when persisted
+MODEL_TRAINER_PERSIST_FOLD_CACHE: bool = False
+MODEL_TRAINER_FOLD_CACHE_DIR: str = os.path.join(ARTIFACT_DIR, "fold_cache")
+MODEL_TRAINER_TUNING_REPORT_FILE_NAME: str = "tuning_report.yaml"
+# a CatBoost model is also exported to JSON and saved with the NumPy oblivious tree evaluator, a serving variant
+# that does not import catboost
+MODEL_TRAINER_EXPORT_NUMPY_MODEL: bool = True
+MODEL_TRAINER_CATBOOST_JSON_FILE_NAME: str = "model.json"
+MODEL_TRAINER_NUMPY_MODEL_FILE_NAME: str = "numpy_model.pkl"
+MODEL_TRAINER_NUMPY_MODEL_BLOB_PATH: str = "numpy/model.pkl"
+
+
+"""
+Model selection related constant start with MODEL_SELECTION VAR NAME, the best searched candidates are profiled
+for predict latency and serialized size before one is chosen
+"""
+# one of: score_tolerance (fastest model within MODEL_SELECTION_SCORE_TOLERANCE of the highest cross-validated score),
+# latency_budget (highest cross-validated score within the latency and size budgets),
+# score (highest cross-validated score, latency and size are only reported)
+MODEL_SELECTION_RULE: str = "score_tolerance"
+MODEL_SELECTION_TOP_K: int = 5
+# budgets of the p99 single-row predict latency and the pickled model size
+MODEL_SELECTION_LATENCY_BUDGET_MS: float = 10.0
+MODEL_SELECTION_SIZE_BUDGET_MB: float = 50.0
+MODEL_SELECTION_SCORE_TOLERANCE: float = 0.01
+MODEL_SELECTION_LATENCY_CALLS: int = 200
+MODEL_SELECTION_BATCH_SIZE: int = 1000
+MODEL_SELECTION_BATCH_CALLS: int = 20
+MODEL_SELECTION_REPORT_FILE_NAME: str = "model_selection_report.yaml"
+
+
+"""
+Model compaction related constant start with MODEL_COMPACTION VAR NAME, a small serving variant of the trained model
+"""
+MODEL_COMPACTION_ENABLED: bool = True
+MODEL_COMPACTION_DIR_NAME: str = "model_compaction"
+MODEL_COMPACTION_REPORT_FILE_NAME: str = "report.yaml"
+# one of: truncation (first trees of the trained model), distillation (shallow student), both
+MODEL_COMPACTION_METHOD: str = "both"
+# largest weighted F1 drop on the test set accepted for the compact model
+MODEL_COMPACTION_MAX_F1_LOSS: float = 0.01
+# truncation candidates, as fractions of the trees of the trained model
+MODEL_COMPACTION_TREE_FRACTIONS: list = [0.1, 0.2, 0.3, 0.5, 0.75]
+MODEL_COMPACTION_STUDENT_DEPTH: int = 4
+MODEL_COMPACTION_STUDENT_ITERATIONS: int = 200
+MODEL_COMPACTION_STUDENT_LEARNING_RATE: float = 0.1
+MODEL_COMPACTION_BLOB_MODEL_PATH: str = "compact/model.pkl"
+
+
+"""
+Incremental training related constant start with INCREMENTAL_TRAINING VAR NAME
+"""
+INCREMENTAL_TRAINING_DIR_NAME: str = "incremental_training"
+INCREMENTAL_TRAINING_REPORT_FILE_NAME: str = "report.yaml"
+# registry blob with the watermark and schema of the last pushed model
+INCREMENTAL_TRAINING_STATE_FILE_NAME: str = "training_state.yaml"
+# records are pulled incrementally by this increasing column
+INCREMENTAL_TRAINING_WATERMARK_COLUMN: str = "id"
+INCREMENTAL_TRAINING_MIN_ROWS: int = 500
+# largest standardized mean shift of a scaled feature for which the fitted preprocessor is reused
+INCREMENTAL_TRAINING_DRIFT_THRESHOLD: float = 0.25
+# boosting rounds added on top of the production model
+INCREMENTAL_TRAINING_ITERATIONS: int = 100
+INCREMENTAL_TRAINING_REBALANCING_STRATEGY: str = "class_weight"
 
 
 
 MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE: float = 0.02
+MODEL_EVALUATION_DIR_NAME: str = "model_evaluation"
+MODEL_EVALUATION_REPORT_FILE_NAME: str = "report.yaml"
+MODEL_EVALUATION_BOOTSTRAP_ROUNDS: int = 1000
+MODEL_EVALUATION_CONFIDENCE_LEVEL: float = 0.95
+MODEL_EVALUATION_N_JOBS: int = 4
 MODEL_BLOB_NAME = "cvd-uploads"
 MODEL_PUSHER_BLOB_PATH = "model-registry"
 
 
+"""
+Cohort models related constant start with COHORT VAR NAME, one model per source site (dataset column)
+"""
+COHORT_COLUMN: str = "dataset"
+COHORT_DIR_NAME: str = "cohorts"
+COHORT_TRAIN_MODELS: bool = True
+# cohorts with fewer ingested rows are served by the global model
+COHORT_MIN_ROWS: int = 100
+COHORT_TRAINING_N_JOBS: int = 4
+COHORT_MODEL_BLOB_PREFIX: str = "cohorts"
+COHORT_MANIFEST_FILE_NAME: str = "manifest.yaml"
+COHORT_MODELS_ENABLED: bool = True
+COHORT_POOL_MEMORY_BUDGET_MB: float = 512
+COHORT_POOL_MAX_MODELS: int = 8
+COHORT_POOL_PREFETCH_COUNT: int = 2
+
+
+"""
+Prediction related constant
+"""
+HEART_DISEASE_STATUS_MAP: dict = {
+    0: "No heart disease",
+    1: "Mild heart disease",
+    2: "Moderate heart disease",
+    3: "Severe heart disease",
+    4: "High-risk heart disease"
+}
+PREDICTION_CACHE_MAX_SIZE: int = 10000
+PREDICTION_CACHE_TTL_SECONDS: float = 3600
+MODEL_VERSION_CHECK_INTERVAL_SECONDS: float = 30
+# opt-in explanations of the JSON endpoints: rows are explained in chunks until the budget is spent, the
+# remaining rows get no explanation
+EXPLANATION_LATENCY_BUDGET_MS: float = 50.0
+EXPLANATION_CHUNK_SIZE: int = 64
+# largest precomputed per-leaf SHAP table of a CatBoost model, larger models use CatBoost's ShapValues
+EXPLANATION_MAX_TABLE_MB: float = 256.0
+# one of: full, compact (the model of the compaction stage, for weak CPUs), numpy (the CatBoost model scored by
+# the NumPy oblivious tree evaluator)
+SERVING_MODEL_VARIANT: str = "full"
+# synthetic rows of config/schema.yaml run through the prediction paths before the app reports ready and before a
+# refreshed model is swapped in, scored as one batch and then row by row for the first single row calls
+MODEL_WARM_UP_ROWS: int = 256
+MODEL_WARM_UP_SINGLE_ROW_CALLS: int = 16
+MODEL_WARM_UP_RANDOM_STATE: int = 0
+# a failed startup warm-up (e.g. registry not reachable) is retried at this interval, the app stays not ready
+MODEL_WARM_UP_RETRY_INTERVAL_SECONDS: float = 5
+
+
+"""
+Upload scoring related constant start with UPLOAD_SCORING VAR NAME, CSV / Parquet files scored in fixed-size
+chunks while they are uploaded
+"""
+UPLOAD_SCORING_CHUNK_ROWS: int = 5000
+# one of: ndjson, csv
+UPLOAD_SCORING_OUTPUT_FORMAT: str = "ndjson"
+UPLOAD_SCORING_FILE_FIELD_NAME: str = "file"
+# echoed in the predictions when the upload has it, predictions are always numbered by their row
+UPLOAD_SCORING_ID_COLUMN: str = "id"
+UPLOAD_SCORING_MAX_HEADER_BYTES: int = 64 * 1024
+# largest piece a compressed upload is inflated into at once, bounds the memory of highly compressible files
+UPLOAD_SCORING_MAX_INFLATE_BYTES: int = 1024 * 1024
+UPLOAD_SCORING_GZIP_LEVEL: int = 6
+# Parquet keeps its schema in the footer, uploads are spooled to a temporary file in this directory (system
+# temporary directory when None) before they are read
+UPLOAD_SCORING_SPOOL_DIR: str = None
+
+
+"""
+Arrow scoring related constant start with ARROW_SCORING VAR NAME, Arrow IPC stream bodies scored column by
+column and answered with an Arrow record batch
+"""
+ARROW_SCORING_MEDIA_TYPE: str = "application/vnd.apache.arrow.stream"
+# echoed in the predictions when the request has it
+ARROW_SCORING_ID_COLUMN: str = "id"
+# IPC buffer compression of the response, one of: None, lz4, zstd
+ARROW_SCORING_COMPRESSION: str = None
+ARROW_SCORING_MAX_BODY_BYTES: int = 256 * 1024 * 1024
+
+
+"""
+Batch prediction related constant start with BATCH_PREDICTION VAR NAME, offline scoring of files or a Mongo
+query with the registry model in a pool of worker processes
+"""
+BATCH_PREDICTION_CHUNK_SIZE: int = 20000
+BATCH_PREDICTION_WORKERS: int = 4
+# threads of the model inside a worker, the workers already use the cores
+BATCH_PREDICTION_WORKER_THREADS: int = 1
+BATCH_PREDICTION_ID_COLUMN: str = "id"
+BATCH_PREDICTION_OUTPUT_COLLECTION_NAME: str = "cvd_predictions"
+BATCH_PREDICTION_PARQUET_COMPRESSION: str = "zstd"
+
+
+"""
+Prefork server related constant start with PREFORK VAR NAME, a master process loading the model once and
+forking the app workers so that they share its memory copy-on-write
+"""
+# a single process without a master when 1
+PREFORK_WORKERS: int = 1
+# a worker that has not started serving in this time is stopped, a reload keeps the previous workers
+PREFORK_WORKER_READY_TIMEOUT_SECONDS: float = 120
+# time a stopped worker gets to finish its requests before it is killed
+PREFORK_GRACEFUL_TIMEOUT_SECONDS: float = 30
+# per-worker memory is logged by the master at this interval, 0 disables it
+PREFORK_MEMORY_REPORT_INTERVAL_SECONDS: float = 300
+
+
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
\ No newline at end of file
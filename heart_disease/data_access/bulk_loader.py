@@ -0,0 +1,236 @@
+"""
+Bulk loader for seeding and refreshing the cvd_data collection from CSV / Parquet files.
+
+    python -m heart_disease.data_access.bulk_loader notebook/heart_disease_uci.csv
+    python -m heart_disease.data_access.bulk_loader data/*.parquet --mode upsert --workers 8
+    python -m heart_disease.data_access.bulk_loader notebook/heart_disease_uci.csv --mongomock
+
+Files are streamed in chunks, every chunk is written by a worker thread with an unordered
+insert_many (mode insert) or an unordered bulk_write of upserts keyed on --key (mode upsert).
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, Optional
+
+import pandas as pd
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from heart_disease.constants import (BULK_LOADER_BATCH_SIZE, BULK_LOADER_INDEX_FIELDS, BULK_LOADER_KEY,
+                                     BULK_LOADER_WORKERS, DATA_INGESTION_COLLECTION_NAME, DATABASE_NAME)
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+LOAD_MODES = ("insert", "upsert")
+
+
+def iter_file_chunks(file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    stream a CSV or Parquet file as DataFrames of at most chunk_size rows
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif extension in (".csv", ".gz"):
+        yield from pd.read_csv(file_path, chunksize=chunk_size)
+    else:
+        raise ValueError(f"Unsupported file type '{extension}' of {file_path}, expected .csv or .parquet")
+
+
+def chunk_to_records(chunk: pd.DataFrame) -> List[dict]:
+    """
+    convert a chunk into BSON-encodable documents: numpy scalars become python scalars and missing values null
+    """
+    return chunk.astype(object).where(chunk.notna(), None).to_dict(orient="records")
+
+
+class BulkLoader:
+    """
+    Writes record chunks into a collection from a pool of worker threads.
+    The collection is injected so the loader runs against Atlas, a local mongod or a mongomock stand-in.
+    """
+
+    def __init__(self, collection, mode: str = "insert", key: str = BULK_LOADER_KEY,
+                 batch_size: int = BULK_LOADER_BATCH_SIZE, n_workers: int = BULK_LOADER_WORKERS):
+        """
+        :param collection: pymongo (or mongomock) collection to load into
+        :param mode: insert appends documents, upsert replaces documents with the same key
+        :param key: field identifying a record for upserts
+        :param batch_size: rows per chunk and per write
+        :param n_workers: concurrent writes
+        """
+        try:
+            if mode not in LOAD_MODES:
+                raise Exception(f"Unknown load mode '{mode}', expected one of {LOAD_MODES}")
+            self.collection = collection
+            self.mode = mode
+            self.key = key
+            self.batch_size = batch_size
+            self.n_workers = max(1, n_workers)
+            self._lock = threading.Lock()
+            self._counts = {}
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def create_indexes(self, fields: List[str] = BULK_LOADER_INDEX_FIELDS) -> List[str]:
+        """
+        Method Name :   create_indexes
+        Description :   This method creates the indexes ingestion filters on, the upsert key index is unique
+
+        Output      :   names of the created indexes
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            names = []
+            for field in fields:
+                names.append(self.collection.create_index([(field, ASCENDING)], unique=(field == self.key),
+                                                          background=True))
+            logging.info(f"Created indexes {names} on {self.collection.name}")
+            return names
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def _add_counts(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] = self._counts.get(name, 0) + value
+
+    def write_chunk(self, chunk: pd.DataFrame) -> None:
+        """
+        write one chunk with an unordered insert_many or bulk_write, duplicate key errors of inserts are counted
+        and skipped instead of aborting the load
+        """
+        records = chunk_to_records(chunk)
+        if not records:
+            return
+        if self.mode == "insert":
+            try:
+                result = self.collection.insert_many(records, ordered=False)
+                self._add_counts(inserted=len(result.inserted_ids))
+            except BulkWriteError as e:
+                details = e.details
+                self._add_counts(inserted=details.get("nInserted", 0), errors=len(details.get("writeErrors", [])))
+        else:
+            requests = [ReplaceOne({self.key: record[self.key]}, record, upsert=True) for record in records]
+            try:
+                result = self.collection.bulk_write(requests, ordered=False)
+                self._add_counts(upserted=result.upserted_count, modified=result.modified_count,
+                                 matched=result.matched_count)
+            except BulkWriteError as e:
+                details = e.details
+                self._add_counts(upserted=details.get("nUpserted", 0), modified=details.get("nModified", 0),
+                                 matched=details.get("nMatched", 0), errors=len(details.get("writeErrors", [])))
+            except TypeError:
+                # stand-ins such as mongomock do not accept the write models of newer pymongo releases
+                for record in records:
+                    result = self.collection.replace_one({self.key: record[self.key]}, record, upsert=True)
+                    self._add_counts(upserted=int(result.upserted_id is not None),
+                                     modified=result.modified_count, matched=result.matched_count)
+
+    def load(self, file_paths: List[str]) -> dict:
+        """
+        Method Name :   load
+        Description :   This method streams the files in chunks and writes the chunks concurrently, at most
+                        2 * n_workers chunks are held in memory at a time
+
+        Output      :   throughput report
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info(f"Entered load method of BulkLoader class with {len(file_paths)} files")
+        try:
+            self._counts = {}
+            rows = 0
+            chunks = 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                pending = set()
+                for file_path in file_paths:
+                    for chunk in iter_file_chunks(file_path, self.batch_size):
+                        if len(pending) >= 2 * self.n_workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        pending.add(executor.submit(self.write_chunk, chunk))
+                        rows += len(chunk)
+                        chunks += 1
+                for future in pending:
+                    future.result()
+            seconds = time.perf_counter() - start
+
+            report = {
+                "collection": self.collection.name,
+                "mode": self.mode,
+                "files": len(file_paths),
+                "rows": rows,
+                "chunks": chunks,
+                "workers": self.n_workers,
+                "batch_size": self.batch_size,
+                **{name: self._counts.get(name, 0)
+                   for name in ("inserted", "upserted", "matched", "modified", "errors")},
+                "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+            }
+            logging.info(f"Bulk load report: {report}")
+            return report
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+
+def get_collection(database_name: str, collection_name: str, mongo_url: Optional[str] = None,
+                   use_mongomock: bool = False):
+    if use_mongomock:
+        import mongomock
+
+        return mongomock.MongoClient()[database_name][collection_name]
+    if mongo_url:
+        import pymongo
+
+        return pymongo.MongoClient(mongo_url)[database_name][collection_name]
+    from heart_disease.configuration.mongo_db_connection import MongoDBClient
+
+    return MongoDBClient(database_name=database_name).database[collection_name]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load CSV / Parquet files into the heart disease collection")
+    parser.add_argument("files", nargs="+", help="CSV or Parquet files to load")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--collection", default=DATA_INGESTION_COLLECTION_NAME)
+    parser.add_argument("--mode", choices=LOAD_MODES, default="insert",
+                        help="insert appends documents, upsert refreshes documents with the same --key")
+    parser.add_argument("--key", default=BULK_LOADER_KEY)
+    parser.add_argument("--batch-size", type=int, default=BULK_LOADER_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=BULK_LOADER_WORKERS)
+    parser.add_argument("--no-indexes", action="store_true", help="skip index creation")
+    parser.add_argument("--mongo-url", default=None, help="e.g. mongodb://localhost:27017, defaults to the Atlas cluster")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="load into an in-memory mongomock collection (measures parsing and batching only)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    collection = get_collection(args.database, args.collection, mongo_url=args.mongo_url,
+                                use_mongomock=args.mongomock)
+    loader = BulkLoader(collection, mode=args.mode, key=args.key, batch_size=args.batch_size,
+                        n_workers=args.workers)
+    if not args.no_indexes:
+        loader.create_indexes()
+    report = loader.load(args.files)
+
+    print(f"Loaded {report['rows']} rows from {report['files']} files into {args.database}.{args.collection} "
+          f"in {report['seconds']:.2f}s ({report['rows_per_second']:,.0f} rows/s, {report['workers']} workers)")
+    print(f"  inserted={report['inserted']} upserted={report['upserted']} matched={report['matched']} "
+          f"modified={report['modified']} errors={report['errors']}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
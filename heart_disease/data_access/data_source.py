@@ -0,0 +1,217 @@
+import glob
+from contextlib import closing
+import os
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from heart_disease.constants import SCHEMA_FILE_PATH
+from heart_disease.data_access.bulk_loader import iter_file_chunks
+from heart_disease.entity.config_entity import DataIngestionConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import read_yaml_file
+
+DATA_SOURCE_TYPES = ("mongo", "file", "sqlite")
+
+
+class DataSource(ABC):
+    """
+    Streams the heart disease records as typed DataFrame batches. Numerical schema columns are numeric,
+    boolean categoricals (fbs, exang) are booleans and "na" markers are missing values, whatever the storage.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+        self._numerical_columns = schema_config["numerical_columns"]
+        self._boolean_columns = [column for column, values in schema_config.get("categorical_values", {}).items()
+                                 if all(isinstance(value, bool) for value in values)]
+
+    @abstractmethod
+    def iter_raw_batches(self) -> Iterator[pd.DataFrame]:
+        """
+        yield the records as DataFrames of at most batch_size rows, as read from the storage
+        """
+
+    def apply_schema_types(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.replace({"na": np.nan})
+        for column in self._numerical_columns:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+        for column in self._boolean_columns:
+            # SQLite and CSV round trips store booleans as 0 / 1 or "True" / "False"
+            if column in df.columns and df[column].dtype != bool:
+                df[column] = df[column].map({True: True, False: False, "True": True, "False": False,
+                                             "TRUE": True, "FALSE": False, "true": True, "false": False}).astype(object)
+        return df
+
+    def iter_raw_batches_since(self, column: str, watermark) -> Iterator[pd.DataFrame]:
+        """
+        yield the raw batches of the records whose column is greater than watermark,
+        sources that can filter in the storage override this
+        """
+        for batch in self.iter_raw_batches():
+            batch = batch[pd.to_numeric(batch[column], errors="coerce") > watermark]
+            if not batch.empty:
+                yield batch
+
+    def iter_batches(self, column: Optional[str] = None, watermark=None) -> Iterator[pd.DataFrame]:
+        """
+        yield typed DataFrame batches of the records, only those with column greater than watermark
+        when a watermark is given
+        """
+        try:
+            raw_batches = self.iter_raw_batches() if watermark is None else \
+                self.iter_raw_batches_since(column, watermark)
+            for batch in raw_batches:
+                yield self.apply_schema_types(batch)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def read_dataframe(self) -> pd.DataFrame:
+        """
+        Method Name :   read_dataframe
+        Description :   This method reads every record of the source into one typed DataFrame
+
+        Output      :   DataFrame of the records
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            batches = list(self.iter_batches())
+            if not batches:
+                return pd.DataFrame()
+            return batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def read_dataframe_since(self, column: str, watermark) -> pd.DataFrame:
+        """
+        Method Name :   read_dataframe_since
+        Description :   This method reads the records added after the last training run, those whose
+                        watermark column (an increasing record id) is greater than watermark
+
+        Output      :   DataFrame of the new records
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            batches = list(self.iter_batches(column=column, watermark=watermark))
+            if not batches:
+                return pd.DataFrame()
+            return batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+
+class MongoDataSource(DataSource):
+    """
+    Records of a Mongo collection. read_dataframe uses the parallel _id-range export of HeartdiseaseData,
+    iter_batches a single cursor.
+    """
+
+    def __init__(self, collection_name: str, database=None, batch_size: int = 10000, n_partitions: int = 1,
+                 min_partition_rows: int = 50000):
+        super().__init__(batch_size)
+        from heart_disease.data_access.heartdisease_data import HeartdiseaseData
+
+        self.collection_name = collection_name
+        self.n_partitions = n_partitions
+        self.min_partition_rows = min_partition_rows
+        self.heartdisease_data = HeartdiseaseData(database=database)
+
+    def iter_raw_batches(self, query: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+        collection = self.heartdisease_data.database[self.collection_name]
+        documents = []
+        for document in collection.find(query or {}, projection={"_id": 0}, batch_size=self.batch_size):
+            documents.append(document)
+            if len(documents) == self.batch_size:
+                yield pd.DataFrame(documents)
+                documents = []
+        if documents:
+            yield pd.DataFrame(documents)
+
+    def iter_raw_batches_since(self, column: str, watermark) -> Iterator[pd.DataFrame]:
+        # served by the index on the watermark column created by the bulk loader
+        return self.iter_raw_batches(query={column: {"$gt": watermark}})
+
+    def read_dataframe(self) -> pd.DataFrame:
+        try:
+            dataframe = self.heartdisease_data.export_collection_as_dataframe(
+                collection_name=self.collection_name, n_partitions=self.n_partitions,
+                batch_size=self.batch_size, min_partition_rows=self.min_partition_rows)
+            return self.apply_schema_types(dataframe)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+
+class FileDataSource(DataSource):
+    """
+    Records of a CSV / Parquet file or of every CSV / Parquet file of a directory
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        super().__init__(batch_size)
+        self.path = path
+
+    def get_file_paths(self) -> List[str]:
+        if os.path.isdir(self.path):
+            file_paths = sorted(glob.glob(os.path.join(self.path, "*.parquet")) +
+                                glob.glob(os.path.join(self.path, "*.csv")))
+        else:
+            file_paths = [self.path]
+        if not file_paths or not all(os.path.exists(file_path) for file_path in file_paths):
+            raise Exception(f"No CSV or Parquet files found at {self.path}")
+        return file_paths
+
+    def iter_raw_batches(self) -> Iterator[pd.DataFrame]:
+        for file_path in self.get_file_paths():
+            yield from iter_file_chunks(file_path, self.batch_size)
+
+
+class SQLiteDataSource(DataSource):
+    """
+    Records of a table of a SQLite database file
+    """
+
+    def __init__(self, database_path: str, table_name: str, batch_size: int = 10000):
+        super().__init__(batch_size)
+        if not os.path.exists(database_path):
+            raise Exception(f"SQLite database {database_path} does not exist")
+        self.database_path = database_path
+        self.table_name = table_name
+
+    def iter_raw_batches(self) -> Iterator[pd.DataFrame]:
+        with closing(sqlite3.connect(self.database_path)) as connection:
+            yield from pd.read_sql_query(f'SELECT * FROM "{self.table_name}"', connection, chunksize=self.batch_size)
+
+    def iter_raw_batches_since(self, column: str, watermark) -> Iterator[pd.DataFrame]:
+        with closing(sqlite3.connect(self.database_path)) as connection:
+            yield from pd.read_sql_query(f'SELECT * FROM "{self.table_name}" WHERE "{column}" > ?', connection,
+                                         params=(watermark,), chunksize=self.batch_size)
+
+
+def get_data_source(data_ingestion_config: DataIngestionConfig, database=None) -> DataSource:
+    """
+    create the data source selected by data_ingestion_config.data_source_type
+    :param database: pymongo (or mongomock) database of the mongo source, defaults to the database of MongoDBClient
+    """
+    try:
+        source_type = data_ingestion_config.data_source_type
+        batch_size = data_ingestion_config.export_batch_size
+        logging.info(f"Using {source_type} data source")
+        if source_type == "mongo":
+            return MongoDataSource(collection_name=data_ingestion_config.collection_name, database=database,
+                                   batch_size=batch_size, n_partitions=data_ingestion_config.export_partitions,
+                                   min_partition_rows=data_ingestion_config.export_min_partition_rows)
+        if source_type == "file":
+            return FileDataSource(path=data_ingestion_config.data_source_path, batch_size=batch_size)
+        if source_type == "sqlite":
+            return SQLiteDataSource(database_path=data_ingestion_config.data_source_path,
+                                    table_name=data_ingestion_config.collection_name, batch_size=batch_size)
+        raise Exception(f"Unknown data source type '{source_type}', expected one of {DATA_SOURCE_TYPES}")
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
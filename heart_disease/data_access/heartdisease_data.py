@@ -1,11 +1,19 @@
 from heart_disease.configuration.mongo_db_connection import MongoDBClient
-from heart_disease.constants import DATABASE_NAME
+from heart_disease.constants import DATABASE_NAME, SCHEMA_FILE_PATH
 from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import read_yaml_file
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import sys
-from typing import Optional
+from typing import Dict, List, Optional
 import numpy as np
 
+try:
+    from pymongoarrow.api import find_arrow_all
+except ImportError:
+    find_arrow_all = None
+
 
 
 class HeartdiseaseData:
@@ -13,30 +21,118 @@ class HeartdiseaseData:
     This class help to export entire mongo db record as pandas dataframe
     """
 
-    def __init__(self):
+    def __init__(self, database=None):
         """
+        :param database: pymongo (or mongomock) database to read from, defaults to the database of MongoDBClient
         """
         try:
-            self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
+            if database is None:
+                self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
+                database = self.mongo_client.database
+            self.database = database
+            self._numerical_columns = set(read_yaml_file(file_path=SCHEMA_FILE_PATH)["numerical_columns"])
         except Exception as e:
             raise HeartdieseaseException(e,sys)
-        
 
-    def export_collection_as_dataframe(self,collection_name:str,database_name:Optional[str]=None)->pd.DataFrame:
+
+    def get_id_partitions(self, collection, n_partitions: int, min_partition_rows: int) -> List[dict]:
+        """
+        split the collection into contiguous _id ranges of roughly equal size
+        return list of find() filters that together cover the whole collection
+        """
+        n_partitions = min(n_partitions, collection.estimated_document_count() // max(min_partition_rows, 1))
+        if n_partitions <= 1:
+            return [{}]
+
+        try:
+            buckets = list(collection.aggregate(
+                [{"$bucketAuto": {"groupBy": "$_id", "buckets": n_partitions}}], allowDiskUse=True))
+            boundaries = [bucket["_id"]["min"] for bucket in buckets[1:]]
+        except NotImplementedError:
+            # servers / stand-ins without $bucketAuto: walk the _id index
+            step = collection.estimated_document_count() // n_partitions
+            boundaries = []
+            for i in range(1, n_partitions):
+                document = next(iter(collection.find({}, {"_id": 1}).sort("_id", 1).skip(i * step).limit(1)), None)
+                if document is not None:
+                    boundaries.append(document["_id"])
+
+        if not boundaries:
+            return [{}]
+        queries = [{"_id": {"$lt": boundaries[0]}}]
+        queries += [{"_id": {"$gte": low, "$lt": high}} for low, high in zip(boundaries[:-1], boundaries[1:])]
+        queries.append({"_id": {"$gte": boundaries[-1]}})
+        return queries
+
+
+    def read_partition(self, collection, query: dict, batch_size: int) -> Dict[str, np.ndarray]:
+        """
+        read one _id range with its own cursor and decode it into one typed array per column
+        numerical columns become int64 / float64 arrays, everything else object arrays
+        """
+        if find_arrow_all is not None:
+            table = find_arrow_all(collection, query, projection={"_id": 0}, batch_size=batch_size)
+            columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+        else:
+            columns: Dict[str, list] = {}
+            n_rows = 0
+            for document in collection.find(query, projection={"_id": 0}, batch_size=batch_size):
+                for key, value in document.items():
+                    column = columns.get(key)
+                    if column is None:
+                        column = columns[key] = [None] * n_rows
+                    column.append(value)
+                n_rows += 1
+                if len(document) != len(columns):
+                    for column in columns.values():
+                        if len(column) < n_rows:
+                            column.append(None)
+
+        typed_columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=object) if not isinstance(values, np.ndarray) else values
+            if name in self._numerical_columns:
+                values = pd.to_numeric(values, errors="coerce")
+            typed_columns[name] = values
+        return typed_columns
+
+
+    def export_collection_as_dataframe(self,collection_name:str,database_name:Optional[str]=None,
+                                       n_partitions:int=1,batch_size:int=10000,
+                                       min_partition_rows:int=50000)->pd.DataFrame:
         try:
             """
             export entire collectin as dataframe:
+            the collection is split into _id ranges, each range is read by its own cursor in a thread pool
+            and the typed column arrays of the partitions are concatenated once per column
             return pd.DataFrame of collection
             """
             if database_name is None:
-                collection = self.mongo_client.database[collection_name]
+                collection = self.database[collection_name]
             else:
-                collection = self.mongo_client[database_name][collection_name]
+                collection = self.database.client[database_name][collection_name]
+
+            queries = self.get_id_partitions(collection, n_partitions=n_partitions,
+                                             min_partition_rows=min_partition_rows)
+            logging.info(f"Exporting collection {collection_name} with {len(queries)} parallel cursors")
+
+            if len(queries) == 1:
+                partitions = [self.read_partition(collection, queries[0], batch_size)]
+            else:
+                with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                    partitions = list(executor.map(lambda query: self.read_partition(collection, query, batch_size),
+                                                   queries))
+
+            column_names = list(dict.fromkeys(name for partition in partitions for name in partition))
+            data = {}
+            for name in column_names:
+                arrays = [partition[name] if name in partition
+                          else np.full(len(next(iter(partition.values()), [])), np.nan, dtype=object)
+                          for partition in partitions]
+                data[name] = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+            df = pd.DataFrame(data, copy=False)
 
-            df = pd.DataFrame(list(collection.find()))
-            if "_id" in df.columns.to_list():
-                df = df.drop(columns=["_id"], axis=1)
             df.replace({"na":np.nan},inplace=True)
             return df
         except Exception as e:
-            raise HeartdieseaseException(e,sys)
\ No newline at end of file
+            raise HeartdieseaseException(e,sys)
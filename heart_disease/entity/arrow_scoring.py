@@ -0,0 +1,136 @@
+from typing import Dict, Optional, Tuple, get_args
+
+import numpy as np
+
+from heart_disease.constants import HEART_DISEASE_STATUS_MAP
+from heart_disease.entity.config_entity import ArrowScoringConfig
+
+
+class ArrowRequestDecoder:
+    """
+    Maps the columns of an Arrow IPC stream body onto the input arrays of HeartDiseaseModel, the same one array
+    per input field as the typed JSON API. The stream is read in place from the request body: a numeric column
+    without nulls is a NumPy view of the body when the stream has one record batch (concatenated otherwise),
+    booleans are unpacked from their bitmap and dictionary encoded categories are expanded from their
+    dictionary. The optional cohort column routes a row to the model of its source site and the optional id
+    column is returned as it is, to be echoed in the predictions.
+    """
+
+    def __init__(self, field_types: Dict[str, object],
+                 arrow_scoring_config: ArrowScoringConfig = ArrowScoringConfig()):
+        """
+        :param field_types: python type of every input field, from get_field_types
+        :param arrow_scoring_config: id and cohort columns of the requests
+        """
+        self.field_types = field_types
+        self.arrow_scoring_config = arrow_scoring_config
+
+    @staticmethod
+    def read_table(body):
+        """
+        Reads the record batches of an IPC stream without copying their buffers out of the body.
+        Raises ValueError when the body is not an Arrow IPC stream
+        """
+        import pyarrow as pa
+
+        try:
+            with pa.ipc.open_stream(pa.py_buffer(body)) as reader:
+                return reader.read_all()
+        except (pa.ArrowInvalid, OSError) as e:
+            raise ValueError(f"Invalid Arrow IPC stream: {e}")
+
+    def decode(self, body) -> Tuple[Dict[str, np.ndarray], Optional[object], int]:
+        """
+        Returns one array per input field (and the cohort column when the stream has it), the id column (None
+        when the stream has none) and the number of rows.
+        Raises ValueError on a missing column, a missing value or a value of the wrong type
+        """
+        table = self.read_table(body)
+        missing = [field for field in self.field_types if field not in table.column_names]
+        if missing:
+            raise ValueError(f"Missing input columns: {', '.join(missing)}")
+        columns = {field: self._to_array(field, table.column(field), field_type)
+                   for field, field_type in self.field_types.items()}
+        cohort_column = self.arrow_scoring_config.cohort_column
+        if cohort_column in table.column_names:
+            columns[cohort_column] = self._to_array(cohort_column, table.column(cohort_column), str,
+                                                    allow_nulls=True)
+        id_column = self.arrow_scoring_config.id_column
+        ids = table.column(id_column).combine_chunks() if id_column in table.column_names else None
+        return columns, ids, table.num_rows
+
+    @staticmethod
+    def _to_array(field: str, column, field_type, allow_nulls: bool = False) -> np.ndarray:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if column.null_count and not allow_nulls:
+            raise ValueError(f"Column {field} has {column.null_count} missing values")
+        array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+        if field_type is float:
+            if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+                raise ValueError(f"Column {field} must be numeric, got {array.type}")
+            return array.to_numpy(zero_copy_only=True)
+        if field_type is bool:
+            if not pa.types.is_boolean(array.type):
+                raise ValueError(f"Column {field} must be boolean, got {array.type}")
+            return array.to_numpy(zero_copy_only=False).astype(object)
+
+        if pa.types.is_dictionary(array.type):
+            value_type = array.type.value_type
+            dictionary = np.asarray(array.dictionary.to_pylist() + [None], dtype=object)
+            indices = array.indices.fill_null(len(dictionary) - 1).to_numpy(zero_copy_only=False)
+            values = dictionary[indices]
+            used_values = dictionary[np.unique(indices)]
+        else:
+            value_type = array.type
+            values = array.to_numpy(zero_copy_only=False)
+            used_values = pc.unique(array).to_pylist()
+        if not (pa.types.is_string(value_type) or pa.types.is_large_string(value_type)):
+            raise ValueError(f"Column {field} must be a string or dictionary of strings, got {array.type}")
+        categories = get_args(field_type)
+        if categories:
+            unknown = sorted(value for value in used_values if value is not None and value not in categories)
+            if unknown:
+                raise ValueError(f"Column {field} has values not in {list(categories)}: {unknown[:5]}")
+        return values
+
+
+def encode_prediction_batch(predictions: np.ndarray, probabilities: np.ndarray, classes: np.ndarray,
+                            risk_scores: np.ndarray, ids=None,
+                            arrow_scoring_config: ArrowScoringConfig = ArrowScoringConfig()):
+    """
+    Serializes the scores of HeartDiseaseClassifier.score_columns as an Arrow IPC stream of one record batch
+    with the id (when given), prediction, status, probability_<class> and risk_score columns, in the same
+    names as the JSON predictions. The numeric columns are handed to Arrow without copies, the status is
+    dictionary encoded. Returns a pyarrow Buffer
+    """
+    import pyarrow as pa
+
+    names, arrays = [], []
+    if ids is not None:
+        names.append(arrow_scoring_config.id_column)
+        arrays.append(ids)
+
+    classes = np.asarray(classes)
+    order = np.argsort(classes)
+    status_indices = order[np.searchsorted(classes, predictions, sorter=order)].astype(np.int32)
+    statuses = pa.array([HEART_DISEASE_STATUS_MAP.get(int(label), "Unknown") for label in classes])
+    names += ["prediction", "status"]
+    arrays += [pa.array(np.asarray(predictions)), pa.DictionaryArray.from_arrays(status_indices, statuses)]
+
+    # one contiguous row per class, so that every probability column is a view
+    class_probabilities = np.ascontiguousarray(np.asarray(probabilities, dtype=np.float64).T)
+    for label, values in zip(classes, class_probabilities):
+        names.append(f"probability_{label}")
+        arrays.append(pa.array(values))
+    names.append("risk_score")
+    arrays.append(pa.array(np.asarray(risk_scores, dtype=np.float64)))
+
+    batch = pa.RecordBatch.from_arrays(arrays, names=names)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=arrow_scoring_config.compression)
+    with pa.ipc.new_stream(sink, batch.schema, options=options) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue()
@@ -1,10 +1,14 @@
 from dataclasses import dataclass
+from typing import List, Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path:str 
     test_file_path:str 
+    # largest value of the watermark column among the ingested records
+    watermark:Optional[float] = None
+    n_rows:Optional[int] = None
 
 @dataclass
 class DataValidationArtifact:
@@ -17,6 +21,9 @@ class DataTransformationArtifact:
     transformed_object_file_path:str 
     transformed_train_file_path:str
     transformed_test_file_path:str
+    rebalancing_report_file_path:str
+    transformed_train_sample_weight_file_path:Optional[str] = None
+    transformed_calibration_file_path:Optional[str] = None
 
 @dataclass
 class ClassificationMetricArtifact:
@@ -26,10 +33,40 @@ class ClassificationMetricArtifact:
 
 
 
+@dataclass
+class ModelProfileArtifact:
+    single_row_p50_ms:float
+    single_row_p99_ms:float
+    batch_p50_ms:float
+    batch_p99_ms:float
+    batch_size:int
+    serialized_size_bytes:int
+
+
 @dataclass
 class ModelTrainerArtifact:
     trained_model_file_path:str 
     metric_artifact:ClassificationMetricArtifact
+    tuning_report_file_path:Optional[str] = None
+    model_profile_artifact:Optional[ModelProfileArtifact] = None
+    model_selection_report_file_path:Optional[str] = None
+    numpy_model_file_path:Optional[str] = None
+
+
+@dataclass
+class ModelCompactionArtifact:
+    is_compact_model_created:bool
+    method:str
+    report_file_path:str
+    compact_model_file_path:Optional[str] = None
+
+
+@dataclass
+class IncrementalTrainingArtifact:
+    is_full_retrain_required:bool
+    reason:str
+    report_file_path:str
+    model_trainer_artifact:Optional[ModelTrainerArtifact] = None
 
 
 @dataclass
@@ -38,10 +75,22 @@ class ModelEvaluationArtifact:
     changed_accuracy:float
     blob_model_path:str 
     trained_model_path:str
+    evaluation_report_file_path:str
 
 
 
 @dataclass
 class ModelPusherArtifact:
     blob_name:str
-    blob_model_path:str
\ No newline at end of file
+    blob_model_path:str
+    blob_compact_model_path:Optional[str] = None
+    blob_numpy_model_path:Optional[str] = None
+
+
+@dataclass
+class CohortTrainingArtifact:
+    manifest_file_path:str
+    trained_cohorts:List[str]
+    pushed_cohorts:List[str]
+    skipped_cohorts:List[str]
+    failed_cohorts:List[str]
@@ -1,6 +1,8 @@
 from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
 from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
 from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.utils.single_flight import SingleFlight
 import sys
 from pandas import DataFrame
 
@@ -10,15 +12,24 @@ class HeartDieseaseEstimator:
     This class is used to save and retrieve us_visas model in blobS bucket and to do prediction
     """
 
-    def __init__(self,blob_name,model_path,):
+    def __init__(self,blob_name,model_path,blob_storage:SimpleStorageService=None,fallback_model_path:str=None):
         """
         :param blob_name: Name of your model bucket
         :param model_path: Location of your model in bucket
+        :param blob_storage: storage service of the registry, defaults to the configured storage backend
+        :param fallback_model_path: Location of the model served when model_path is missing, e.g. the full model
+        of a serving variant that the last push did not rebuild
         """
         self.blob_name = blob_name
-        self.blobS = SimpleStorageService()
+        self.blobS = blob_storage if blob_storage is not None else SimpleStorageService()
         self.model_path = model_path
+        self.fallback_model_path = fallback_model_path
         self.loaded_model:HeartDiseaseModel=None
+        # version the loaded (or next loaded) model belongs to, set by invalidate / set_loaded_model
+        self.model_version:str=None
+        # blob path of every version returned by get_model_version, versions of different paths never collide
+        self._version_paths = {}
+        self._single_flight = SingleFlight()
 
 
     def is_model_present(self,model_path):
@@ -28,13 +39,65 @@ class HeartDieseaseEstimator:
             print(e)
             return False
 
+    def get_served_model_path(self) -> str:
+        """
+        model_path, or fallback_model_path when it is set and model_path is not in the blob container
+        """
+        if self.fallback_model_path is None or self.blobS.exists(self.model_path):
+            return self.model_path
+        logging.warning(f"{self.model_path} not found, serving {self.fallback_model_path}")
+        return self.fallback_model_path
+
+    def get_model_version(self) -> str:
+        """
+        Version (ETag) of the served model in the blob container, changes whenever a new model is pushed
+        :return:
+        """
+        model_path = self.get_served_model_path()
+        model_version = self.blobS.get_blob_version(blob_name=model_path)
+        self._version_paths[model_version] = model_path
+        return model_version
+
     def load_model(self,)->HeartDiseaseModel:
         """
         Load the model from the model_path
         :return:
         """
 
-        return self.blobS.load_model(model_name=self.model_path)
+        return self.blobS.load_model(model_name=self._version_paths.get(self.model_version, self.model_path),
+                                     version=self.model_version)
+
+    def _load_version(self, model_version: str) -> HeartDiseaseModel:
+        model = self.blobS.load_model(model_name=self._version_paths.get(model_version, self.model_path),
+                                      version=model_version)
+        # a load that raced with invalidate must not overwrite the newer version
+        if self.model_version == model_version:
+            self.loaded_model = model
+        return model
+
+    def get_loaded_model(self) -> HeartDiseaseModel:
+        """
+        Return the loaded model, loading it on first use. Concurrent callers of a cold or just swapped
+        model share one load per model version, and all of them get its exception if it fails.
+        """
+        model = self.loaded_model
+        if model is not None:
+            return model
+        model_version = self.model_version
+        return self._single_flight.do(model_version, self._load_version, model_version)
+
+    def invalidate(self, model_version: str = None) -> None:
+        """
+        Drop the loaded model, the next prediction loads model_version
+        """
+        self.model_version = model_version
+        self.loaded_model = None
+        self._version_paths = {version: path for version, path in self._version_paths.items()
+                               if version == model_version}
+
+    def set_loaded_model(self, model: HeartDiseaseModel, model_version: str = None) -> None:
+        self.model_version = model_version
+        self.loaded_model = model
 
     def save_model(self,from_file,remove:bool=False)->None:
         """
@@ -52,6 +115,15 @@ class HeartDieseaseEstimator:
         except Exception as e:
             raise HeartdieseaseException(e, sys)
 
+    def remove_model(self)->None:
+        """
+        Delete the model at model_path, e.g. a serving variant that no longer matches the pushed model
+        """
+        try:
+            self.blobS.delete(blob_name=self.model_path, container_name=self.blob_name)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
 
     def predict(self,dataframe:DataFrame):
         """
@@ -59,8 +131,37 @@ class HeartDieseaseEstimator:
         :return:
         """
         try:
-            if self.loaded_model is None:
-                self.loaded_model = self.load_model()
-            return self.loaded_model.predict(dataframe=dataframe)
+            return self.get_loaded_model().predict(dataframe=dataframe)
         except Exception as e:
-            raise HeartdieseaseException(e, sys)
\ No newline at end of file
+            raise HeartdieseaseException(e, sys)
+
+    def predict_with_scores(self,dataframe:DataFrame) -> DataFrame:
+        """
+        :param dataframe:
+        :return: DataFrame with prediction, per-class probabilities and risk_score columns
+        """
+        try:
+            return self.get_loaded_model().predict_with_scores(dataframe=dataframe)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def predict_columns_with_scores(self,columns:dict) -> tuple:
+        """
+        :param columns: raw inputs, one array per input field
+        :return: predicted classes, per-class probabilities, class labels of the probabilities and risk scores
+        """
+        try:
+            return self.get_loaded_model().predict_columns_with_scores(columns=columns)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def explain(self,dataframe:DataFrame,classes=None) -> DataFrame:
+        """
+        :param dataframe:
+        :param classes: class explained per row, the predicted class when None
+        :return: DataFrame with the attributions of the raw input fields and the base_value
+        """
+        try:
+            return self.get_loaded_model().explain(dataframe=dataframe, classes=classes)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
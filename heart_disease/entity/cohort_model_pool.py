@@ -0,0 +1,183 @@
+import pickle
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.entity.config_entity import CohortModelPoolConfig
+from heart_disease.entity.estimator import HeartDiseaseModel
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import cohort_slug
+from heart_disease.utils.single_flight import SingleFlight
+
+
+class CohortModelPool:
+    """
+    In-process pool of the per-cohort registry models, loaded on first request of a cohort and kept as an LRU
+    bounded by a memory budget and a model count. The resident size of a model is estimated by its serialized
+    size. The cohort manifest of the registry is re-read at most once per manifest_check_interval, a cohort
+    whose manifest version changed is reloaded on its next request.
+    """
+
+    def __init__(self, cohort_model_pool_config: CohortModelPoolConfig = CohortModelPoolConfig(),
+                 storage: SimpleStorageService = None):
+        """
+        :param cohort_model_pool_config: memory budget, model count and prefetch configuration of the pool
+        :param storage: storage service of the registry, defaults to the configured storage backend
+        """
+        try:
+            self.cohort_model_pool_config = cohort_model_pool_config
+            self.storage = storage if storage is not None else SimpleStorageService()
+            self._models: OrderedDict = OrderedDict()
+            self._manifest: Dict[str, dict] = {}
+            self._manifest_checked_at: Optional[float] = None
+            self._request_counts: Counter = Counter()
+            self._lock = threading.Lock()
+            self._single_flight = SingleFlight()
+            self.hits = 0
+            self.misses = 0
+            self.loads = 0
+            self.evictions = 0
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @property
+    def manifest_blob_path(self) -> str:
+        return f"{self.cohort_model_pool_config.blob_prefix}/{self.cohort_model_pool_config.manifest_file_name}"
+
+    def _read_manifest(self) -> Dict[str, dict]:
+        blob_name = self.cohort_model_pool_config.blob_name
+        if not self.storage.exists(self.manifest_blob_path, blob_name):
+            return {}
+        manifest = yaml.safe_load(self.storage.read_bytes(self.manifest_blob_path, blob_name).decode("utf-8")) or {}
+        return {cohort_slug(cohort): entry for cohort, entry in (manifest.get("cohorts") or {}).items()}
+
+    def get_manifest(self) -> Dict[str, dict]:
+        """
+        Returns the manifest entry of every cohort with a model in the registry, keyed by cohort slug.
+        A failed read keeps the previous manifest until the next check.
+        """
+        now = time.monotonic()
+        if self._manifest_checked_at is not None and \
+                now - self._manifest_checked_at < self.cohort_model_pool_config.manifest_check_interval:
+            return self._manifest
+        try:
+            self._manifest = self._single_flight.do("manifest", self._read_manifest)
+        except Exception as e:
+            logging.warning(f"Reading the cohort manifest failed: {e}")
+        self._manifest_checked_at = now
+        return self._manifest
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, _, size in self._models.values())
+
+    def _evict(self) -> None:
+        # the most recently used model always stays, even when it alone exceeds the budget
+        memory_budget = self.cohort_model_pool_config.memory_budget_mb * 1024 * 1024
+        while len(self._models) > 1 and (len(self._models) > self.cohort_model_pool_config.max_models or
+                                         self.resident_bytes() > memory_budget):
+            slug, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logging.info(f"Evicted the model of cohort {slug} from the cohort model pool")
+
+    def _load(self, slug: str, entry: dict) -> HeartDiseaseModel:
+        model_data = self.storage.read_bytes(entry["blob_model_path"], self.cohort_model_pool_config.blob_name)
+        model = pickle.loads(model_data)
+        with self._lock:
+            self._models[slug] = (model, entry.get("version"), len(model_data))
+            self._models.move_to_end(slug)
+            self.loads += 1
+            self._evict()
+        logging.info(f"Loaded the model of cohort {slug} ({len(model_data) / (1024 * 1024):.1f} MB)")
+        return model
+
+    def get_model(self, cohort, count_request: bool = True) -> Optional[Tuple[HeartDiseaseModel, str]]:
+        """
+        Returns the model and version of a cohort, None when the registry has no model for it.
+        Concurrent requests of a cohort that is not resident share one load.
+        """
+        try:
+            slug = cohort_slug(cohort)
+            entry = self.get_manifest().get(slug)
+            if entry is None:
+                return None
+
+            version = entry.get("version")
+            with self._lock:
+                if count_request:
+                    self._request_counts[slug] += 1
+                resident = self._models.get(slug)
+                if resident is not None and resident[1] == version:
+                    self._models.move_to_end(slug)
+                    self.hits += 1
+                    return resident[0], version
+                self.misses += 1
+
+            model = self._single_flight.do((slug, version), self._load, slug, entry)
+            return model, version
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def is_resident(self, cohort) -> bool:
+        """
+        Returns whether get_model answers for the cohort without reading the registry: the manifest was checked
+        within manifest_check_interval and the cohort either has no model in it or has its model resident
+        """
+        if self._manifest_checked_at is None or \
+                time.monotonic() - self._manifest_checked_at >= self.cohort_model_pool_config.manifest_check_interval:
+            return False
+        slug = cohort_slug(cohort)
+        entry = self._manifest.get(slug)
+        if entry is None:
+            return True
+        with self._lock:
+            resident = self._models.get(slug)
+        return resident is not None and resident[1] == entry.get("version")
+
+    def get_hottest_cohorts(self, n: int) -> List[str]:
+        """
+        Returns the n cohorts with the most requests, cohorts with more training rows first on a tie
+        (or before any request was served)
+        """
+        manifest = self.get_manifest()
+        with self._lock:
+            request_counts = dict(self._request_counts)
+        return sorted(manifest, key=lambda slug: (request_counts.get(slug, 0), manifest[slug].get("train_rows", 0)),
+                      reverse=True)[:n]
+
+    def prefetch(self, n: Optional[int] = None) -> List[str]:
+        """
+        Load the hottest cohorts ahead of their requests, at most max_models of them. The hottest one is
+        loaded last so it is the last to be evicted.
+        """
+        try:
+            n = self.cohort_model_pool_config.prefetch_count if n is None else n
+            cohorts = self.get_hottest_cohorts(min(n, self.cohort_model_pool_config.max_models))
+            for slug in reversed(cohorts):
+                self.get_model(slug, count_request=False)
+            logging.info(f"Prefetched cohort models: {cohorts}")
+            return cohorts
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cohorts": sorted(self._manifest),
+                "resident_cohorts": list(self._models),
+                "resident_mb": self.resident_bytes() / (1024 * 1024),
+                "memory_budget_mb": self.cohort_model_pool_config.memory_budget_mb,
+                "max_models": self.cohort_model_pool_config.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "request_counts": dict(self._request_counts),
+            }
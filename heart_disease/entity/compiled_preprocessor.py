@@ -0,0 +1,139 @@
+import sys
+from typing import Callable, Dict, List
+
+import numpy as np
+from pandas import DataFrame
+
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+
+def _compile_scaler(scaler) -> Callable[[np.ndarray], np.ndarray]:
+    mean = scaler.mean_ if getattr(scaler, "with_mean", True) else None
+    scale = scaler.scale_ if getattr(scaler, "with_std", True) else None
+
+    def transform(x: np.ndarray) -> np.ndarray:
+        # the same in-place operations as StandardScaler.transform
+        if mean is not None:
+            x -= mean
+        if scale is not None:
+            x /= scale
+        return x
+    return transform
+
+
+def _compile_power_transformer(transformer) -> Callable[[np.ndarray], np.ndarray]:
+    from scipy import stats
+
+    if transformer.method != "yeo-johnson":
+        raise ValueError(f"Unsupported PowerTransformer method {transformer.method}")
+    lambdas = transformer.lambdas_
+    scale = _compile_scaler(transformer._scaler) if transformer.standardize else None
+
+    def transform(x: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            for i, lmbda in enumerate(lambdas):
+                x[:, i] = stats.yeojohnson(x[:, i], lmbda)
+        return scale(x) if scale is not None else x
+    return transform
+
+
+def _compile_encoder(encoder, one_hot: bool) -> Callable[[List[np.ndarray]], np.ndarray]:
+    if getattr(encoder, "drop_idx_", None) is not None:
+        raise ValueError("OneHotEncoder with dropped categories is not supported")
+    codes = [{category: code for code, category in enumerate(categories)} for categories in encoder.categories_]
+    widths = [len(categories) for categories in encoder.categories_]
+
+    def transform(columns: List[np.ndarray]) -> np.ndarray:
+        n_rows = len(columns[0])
+        positions = np.empty((n_rows, len(columns)), dtype=np.int64)
+        for i, (column, column_codes) in enumerate(zip(columns, codes)):
+            try:
+                positions[:, i] = [column_codes[value] for value in column]
+            except KeyError as e:
+                raise ValueError(f"Found unknown category {e} in column {i} during transform")
+        if not one_hot:
+            return positions.astype(np.float64)
+        result = np.zeros((n_rows, sum(widths)))
+        offsets = np.cumsum([0] + widths[:-1])
+        result[np.arange(n_rows)[:, None], positions + offsets] = 1.0
+        return result
+    return transform
+
+
+class CompiledPreprocessor:
+    """
+    The fitted ColumnTransformer of DataTransformation applied on plain column arrays: each fitted step
+    (OneHotEncoder, OrdinalEncoder, PowerTransformer, StandardScaler) is replayed with its fitted parameters and
+    the same floating point operations, without building a DataFrame or running sklearn's input validation.
+    A preprocessor is only compiled when it reproduces ColumnTransformer.transform bit for bit on sample rows.
+    """
+
+    def __init__(self, column_transformer):
+        """
+        :param column_transformer: fitted ColumnTransformer of a HeartDiseaseModel
+        """
+        try:
+            self.n_outputs = max(indices.stop for indices in column_transformer.output_indices_.values())
+            self.steps = []
+            for name, transformer, columns in column_transformer.transformers_:
+                output = column_transformer.output_indices_[name]
+                if transformer == "drop" or output.stop == output.start:
+                    continue
+                steps = [step for _, step in transformer.steps] if hasattr(transformer, "steps") else [transformer]
+                step_names = [step.__class__.__name__ for step in steps]
+                if step_names in (["OneHotEncoder"], ["OrdinalEncoder"]):
+                    function = _compile_encoder(steps[0], one_hot=step_names[0] == "OneHotEncoder")
+                    categorical = True
+                elif all(step_name in ("PowerTransformer", "StandardScaler") for step_name in step_names):
+                    functions = [_compile_power_transformer(step) if step_name == "PowerTransformer"
+                                 else _compile_scaler(step) for step, step_name in zip(steps, step_names)]
+                    function = self._chain(functions)
+                    categorical = False
+                else:
+                    raise ValueError(f"Unsupported transformer {name}: {step_names}")
+                self.steps.append((list(columns), output, function, categorical))
+            self.columns = sorted({column for columns, _, _, _ in self.steps for column in columns})
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def _chain(functions: List[Callable]) -> Callable:
+        def transform(x: np.ndarray) -> np.ndarray:
+            for function in functions:
+                x = function(x)
+            return x
+        return transform
+
+    def transform(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Transforms the raw input columns (one array per input field) into the model inputs
+        """
+        n_rows = len(next(iter(columns.values())))
+        result = np.empty((n_rows, self.n_outputs))
+        for step_columns, output, function, categorical in self.steps:
+            if categorical:
+                values = function([columns[column] for column in step_columns])
+            else:
+                values = function(np.column_stack([np.asarray(columns[column], dtype=np.float64)
+                                                   for column in step_columns]))
+            result[:, output] = values
+        return result
+
+    @classmethod
+    def compile(cls, column_transformer, sample: DataFrame):
+        """
+        Returns the compiled preprocessor, or None when the column transformer has a step that cannot be
+        compiled or the compiled one does not match it exactly on the sample rows
+        """
+        try:
+            preprocessor = cls(column_transformer)
+            expected = np.asarray(column_transformer.transform(sample), dtype=np.float64)
+            columns = {column: sample[column].to_numpy() for column in preprocessor.columns}
+            if not np.array_equal(preprocessor.transform(columns), expected, equal_nan=True):
+                logging.warning("The compiled preprocessor does not match the ColumnTransformer, not using it")
+                return None
+            return preprocessor
+        except Exception as e:
+            logging.warning(f"The preprocessor cannot be compiled, using the ColumnTransformer: {e}")
+            return None
@@ -22,6 +22,12 @@ class DataIngestionConfig:
     testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
     train_test_split_ratio: float = DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO
     collection_name:str = DATA_INGESTION_COLLECTION_NAME
+    export_partitions: int = DATA_INGESTION_EXPORT_PARTITIONS
+    export_batch_size: int = DATA_INGESTION_EXPORT_BATCH_SIZE
+    export_min_partition_rows: int = DATA_INGESTION_EXPORT_MIN_PARTITION_ROWS
+    data_source_type: str = DATA_INGESTION_SOURCE_TYPE
+    data_source_path: str = DATA_INGESTION_SOURCE_PATH
+    watermark_column: str = INCREMENTAL_TRAINING_WATERMARK_COLUMN
 
 
 
@@ -45,6 +51,22 @@ class DataTransformationConfig:
     transformed_object_file_path: str = os.path.join(data_transformation_dir,
                                                      DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
                                                      PREPROCSSING_OBJECT_FILE_NAME)
+    transformed_train_sample_weight_file_path: str = os.path.join(data_transformation_dir,
+                                                                  DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                                                  DATA_TRANSFORMATION_SAMPLE_WEIGHT_FILE_NAME)
+    rebalancing_report_file_path: str = os.path.join(data_transformation_dir,
+                                                     DATA_TRANSFORMATION_REBALANCING_REPORT_FILE_NAME)
+    transformed_calibration_file_path: str = os.path.join(data_transformation_dir,
+                                                          DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                                          DATA_TRANSFORMATION_CALIBRATION_FILE_NAME)
+    # nothing is held out when the risk score is not calibrated
+    calibration_split_ratio: float = (DATA_TRANSFORMATION_CALIBRATION_SPLIT_RATIO if MODEL_TRAINER_CALIBRATE_RISK_SCORE
+                                      else 0.0)
+    rebalancing_strategy: str = DATA_TRANSFORMATION_REBALANCING_STRATEGY
+    smote_k_neighbors: int = DATA_TRANSFORMATION_SMOTE_K_NEIGHBORS
+    neighbors_algorithm: str = DATA_TRANSFORMATION_NEIGHBORS_ALGORITHM
+    rebalancing_n_jobs: int = DATA_TRANSFORMATION_REBALANCING_N_JOBS
+    random_state: int = DATA_TRANSFORMATION_RANDOM_STATE
 
 
 @dataclass
@@ -53,6 +75,62 @@ class ModelTrainerConfig:
     trained_model_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
     expected_accuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    calibrate_risk_score: bool = MODEL_TRAINER_CALIBRATE_RISK_SCORE
+    tuning_report_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TUNING_REPORT_FILE_NAME)
+    fold_cached_tuning: bool = MODEL_TRAINER_FOLD_CACHED_TUNING
+    share_iteration_trials: bool = MODEL_TRAINER_SHARE_ITERATION_TRIALS
+    persist_fold_cache: bool = MODEL_TRAINER_PERSIST_FOLD_CACHE
+    fold_cache_dir: str = MODEL_TRAINER_FOLD_CACHE_DIR
+    model_selection_report_file_path: str = os.path.join(model_trainer_dir, MODEL_SELECTION_REPORT_FILE_NAME)
+    selection_rule: str = MODEL_SELECTION_RULE
+    selection_top_k: int = MODEL_SELECTION_TOP_K
+    latency_budget_ms: float = MODEL_SELECTION_LATENCY_BUDGET_MS
+    size_budget_mb: float = MODEL_SELECTION_SIZE_BUDGET_MB
+    score_tolerance: float = MODEL_SELECTION_SCORE_TOLERANCE
+    latency_calls: int = MODEL_SELECTION_LATENCY_CALLS
+    batch_size: int = MODEL_SELECTION_BATCH_SIZE
+    batch_calls: int = MODEL_SELECTION_BATCH_CALLS
+    export_numpy_model: bool = MODEL_TRAINER_EXPORT_NUMPY_MODEL
+    catboost_json_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                                MODEL_TRAINER_CATBOOST_JSON_FILE_NAME)
+    numpy_model_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                              MODEL_TRAINER_NUMPY_MODEL_FILE_NAME)
+
+
+@dataclass
+class ModelCompactionConfig:
+    model_compaction_dir: str = os.path.join(training_pipeline_config.artifact_dir, MODEL_COMPACTION_DIR_NAME)
+    compact_model_file_path: str = os.path.join(model_compaction_dir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
+    report_file_path: str = os.path.join(model_compaction_dir, MODEL_COMPACTION_REPORT_FILE_NAME)
+    enabled: bool = MODEL_COMPACTION_ENABLED
+    method: str = MODEL_COMPACTION_METHOD
+    max_f1_loss: float = MODEL_COMPACTION_MAX_F1_LOSS
+    tree_fractions: tuple = tuple(MODEL_COMPACTION_TREE_FRACTIONS)
+    student_depth: int = MODEL_COMPACTION_STUDENT_DEPTH
+    student_iterations: int = MODEL_COMPACTION_STUDENT_ITERATIONS
+    student_learning_rate: float = MODEL_COMPACTION_STUDENT_LEARNING_RATE
+    random_state: int = DATA_TRANSFORMATION_RANDOM_STATE
+
+
+@dataclass
+class IncrementalTrainingConfig:
+    incremental_training_dir: str = os.path.join(training_pipeline_config.artifact_dir, INCREMENTAL_TRAINING_DIR_NAME)
+    trained_model_file_path: str = os.path.join(incremental_training_dir, MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                                MODEL_FILE_NAME)
+    catboost_json_file_path: str = os.path.join(incremental_training_dir, MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                                MODEL_TRAINER_CATBOOST_JSON_FILE_NAME)
+    numpy_model_file_path: str = os.path.join(incremental_training_dir, MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                              MODEL_TRAINER_NUMPY_MODEL_FILE_NAME)
+    report_file_path: str = os.path.join(incremental_training_dir, INCREMENTAL_TRAINING_REPORT_FILE_NAME)
+    blob_name: str = MODEL_BLOB_NAME
+    training_state_blob_path: str = INCREMENTAL_TRAINING_STATE_FILE_NAME
+    watermark_column: str = INCREMENTAL_TRAINING_WATERMARK_COLUMN
+    min_rows: int = INCREMENTAL_TRAINING_MIN_ROWS
+    drift_threshold: float = INCREMENTAL_TRAINING_DRIFT_THRESHOLD
+    iterations: int = INCREMENTAL_TRAINING_ITERATIONS
+    rebalancing_strategy: str = INCREMENTAL_TRAINING_REBALANCING_STRATEGY
+    calibration_split_ratio: float = DataTransformationConfig.calibration_split_ratio
+    random_state: int = DATA_TRANSFORMATION_RANDOM_STATE
 
 
 @dataclass
@@ -60,6 +138,11 @@ class ModelEvaluationConfig:
     changed_threshold_score: float = MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE
     blob_name: str = MODEL_BLOB_NAME
     blob_model_key_path: str = MODEL_FILE_NAME
+    model_evaluation_dir: str = os.path.join(training_pipeline_config.artifact_dir, MODEL_EVALUATION_DIR_NAME)
+    evaluation_report_file_path: str = os.path.join(model_evaluation_dir, MODEL_EVALUATION_REPORT_FILE_NAME)
+    bootstrap_rounds: int = MODEL_EVALUATION_BOOTSTRAP_ROUNDS
+    confidence_level: float = MODEL_EVALUATION_CONFIDENCE_LEVEL
+    n_jobs: int = MODEL_EVALUATION_N_JOBS
 
 
 
@@ -68,11 +151,129 @@ class ModelEvaluationConfig:
 class ModelPusherConfig:
     blob_name: str = MODEL_BLOB_NAME
     blob_model_key_path: str = MODEL_FILE_NAME
+    blob_compact_model_key_path: str = MODEL_COMPACTION_BLOB_MODEL_PATH
+    blob_numpy_model_key_path: str = MODEL_TRAINER_NUMPY_MODEL_BLOB_PATH
+
+
+
+
+@dataclass
+class CohortTrainingConfig:
+    cohort_dir: str = os.path.join(training_pipeline_config.artifact_dir, COHORT_DIR_NAME)
+    manifest_file_path: str = os.path.join(cohort_dir, COHORT_MANIFEST_FILE_NAME)
+    cohort_column: str = COHORT_COLUMN
+    train_cohort_models: bool = COHORT_TRAIN_MODELS
+    min_rows: int = COHORT_MIN_ROWS
+    n_jobs: int = COHORT_TRAINING_N_JOBS
+    blob_name: str = MODEL_BLOB_NAME
+    blob_prefix: str = COHORT_MODEL_BLOB_PREFIX
 
 
 
 
 @dataclass
 class HeartDiseasePredictorConfig:
-    model_file_path: str = MODEL_FILE_NAME
-    model_blob_name: str = MODEL_BLOB_NAME
\ No newline at end of file
+    model_file_path: str = {"compact": MODEL_COMPACTION_BLOB_MODEL_PATH,
+                            "numpy": MODEL_TRAINER_NUMPY_MODEL_BLOB_PATH}.get(SERVING_MODEL_VARIANT, MODEL_FILE_NAME)
+    # served when the variant is not in the registry (the last push did not rebuild it)
+    fallback_model_file_path: str = MODEL_FILE_NAME
+    model_blob_name: str = MODEL_BLOB_NAME
+    cache_max_size: int = PREDICTION_CACHE_MAX_SIZE
+    cache_ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS
+    model_version_check_interval: float = MODEL_VERSION_CHECK_INTERVAL_SECONDS
+    cohort_models_enabled: bool = COHORT_MODELS_ENABLED
+    cohort_column: str = COHORT_COLUMN
+    explanation_latency_budget_ms: float = EXPLANATION_LATENCY_BUDGET_MS
+    explanation_chunk_size: int = EXPLANATION_CHUNK_SIZE
+    warm_up_rows: int = MODEL_WARM_UP_ROWS
+    warm_up_single_row_calls: int = MODEL_WARM_UP_SINGLE_ROW_CALLS
+    warm_up_random_state: int = MODEL_WARM_UP_RANDOM_STATE
+    warm_up_retry_interval: float = MODEL_WARM_UP_RETRY_INTERVAL_SECONDS
+
+
+@dataclass
+class UploadScoringConfig:
+    chunk_rows: int = UPLOAD_SCORING_CHUNK_ROWS
+    output_format: str = UPLOAD_SCORING_OUTPUT_FORMAT
+    file_field_name: str = UPLOAD_SCORING_FILE_FIELD_NAME
+    id_column: str = UPLOAD_SCORING_ID_COLUMN
+    cohort_column: str = COHORT_COLUMN
+    max_header_bytes: int = UPLOAD_SCORING_MAX_HEADER_BYTES
+    max_inflate_bytes: int = UPLOAD_SCORING_MAX_INFLATE_BYTES
+    gzip_level: int = UPLOAD_SCORING_GZIP_LEVEL
+    spool_dir: str = UPLOAD_SCORING_SPOOL_DIR
+
+
+@dataclass
+class ArrowScoringConfig:
+    media_type: str = ARROW_SCORING_MEDIA_TYPE
+    id_column: str = ARROW_SCORING_ID_COLUMN
+    cohort_column: str = COHORT_COLUMN
+    compression: str = ARROW_SCORING_COMPRESSION
+    max_body_bytes: int = ARROW_SCORING_MAX_BODY_BYTES
+
+
+@dataclass
+class BatchPredictionConfig:
+    model_file_path: str = HeartDiseasePredictorConfig.model_file_path
+    fallback_model_file_path: str = HeartDiseasePredictorConfig.fallback_model_file_path
+    model_blob_name: str = MODEL_BLOB_NAME
+    chunk_size: int = BATCH_PREDICTION_CHUNK_SIZE
+    n_workers: int = BATCH_PREDICTION_WORKERS
+    worker_threads: int = BATCH_PREDICTION_WORKER_THREADS
+    id_column: str = BATCH_PREDICTION_ID_COLUMN
+    database_name: str = DATABASE_NAME
+    collection_name: str = DATA_INGESTION_COLLECTION_NAME
+    output_collection_name: str = BATCH_PREDICTION_OUTPUT_COLLECTION_NAME
+    parquet_compression: str = BATCH_PREDICTION_PARQUET_COMPRESSION
+
+
+@dataclass
+class ClientManagerConfig:
+    mongo_max_pool_size: int = MONGODB_MAX_POOL_SIZE
+    mongo_min_pool_size: int = MONGODB_MIN_POOL_SIZE
+    mongo_max_idle_time_ms: int = MONGODB_MAX_IDLE_TIME_MS
+    mongo_server_selection_timeout_ms: int = MONGODB_SERVER_SELECTION_TIMEOUT_MS
+    mongo_connect_timeout_ms: int = MONGODB_CONNECT_TIMEOUT_MS
+    mongo_socket_timeout_ms: int = MONGODB_SOCKET_TIMEOUT_MS
+    blob_connection_pool_size: int = BLOB_CONNECTION_POOL_SIZE
+    blob_connection_timeout: int = BLOB_CONNECTION_TIMEOUT_SECONDS
+    blob_read_timeout: int = BLOB_READ_TIMEOUT_SECONDS
+    retry_total: int = CLIENT_RETRY_TOTAL
+    retry_backoff_seconds: float = CLIENT_RETRY_BACKOFF_SECONDS
+    retry_max_backoff_seconds: float = CLIENT_RETRY_MAX_BACKOFF_SECONDS
+    warm_up_mongo: bool = CLIENT_WARM_UP_MONGO
+    warm_up_blob: bool = CLIENT_WARM_UP_BLOB
+
+
+@dataclass
+class StorageConfig:
+    backend_type: str = STORAGE_BACKEND_TYPE
+    container_name: str = STORAGE_ACCOUNT_CONTAINER
+    local_root_dir: str = STORAGE_LOCAL_ROOT_DIR
+    injected_latency_seconds: float = STORAGE_INJECTED_LATENCY_SECONDS
+    injected_jitter_seconds: float = STORAGE_INJECTED_JITTER_SECONDS
+    injected_tail_probability: float = STORAGE_INJECTED_TAIL_PROBABILITY
+    injected_tail_latency_seconds: float = STORAGE_INJECTED_TAIL_LATENCY_SECONDS
+
+
+@dataclass
+class CohortModelPoolConfig:
+    blob_name: str = MODEL_BLOB_NAME
+    blob_prefix: str = COHORT_MODEL_BLOB_PREFIX
+    manifest_file_name: str = COHORT_MANIFEST_FILE_NAME
+    memory_budget_mb: float = COHORT_POOL_MEMORY_BUDGET_MB
+    max_models: int = COHORT_POOL_MAX_MODELS
+    prefetch_count: int = COHORT_POOL_PREFETCH_COUNT
+    manifest_check_interval: float = MODEL_VERSION_CHECK_INTERVAL_SECONDS
+
+
+@dataclass
+class PreforkServerConfig:
+    host: str = APP_HOST
+    port: int = APP_PORT
+    n_workers: int = PREFORK_WORKERS
+    worker_ready_timeout: float = PREFORK_WORKER_READY_TIMEOUT_SECONDS
+    graceful_timeout: float = PREFORK_GRACEFUL_TIMEOUT_SECONDS
+    model_version_check_interval: float = MODEL_VERSION_CHECK_INTERVAL_SECONDS
+    memory_report_interval: float = PREFORK_MEMORY_REPORT_INTERVAL_SECONDS
@@ -1,8 +1,12 @@
 import sys
+from typing import Dict, Optional
 
+import numpy as np
 from pandas import DataFrame
 from sklearn.pipeline import Pipeline
 
+from heart_disease.entity.compiled_preprocessor import CompiledPreprocessor
+from heart_disease.entity.model_explainer import ModelExplainer
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
 
@@ -16,14 +20,43 @@ class TargetValueMapping:
         mapping_response = self._asdict()
         return dict(zip(mapping_response.values(),mapping_response.keys()))
     
+class DistilledClassifier:
+    """
+    Student of a classifier: a multi-output regressor fitted on the centered log-probabilities of the teacher,
+    predict_proba is the softmax of its outputs
+    """
+    def __init__(self, regressor: object, classes: np.ndarray):
+        """
+        :param regressor: fitted regressor with one output per class
+        :param classes: class labels of the teacher, in the order of its predict_proba columns
+        """
+        self.regressor = regressor
+        self.classes_ = np.asarray(classes)
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        logits = np.asarray(self.regressor.predict(x), dtype=np.float64).reshape(len(x), -1)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.classes_[self.predict_proba(x).argmax(axis=1)]
+
+    def __repr__(self):
+        return f"DistilledClassifier({type(self.regressor).__name__}())"
+
+    
 class HeartDiseaseModel:
-    def __init__(self, preprocessing_object: Pipeline, trained_model_object: object):
+    def __init__(self, preprocessing_object: Pipeline, trained_model_object: object,
+                 risk_calibrator: object = None):
         """
         :param preprocessing_object: Input Object of preprocesser
         :param trained_model_object: Input Object of trained model 
+        :param risk_calibrator: Optional fitted calibrator (e.g. IsotonicRegression) applied to the raw risk score
         """
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        self.risk_calibrator = risk_calibrator
 
     def predict(self, dataframe: DataFrame) -> DataFrame:
         """
@@ -44,6 +77,143 @@ class HeartDiseaseModel:
         except Exception as e:
             raise HeartdieseaseException(e, sys) from e
 
+    def predict_proba(self, dataframe: DataFrame) -> np.ndarray:
+        """
+        Function accepts raw inputs, transforms them using preprocessing_object
+        and returns the per-class probabilities of the trained model
+        """
+        logging.info("Entered predict_proba method of HeartDiseaseModel class")
+
+        try:
+            transformed_feature = self.preprocessing_object.transform(dataframe)
+            return np.asarray(self.trained_model_object.predict_proba(transformed_feature))
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_classes(self, n_classes: int) -> np.ndarray:
+        """
+        Returns the class labels matching the columns of predict_proba as integers
+        """
+        classes = getattr(self.trained_model_object, "classes_", None)
+        if classes is None or len(classes) != n_classes:
+            return np.arange(n_classes)
+        return np.asarray(classes).astype(int)
+
+    def get_scores(self, probabilities: np.ndarray) -> tuple:
+        """
+        Returns the class labels of the probability columns and the risk score (probability of any heart disease,
+        i.e. num > 0) of every row, calibrated when a risk_calibrator was fitted at training time
+        """
+        classes = self.get_classes(probabilities.shape[1])
+        no_disease = classes == 0
+        risk_score = 1.0 - probabilities[:, no_disease].sum(axis=1)
+
+        # models pickled before calibration was introduced have no risk_calibrator attribute
+        risk_calibrator = getattr(self, "risk_calibrator", None)
+        if risk_calibrator is not None:
+            risk_score = np.clip(risk_calibrator.predict(risk_score), 0.0, 1.0)
+        return classes, risk_score
+
+    def predict_with_scores(self, dataframe: DataFrame) -> DataFrame:
+        """
+        Function returns the predicted class, the per-class probabilities and the risk score
+        (probability of any heart disease, i.e. num > 0) from a single vectorized predict_proba call.
+        The risk score is calibrated when a risk_calibrator was fitted at training time.
+        """
+        logging.info("Entered predict_with_scores method of HeartDiseaseModel class")
+
+        try:
+            probabilities = self.predict_proba(dataframe)
+            classes, risk_score = self.get_scores(probabilities)
+
+            result = DataFrame(probabilities,
+                               columns=[f"probability_{label}" for label in classes],
+                               index=dataframe.index)
+            result.insert(0, "prediction", classes[probabilities.argmax(axis=1)])
+            result["risk_score"] = risk_score
+
+            logging.info("Exited predict_with_scores method of HeartDiseaseModel class")
+            return result
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_compiled_preprocessor(self) -> Optional[CompiledPreprocessor]:
+        """
+        Returns the preprocessor compiled to plain array operations, checked against preprocessing_object on
+        synthetic rows of config/schema.yaml on first use, None when it cannot be compiled exactly
+        """
+        if not hasattr(self, "_compiled_preprocessor"):
+            from heart_disease.utils.synthetic_data import generate_prediction_input
+
+            self._compiled_preprocessor = CompiledPreprocessor.compile(
+                self.preprocessing_object, generate_prediction_input(256, random_state=0))
+        return self._compiled_preprocessor
+
+    def predict_columns_with_scores(self, columns: Dict[str, np.ndarray]) -> tuple:
+        """
+        Function scores raw inputs given as one array per input field, without building a DataFrame when the
+        preprocessor can be compiled. Returns the predicted classes, the per-class probabilities, the class labels
+        of the probability columns and the risk scores
+        """
+        try:
+            compiled_preprocessor = self.get_compiled_preprocessor()
+            if compiled_preprocessor is not None:
+                transformed_feature = compiled_preprocessor.transform(columns)
+            else:
+                transformed_feature = self.preprocessing_object.transform(DataFrame(columns))
+            probabilities = np.asarray(self.trained_model_object.predict_proba(transformed_feature))
+            classes, risk_score = self.get_scores(probabilities)
+            return classes[probabilities.argmax(axis=1)], probabilities, classes, risk_score
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_explainer(self) -> ModelExplainer:
+        """
+        Returns the explainer of the model, built on first use with its precomputed SHAP tables and kept
+        for the lifetime of the loaded model
+        """
+        explainer = getattr(self, "_explainer", None)
+        if explainer is None:
+            explainer = ModelExplainer(model_obj=self.trained_model_object,
+                                       preprocessing_object=self.preprocessing_object)
+            self._explainer = explainer
+        return explainer
+
+    def explain(self, dataframe: DataFrame, classes: np.ndarray = None) -> DataFrame:
+        """
+        Function returns per row the attributions of the raw input fields to the score of its predicted class
+        (or of the class given in classes), in log-odds, and the base_value they add up from
+        """
+        logging.info("Entered explain method of HeartDiseaseModel class")
+
+        try:
+            explainer = self.get_explainer()
+            transformed_feature = self.preprocessing_object.transform(dataframe)
+            if classes is None:
+                class_positions = np.asarray(self.trained_model_object.predict_proba(transformed_feature)).argmax(axis=1)
+            else:
+                positions = {label: position for position, label in
+                             enumerate(self.get_classes(max(len(explainer.classes_), 2)))}
+                class_positions = np.asarray([positions[label] for label in np.asarray(classes).astype(int)])
+            contributions, base_values = explainer.explain(transformed_feature, class_positions)
+
+            result = DataFrame(contributions, columns=explainer.raw_fields, index=dataframe.index)
+            result["base_value"] = base_values
+            return result
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def __getstate__(self):
+        # the explainer and the compiled preprocessor are rebuilt from the model after loading
+        state = self.__dict__.copy()
+        state.pop("_explainer", None)
+        state.pop("_compiled_preprocessor", None)
+        return state
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
@@ -0,0 +1,275 @@
+import sys
+from math import factorial
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from heart_disease.constants import EXPLANATION_MAX_TABLE_MB
+from heart_disease.entity.oblivious_tree_evaluator import ObliviousTreeEvaluator
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+
+def get_raw_feature_map(preprocessor) -> Tuple[List[str], np.ndarray]:
+    """
+    Maps the output columns of a fitted ColumnTransformer back to the raw input fields they are computed from.
+    Returns the raw fields, in input order, and the (output columns, raw fields) 0/1 matrix: attributions of the
+    output columns summed per raw field are `attributions @ matrix`
+    """
+    try:
+        input_names = list(getattr(preprocessor, "feature_names_in_", []))
+        sources = {}
+        for name, transformer, columns in preprocessor.transformers_:
+            output = preprocessor.output_indices_[name]
+            width = output.stop - output.start
+            if transformer == "drop" or width == 0:
+                continue
+            columns = [input_names[column] if isinstance(column, (int, np.integer)) else column
+                       for column in np.atleast_1d(columns)]
+            encoder = transformer.steps[-1][1] if hasattr(transformer, "steps") else transformer
+            if width == len(columns):
+                column_sources = columns
+            elif hasattr(encoder, "categories_"):
+                # one output column per category, minus the dropped ones
+                drop_idx = getattr(encoder, "drop_idx_", None)
+                column_sources = [column for i, (column, categories) in enumerate(zip(columns, encoder.categories_))
+                                  for _ in range(len(categories) - int(drop_idx is not None and
+                                                                       drop_idx[i] is not None))]
+            elif len(columns) == 1:
+                column_sources = columns * width
+            else:
+                raise ValueError(f"Cannot map the {width} output columns of {name} to its inputs {columns}")
+            if len(column_sources) != width:
+                raise ValueError(f"Cannot map the {width} output columns of {name} to its inputs {columns}")
+            for position, column in zip(range(output.start, output.stop), column_sources):
+                sources[position] = column
+
+        used = set(sources.values())
+        raw_fields = [name for name in input_names if name in used] or sorted(used)
+        matrix = np.zeros((max(sources, default=-1) + 1, len(raw_fields)))
+        for position, column in sources.items():
+            matrix[position, raw_fields.index(column)] = 1.0
+        return raw_fields, matrix
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
+
+
+class ObliviousTreeShap:
+    """
+    Path-dependent TreeSHAP of an oblivious tree model, precomputed per leaf. The split outcomes of a row are
+    the bits of its leaf index, so in every tree the SHAP values of a row only depend on the leaf it reaches:
+    they are computed once for each leaf (from the leaf weights of the training data, as CatBoost's ShapValues)
+    and explaining a batch is a leaf index lookup, a gather and a per-feature sum.
+    """
+
+    def __init__(self, evaluator: ObliviousTreeEvaluator, chunk_size: int = 256):
+        """
+        :param evaluator: the model, loaded from its CatBoost JSON export
+        :param chunk_size: rows explained at once, bounds the gathered (tree features, rows, dimension) values
+        """
+        try:
+            self.evaluator = evaluator
+            self.chunk_size = chunk_size
+            n_trees, n_leaves, dimension = evaluator.leaf_values.shape
+            self.n_features = evaluator.n_features
+
+            tables, tree_features = [], []
+            expected_value = np.zeros(dimension)
+            for t in range(n_trees):
+                features = evaluator.split_features[evaluator.tree_splits[:evaluator.tree_depths[t], t]]
+                table, unique_features, tree_expected_value = self.get_tree_table(
+                    features, evaluator.leaf_values[t], evaluator.leaf_weights[t])
+                tables.append(table)
+                tree_features.append(unique_features)
+                expected_value += tree_expected_value
+
+            # (trees * leaves * slots, dimension) table, slot s of a tree holds its s-th distinct feature
+            self.n_slots = max((len(features) for features in tree_features), default=0)
+            table = np.zeros((n_trees, n_leaves, self.n_slots, dimension))
+            slot_features = np.full((n_trees, self.n_slots), -1, dtype=np.int64)
+            for t, (tree_table, features) in enumerate(zip(tables, tree_features)):
+                table[t, :len(tree_table), :len(features)] = tree_table
+                slot_features[t, :len(features)] = features
+            self.table = table.reshape(-1, dimension)
+
+            # slots sorted by feature, so the per-feature sum is one reduceat over the gathered slots
+            slot_trees, slots = np.nonzero(slot_features >= 0)
+            order = np.argsort(slot_features[slot_trees, slots], kind="stable")
+            self.slot_trees, self.slots = slot_trees[order], slots[order]
+            sorted_features = slot_features[self.slot_trees, self.slots]
+            self.features, self.feature_starts = np.unique(sorted_features, return_index=True)
+
+            self.expected_value_ = expected_value * evaluator.scale + evaluator.bias
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def get_tree_table(features: np.ndarray, leaf_values: np.ndarray,
+                       leaf_weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the (leaves, distinct features, dimension) SHAP values of every leaf of one tree, its distinct
+        features and its expected value. The expectation of the tree given the features of a subset S is
+        evaluated for every subset and every leaf bottom-up, one level at a time: a level whose feature is in S
+        follows the row, the others average their two children weighted by leaf weights.
+        """
+        depth = len(features)
+        n_leaves = 2 ** depth
+        leaves = np.arange(n_leaves)
+        unique_features, levels_feature = np.unique(features, return_inverse=True)
+        n_unique = len(unique_features)
+        subsets = np.arange(2 ** n_unique)
+        leaf_values = leaf_values[:n_leaves]
+        leaf_weights = leaf_weights[:n_leaves]
+        if depth == 0:
+            return np.zeros((1, 0, leaf_values.shape[1])), unique_features, leaf_values[0]
+
+        expectations = np.broadcast_to(leaf_values, (len(subsets),) + leaf_values.shape).copy()
+        # level k sets bit k of the leaf index, the last level is the root
+        for level in range(depth):
+            node_bits = leaves & ~((1 << level) - 1)
+            covers = np.bincount(node_bits, weights=leaf_weights, minlength=n_leaves)[node_bits]
+            left, right = leaves & ~(1 << level), leaves | (1 << level)
+            total = covers[left] + covers[right]
+            left_share = np.divide(covers[left], total, out=np.zeros(n_leaves), where=total > 0)
+            right_share = np.divide(covers[right], total, out=np.zeros(n_leaves), where=total > 0)
+            averaged = left_share[:, None] * expectations[:, left] + right_share[:, None] * expectations[:, right]
+            in_subset = (subsets >> levels_feature[level]) & 1 == 1
+            expectations = np.where(in_subset[:, None, None], expectations, averaged)
+
+        subset_sizes = np.array([bin(subset).count("1") for subset in subsets])
+        weights = np.array([factorial(size) * factorial(n_unique - size - 1) / factorial(n_unique)
+                            for size in np.minimum(subset_sizes, n_unique - 1)])
+        table = np.zeros((n_leaves, n_unique, leaf_values.shape[1]))
+        for i in range(n_unique):
+            without = subsets[(subsets >> i) & 1 == 0]
+            table[:, i] = np.tensordot(weights[without],
+                                       expectations[without | (1 << i)] - expectations[without], axes=1)
+        return table, unique_features, expectations[0, 0]
+
+    def shap_values(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the (rows, features, dimension) SHAP values of x in raw formula value space, they sum with
+        expected_value_ to the raw formula values of the model
+        """
+        x = np.asarray(x)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        result = np.zeros((len(x), self.n_features, self.table.shape[1]))
+        for start in range(0, len(x), self.chunk_size):
+            chunk = x[start:start + self.chunk_size]
+            leaf_indices = self.evaluator.get_leaf_indices(chunk, self.evaluator.tree_count_)
+            slot_indices = leaf_indices[self.slot_trees] * self.n_slots + self.slots[:, None]
+            values = np.add.reduceat(np.take(self.table, slot_indices, axis=0), self.feature_starts, axis=0)
+            result[start:start + len(chunk), self.features] = values.transpose(1, 0, 2)
+        return result * self.evaluator.scale
+
+    def __repr__(self):
+        return f"ObliviousTreeShap({self.evaluator})"
+
+
+class ModelExplainer:
+    """
+    Feature attributions of a trained model on its preprocessed inputs, summed back to the raw input fields.
+    CatBoost models (and the NumPy / distilled variants built from them) use precomputed ObliviousTreeShap
+    tables, falling back to CatBoost's ShapValues when the tables would not fit in max_table_mb, XGBoost uses
+    the pred_contribs of its booster. Attributions are in the log-odds space of the model: for a row they sum
+    with its base value to the raw score of the explained class.
+    """
+
+    def __init__(self, model_obj: object, preprocessing_object, max_table_mb: float = EXPLANATION_MAX_TABLE_MB):
+        """
+        :param model_obj: trained model of a HeartDiseaseModel
+        :param preprocessing_object: fitted ColumnTransformer of the same HeartDiseaseModel
+        :param max_table_mb: largest precomputed SHAP table kept in memory
+        """
+        try:
+            self.model_obj = model_obj
+            self.raw_fields, self.raw_feature_map = get_raw_feature_map(preprocessing_object)
+            self.classes_ = np.asarray(getattr(model_obj, "classes_", []))
+            self.tree_shap = None
+            self._expected_value = None
+
+            model_name = model_obj.__class__.__name__
+            evaluator = None
+            if model_name == "ObliviousTreeEvaluator":
+                evaluator = model_obj
+            elif model_name == "CatBoostClassifier":
+                evaluator = ObliviousTreeEvaluator.from_catboost_model(model_obj)
+            elif model_name == "DistilledClassifier" and \
+                    model_obj.regressor.__class__.__name__ == "CatBoostRegressor":
+                # the student regresses the centered log-probabilities, its outputs are the class logits
+                evaluator = ObliviousTreeEvaluator.from_catboost_model(model_obj.regressor)
+            elif model_name != "XGBClassifier":
+                raise ValueError(f"Explanations are not supported for {model_name}")
+
+            if evaluator is not None:
+                n_trees, n_leaves, dimension = evaluator.leaf_values.shape
+                table_mb = n_trees * n_leaves * evaluator.depth * dimension * 8 / 1024 / 1024
+                if table_mb <= max_table_mb:
+                    self.tree_shap = ObliviousTreeShap(evaluator)
+                    self._expected_value = self.tree_shap.expected_value_
+                elif model_name != "CatBoostClassifier":
+                    raise ValueError(f"The SHAP tables of {evaluator} need {table_mb:.0f} MB, "
+                                     f"above {max_table_mb} MB")
+                else:
+                    logging.info(f"The SHAP tables of {evaluator} need {table_mb:.0f} MB, "
+                                 f"using CatBoost ShapValues")
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_shap_values(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the (rows, dimension, transformed features) SHAP values of the model and caches its expected value
+        """
+        if self.tree_shap is not None:
+            return self.tree_shap.shap_values(x).transpose(0, 2, 1)
+
+        if self.model_obj.__class__.__name__ == "CatBoostClassifier":
+            from catboost import Pool
+
+            contributions = np.asarray(self.model_obj.get_feature_importance(Pool(x), type="ShapValues"))
+        else:
+            from xgboost import DMatrix
+
+            contributions = np.asarray(self.model_obj.get_booster().predict(DMatrix(x), pred_contribs=True))
+        contributions = contributions.reshape(len(x), -1, contributions.shape[-1])
+        if self._expected_value is None and len(x):
+            # the last column is the expected value, the same for every row
+            self._expected_value = contributions[0, :, -1].copy()
+        return contributions[:, :, :-1]
+
+    @property
+    def expected_value_(self) -> Optional[np.ndarray]:
+        return self._expected_value
+
+    def explain(self, x: np.ndarray, class_positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Method Name :   explain
+        Description :   This method computes the attributions of the raw input fields to the score of one class
+                        per row, given by its position in classes_ (the predict_proba column)
+
+        Output      :   Returns the (rows, raw fields) attributions and the (rows,) base values
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            x = np.asarray(x, dtype=np.float64)
+            class_positions = np.asarray(class_positions, dtype=np.int64)
+            shap_values = self.get_shap_values(x)
+            rows = np.arange(len(x))
+            if shap_values.shape[1] == 1:
+                # binary models score the second class, the first one has the opposite log-odds
+                sign = np.where(class_positions == 0, -1.0, 1.0)
+                contributions = shap_values[:, 0] * sign[:, None]
+                base_values = self._expected_value[0] * sign
+            else:
+                contributions = shap_values[rows, class_positions]
+                base_values = self._expected_value[class_positions]
+            # the model may not know the last transformed columns when no tree splits on them
+            contributions = np.pad(contributions, ((0, 0), (0, len(self.raw_feature_map) - contributions.shape[1])))
+            return contributions @ self.raw_feature_map, base_values
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def __repr__(self):
+        backend = self.tree_shap or self.model_obj.__class__.__name__
+        return f"ModelExplainer({backend}, raw_fields={len(self.raw_fields)})"
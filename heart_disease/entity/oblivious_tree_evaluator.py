@@ -0,0 +1,165 @@
+import json
+import sys
+from typing import Optional
+
+import numpy as np
+
+from heart_disease.exception import HeartdieseaseException
+
+
+class ObliviousTreeEvaluator:
+    """
+    Pure NumPy evaluator of a CatBoost model with oblivious (symmetric) trees and float features, loaded from its
+    JSON export. Every level of an oblivious tree applies one split to the whole layer, so the leaf of a row is the
+    bit-packed outcome of the tree's splits: each distinct (feature, border) split is evaluated once per batch, the
+    leaf indices of every tree are built with one shift per depth level and the leaf values are gathered and
+    accumulated tree by tree in double precision, in CatBoost's order. Drop-in for the CatBoostClassifier in a
+    HeartDiseaseModel (predict, predict_proba, classes_) without importing catboost.
+    """
+
+    def __init__(self, model_json: dict, chunk_size: int = 1024):
+        """
+        :param model_json: parsed CatBoost JSON export (model.save_model(path, format="json"))
+        :param chunk_size: rows evaluated at once, bounds the (splits, rows) outcomes and (trees, rows, dimension) leaf values in memory
+        """
+        try:
+            if model_json.get("features_info", {}).get("categorical_features") or "trees" in model_json:
+                raise ValueError("Only models with float features and oblivious trees are supported")
+            self.chunk_size = chunk_size
+
+            trees = model_json["oblivious_trees"]
+            depths = [len(tree["splits"]) for tree in trees]
+            self.depth = max(depths, default=0)
+            n_leaves = [2 ** depth for depth in depths]
+            self.dimension = len(trees[0]["leaf_values"]) // n_leaves[0] if trees else 1
+
+            # unique splits; trees shallower than the deepest are padded with a split that never fires
+            split_ids, features, borders = {}, [], []
+            tree_splits = np.zeros((len(trees), self.depth), dtype=np.int64)
+            self.leaf_values = np.zeros((len(trees), 2 ** self.depth, self.dimension), dtype=np.float64)
+            # training weight of every leaf, the covers of path-dependent TreeSHAP
+            self.leaf_weights = np.zeros((len(trees), 2 ** self.depth), dtype=np.float64)
+            self.tree_depths = np.asarray(depths, dtype=np.int64)
+            for t, tree in enumerate(trees):
+                for level in range(self.depth):
+                    if level < depths[t]:
+                        split = tree["splits"][level]
+                        if split.get("split_type", "FloatFeature") != "FloatFeature":
+                            raise ValueError(f"Unsupported split type {split['split_type']}")
+                        key = (split["float_feature_index"], split["border"])
+                    else:
+                        key = (0, np.inf)
+                    if key not in split_ids:
+                        split_ids[key] = len(features)
+                        features.append(key[0])
+                        borders.append(key[1])
+                    tree_splits[t, level] = split_ids[key]
+                self.leaf_values[t, :n_leaves[t]] = np.asarray(tree["leaf_values"], dtype=np.float64) \
+                    .reshape(n_leaves[t], self.dimension)
+                self.leaf_weights[t, :n_leaves[t]] = tree.get("leaf_weights", np.ones(n_leaves[t]))
+
+            # (depth, trees) so that a level selects the split outcome rows of every tree at once
+            self.tree_splits = np.ascontiguousarray(tree_splits.T)
+            self.split_features = np.asarray(features, dtype=np.int64)
+            # CatBoost compares float32 feature values with float32 borders
+            self.split_borders = np.asarray(borders, dtype=np.float32)[:, None]
+            self.leaf_index_dtype = np.uint8 if self.depth <= 8 else np.uint16
+            self.flat_leaf_values = self.leaf_values.reshape(-1, self.dimension)
+            self.leaf_offsets = np.arange(len(trees), dtype=np.int64) * 2 ** self.depth
+
+            float_features = model_json["features_info"].get("float_features", [])
+            self.n_features = max((feature["flat_feature_index"] for feature in float_features), default=-1) + 1
+            nan_as_true = {feature["flat_feature_index"] for feature in float_features
+                           if feature.get("nan_value_treatment") == "AsTrue"}
+            self.split_nan_as_true = np.asarray([feature in nan_as_true for feature in features], dtype=bool)[:, None]
+
+            scale_and_bias = model_json.get("scale_and_bias", [1.0, [0.0]])
+            self.scale = float(scale_and_bias[0])
+            bias = scale_and_bias[1] if len(scale_and_bias) > 1 else [0.0]
+            self.bias = np.broadcast_to(np.asarray(bias, dtype=np.float64), (self.dimension,)).copy()
+
+            class_params = model_json.get("model_info", {}).get("class_params", {})
+            class_names = class_params.get("class_names") or list(range(max(self.dimension, 2)))
+            self.classes_ = np.asarray(class_names)
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @classmethod
+    def from_json(cls, file_path: str, chunk_size: int = 1024) -> "ObliviousTreeEvaluator":
+        with open(file_path) as file:
+            return cls(json.load(file), chunk_size=chunk_size)
+
+    @classmethod
+    def from_catboost_model(cls, model: object, file_path: Optional[str] = None,
+                            chunk_size: int = 1024) -> "ObliviousTreeEvaluator":
+        """
+        Export a fitted CatBoost model to JSON (at file_path, in a temporary file when None) and load it
+        """
+        import os
+        import tempfile
+
+        if file_path is not None:
+            model.save_model(file_path, format="json")
+            return cls.from_json(file_path, chunk_size=chunk_size)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "model.json")
+            model.save_model(file_path, format="json")
+            return cls.from_json(file_path, chunk_size=chunk_size)
+
+    @property
+    def tree_count_(self) -> int:
+        return len(self.leaf_values)
+
+    def get_leaf_indices(self, x: np.ndarray, ntree_end: int) -> np.ndarray:
+        """
+        Returns the (trees, rows) index of the leaf of every row in every tree, offset into the flattened
+        (trees * leaves) leaf arrays. The split of level k sets bit k, the last split of a tree is its root.
+        """
+        # (splits, rows) layout: every split and every tree level reads contiguous rows
+        x = np.ascontiguousarray(np.asarray(x, dtype=np.float32).T)
+        values = np.take(x, self.split_features, axis=0)
+        split_outcomes = values > self.split_borders
+        if self.split_nan_as_true.any():
+            split_outcomes |= np.isnan(values) & self.split_nan_as_true
+        split_outcomes = split_outcomes.view(np.uint8)
+
+        # (trees, rows) leaf index of every tree, one pass per depth level
+        leaf_indices = np.zeros((ntree_end, x.shape[1]), dtype=self.leaf_index_dtype)
+        for level in range(self.depth):
+            level_outcomes = np.take(split_outcomes, self.tree_splits[level, :ntree_end], axis=0)
+            leaf_indices |= level_outcomes.astype(self.leaf_index_dtype) << self.leaf_index_dtype(level)
+        return leaf_indices + self.leaf_offsets[:ntree_end, None]
+
+    def _predict_raw_chunk(self, x: np.ndarray, ntree_end: int) -> np.ndarray:
+        leaf_indices = self.get_leaf_indices(x, ntree_end)
+        # summing over the leading axis adds the trees one after the other, as CatBoost does
+        raw = np.take(self.flat_leaf_values, leaf_indices, axis=0).sum(axis=0)
+        return raw * self.scale + self.bias
+
+    def predict_raw(self, x: np.ndarray, ntree_end: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the raw formula values (rows, dimension), CatBoost prediction_type="RawFormulaVal"
+        """
+        x = np.asarray(x)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        ntree_end = self.tree_count_ if ntree_end is None else min(ntree_end, self.tree_count_)
+        if len(x) <= self.chunk_size:
+            return self._predict_raw_chunk(x, ntree_end)
+        return np.concatenate([self._predict_raw_chunk(x[start:start + self.chunk_size], ntree_end)
+                               for start in range(0, len(x), self.chunk_size)])
+
+    def predict_proba(self, x: np.ndarray, ntree_end: Optional[int] = None) -> np.ndarray:
+        raw = self.predict_raw(x, ntree_end=ntree_end)
+        if self.dimension == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        raw = raw - raw.max(axis=1, keepdims=True)
+        probabilities = np.exp(raw)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, x: np.ndarray, ntree_end: Optional[int] = None) -> np.ndarray:
+        return self.classes_[self.predict_proba(x, ntree_end=ntree_end).argmax(axis=1)]
+
+    def __repr__(self):
+        return f"ObliviousTreeEvaluator(trees={self.tree_count_}, depth={self.depth}, dimension={self.dimension})"
@@ -0,0 +1,114 @@
+import math
+import sys
+import time
+import threading
+from collections import OrderedDict
+from numbers import Number
+from typing import Collection, Hashable, Optional, Tuple
+
+from pandas import DataFrame
+
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+
+def canonicalize_value(value, numeric: bool = False) -> Hashable:
+    """
+    Normalize a single feature value so that equivalent inputs share a cache key
+    (63 / 63.0 numeric drift, surrounding whitespace, NaN / None). Numeric strings ("63") only match numbers
+    in numeric fields: in a categorical field the encoder may accept one and reject the other
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not numeric:
+            return value
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    if isinstance(value, Number):
+        value = float(value)
+        return None if math.isnan(value) else value
+    return value
+
+
+def canonicalize_rows(dataframe: DataFrame, numeric_columns: Collection[str] = ()) -> Tuple[tuple, list]:
+    """
+    Returns the sorted column names and one canonical feature tuple per row of the dataframe
+    """
+    columns = tuple(sorted(dataframe.columns))
+    numeric = [column in numeric_columns for column in columns]
+    rows = [tuple(canonicalize_value(value, is_numeric) for value, is_numeric in zip(row, numeric))
+            for row in dataframe[list(columns)].itertuples(index=False, name=None)]
+    return columns, rows
+
+
+class PredictionCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL for prediction results.
+    Keys are expected to include the model version so that a model swap never serves stale results.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        """
+        :param max_size: Maximum number of cached predictions, least recently used entries are evicted first
+        :param ttl_seconds: Time to live of a cached prediction in seconds
+        """
+        try:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self._entries: OrderedDict = OrderedDict()
+            self._lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        logging.info("Prediction cache cleared")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,141 @@
+import json
+import sys
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+
+from heart_disease.constants import SCHEMA_FILE_PATH, COHORT_COLUMN, HEART_DISEASE_STATUS_MAP
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.utils.main_utils import read_yaml_file
+from heart_disease.utils.synthetic_data import get_prediction_feature_columns, get_schema_column_types
+
+try:
+    import msgspec
+except ImportError:  # pydantic ships with fastapi
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def get_field_types(schema_config: dict) -> Dict[str, object]:
+    """
+    Python type of every prediction input field of config/schema.yaml: categories are the Literal of their
+    values (bool for TRUE / FALSE columns), numbers are float so that 63 and 63.0 both validate
+    """
+    column_types = get_schema_column_types(schema_config)
+    categorical_values = schema_config.get("categorical_values", {})
+    field_types = {}
+    for column in get_prediction_feature_columns(schema_config):
+        if column_types[column] != "category":
+            field_types[column] = float
+        elif all(isinstance(value, bool) for value in categorical_values.get(column, [None])):
+            field_types[column] = bool
+        elif column in categorical_values:
+            field_types[column] = Literal[tuple(categorical_values[column])]
+        else:
+            field_types[column] = str
+    return field_types
+
+
+class PredictionRequestDecoder:
+    """
+    Validates and decodes the JSON body of /api/v1/predict (one record or a list of records) straight from
+    bytes into typed records, with a record type generated from config/schema.yaml, and turns them into one
+    array per field. Uses msgspec when it is installed, pydantic otherwise. The optional cohort column routes
+    a record to the model of its source site.
+    """
+
+    def __init__(self, schema_config: Optional[dict] = None, cohort_column: str = COHORT_COLUMN):
+        """
+        :param schema_config: parsed config/schema.yaml, read from SCHEMA_FILE_PATH when None
+        :param cohort_column: optional field routing a record to its cohort model
+        """
+        try:
+            if schema_config is None:
+                schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+            self.field_types = get_field_types(schema_config)
+            self.fields = list(self.field_types)
+            self.cohort_column = cohort_column
+            cohort_values = schema_config.get("categorical_values", {}).get(cohort_column)
+            cohort_type = Optional[Literal[tuple(cohort_values)] if cohort_values else str]
+
+            if msgspec is not None:
+                fields = [(field, field_type) for field, field_type in self.field_types.items()]
+                fields.append((cohort_column, cohort_type, None))
+                self.record_type = msgspec.defstruct("PredictionRecord", fields,
+                                                     forbid_unknown_fields=True)
+                self._decoder = msgspec.json.Decoder(Union[self.record_type, List[self.record_type]])
+                self.backend = "msgspec"
+            else:
+                from pydantic import ConfigDict, TypeAdapter, create_model
+
+                fields = {field: (field_type, ...) for field, field_type in self.field_types.items()}
+                fields[cohort_column] = (cohort_type, None)
+                self.record_type = create_model("PredictionRecord", __config__=ConfigDict(extra="forbid"),
+                                                **fields)
+                self._adapter = TypeAdapter(Union[self.record_type, List[self.record_type]])
+                self.backend = "pydantic"
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def decode(self, body: bytes) -> Tuple[list, bool]:
+        """
+        Returns the decoded records and whether the body was a single record.
+        Raises ValueError with the validation message on an invalid body
+        """
+        if self.backend == "msgspec":
+            try:
+                decoded = self._decoder.decode(body)
+            except msgspec.ValidationError as e:
+                raise ValueError(str(e))
+            except msgspec.DecodeError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+        else:
+            from pydantic import ValidationError
+
+            try:
+                decoded = self._adapter.validate_json(body)
+            except ValidationError as e:
+                raise ValueError(str(e))
+        if isinstance(decoded, list):
+            return decoded, False
+        return [decoded], True
+
+    def to_columns(self, records: list) -> Dict[str, np.ndarray]:
+        """
+        One array per input field, and the cohort column when a record has a cohort
+        """
+        columns = {field: np.asarray([getattr(record, field) for record in records],
+                                     dtype=np.float64 if self.field_types[field] is float else object)
+                   for field in self.fields}
+        cohorts = [getattr(record, self.cohort_column) for record in records]
+        if any(cohort is not None for cohort in cohorts):
+            columns[self.cohort_column] = np.asarray(cohorts, dtype=object)
+        return columns
+
+
+def encode_json(content) -> bytes:
+    """
+    Serializes a response body with orjson (numpy arrays and scalars included), json when it is not installed
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=lambda value: value.tolist() if hasattr(value, "tolist") else str(value)
+                      ).encode("utf-8")
+
+
+def format_prediction_record(record: dict) -> dict:
+    """
+    Convert a cached prediction record (prediction, probability_<class>, risk_score) into the response record
+    """
+    value = int(record["prediction"])
+    return {
+        "prediction": value,
+        "status": HEART_DISEASE_STATUS_MAP.get(value, "Unknown"),
+        "probabilities": {key.replace("probability_", ""): value for key, value in record.items()
+                          if key.startswith("probability_")},
+        "risk_score": record["risk_score"],
+    }
@@ -0,0 +1,521 @@
+import csv
+import io
+import tempfile
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, get_args
+
+import numpy as np
+import pandas as pd
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from heart_disease.constants import HEART_DISEASE_STATUS_MAP
+from heart_disease.entity.config_entity import UploadScoringConfig
+from heart_disease.entity.prediction_schema import encode_json, format_prediction_record
+from heart_disease.logger import logging
+
+UPLOAD_FORMATS = ("csv", "parquet")
+OUTPUT_FORMATS = ("ndjson", "csv")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_PARQUET_MAGIC = b"PAR1"
+_PARQUET_MEDIA_TYPES = ("application/vnd.apache.parquet", "application/x-parquet", "application/parquet")
+_BOOLEAN_VALUES = {"true": True, "1": True, "1.0": True, "yes": True,
+                   "false": False, "0": False, "0.0": False, "no": False}
+
+
+async def iter_inflated(chunks: AsyncIterator[bytes], max_inflate_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Inflates a gzip (or zlib) stream as it arrives, at most max_inflate_bytes at a time, concatenated gzip
+    members included
+    """
+    decompressor = zlib.decompressobj(wbits=47)
+    async for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, max_inflate_bytes)
+            if data:
+                yield data
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=47)
+            else:
+                chunk = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+async def _prepend(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+class UploadStream:
+    """
+    The file of a scoring upload as an async iterator of bytes, taken from the request body as it arrives: the
+    first file part of a multipart/form-data body or the raw body, inflated on the fly when the request or the
+    file itself is gzip compressed. open() reads the first bytes of the file to detect its format.
+    """
+
+    def __init__(self, body: AsyncIterator[bytes], content_type: Optional[str] = None,
+                 content_encoding: Optional[str] = None,
+                 upload_scoring_config: UploadScoringConfig = UploadScoringConfig()):
+        """
+        :param body: request body chunks, Request.stream()
+        :param content_type: Content-Type header of the request
+        :param content_encoding: Content-Encoding header of the request, only gzip is supported
+        :param upload_scoring_config: file field name and inflate limit of the upload
+        """
+        self.upload_scoring_config = upload_scoring_config
+        media_type, options = parse_options_header(content_type)
+        self.content_type = media_type.decode("latin-1").lower()
+        self.filename: Optional[str] = None
+        self.head = b""
+
+        chunks = body
+        if (content_encoding or "").lower() == "gzip":
+            chunks = iter_inflated(chunks, upload_scoring_config.max_inflate_bytes)
+        elif content_encoding and content_encoding.lower() != "identity":
+            raise ValueError(f"Unsupported Content-Encoding {content_encoding}")
+        if self.content_type == "multipart/form-data":
+            if b"boundary" not in options:
+                raise ValueError("The multipart upload has no boundary")
+            chunks = self._iter_multipart_file(chunks, options[b"boundary"])
+        self._chunks = chunks
+
+    async def _iter_multipart_file(self, chunks: AsyncIterator[bytes], boundary: bytes) -> AsyncIterator[bytes]:
+        """
+        Yields the data of the file part (the part named file_field_name or the first part with a filename)
+        and stops reading the body at the end of that part
+        """
+        field_name = self.upload_scoring_config.file_field_name.encode()
+        state = {"headers": {}, "field": b"", "value": b"", "in_file": False, "found": False, "done": False}
+        data = []
+
+        def on_part_begin():
+            state["headers"] = {}
+
+        def on_header_field(buffer, start, end):
+            state["field"] += buffer[start:end]
+
+        def on_header_value(buffer, start, end):
+            state["value"] += buffer[start:end]
+
+        def on_header_end():
+            state["headers"][state["field"].lower()] = state["value"]
+            state["field"], state["value"] = b"", b""
+
+        def on_headers_finished():
+            _, disposition = parse_options_header(state["headers"].get(b"content-disposition"))
+            if not state["found"] and (b"filename" in disposition or disposition.get(b"name") == field_name):
+                state["in_file"] = state["found"] = True
+                filename = disposition.get(b"filename")
+                self.filename = filename.decode("utf-8", "replace") if filename is not None else None
+                part_type, _ = parse_options_header(state["headers"].get(b"content-type"))
+                self.content_type = part_type.decode("latin-1").lower()
+
+        def on_part_data(buffer, start, end):
+            if state["in_file"]:
+                data.append(bytes(buffer[start:end]))
+
+        def on_part_end():
+            if state["in_file"]:
+                state["in_file"], state["done"] = False, True
+
+        parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": on_part_begin, "on_header_field": on_header_field,
+            "on_header_value": on_header_value, "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished, "on_part_data": on_part_data, "on_part_end": on_part_end})
+        async for chunk in chunks:
+            parser.write(chunk)
+            if data:
+                yield b"".join(data)
+                data.clear()
+            if state["done"]:
+                return
+        parser.finalize()
+        if not state["found"]:
+            raise ValueError(f"The multipart upload has no {self.upload_scoring_config.file_field_name} file part")
+
+    async def open(self, n_bytes: int = 4) -> bytes:
+        """
+        Reads the first n_bytes of the file (fewer for a shorter file), inflating a gzip compressed file
+        """
+        head = b""
+        async for chunk in self._chunks:
+            head += chunk
+            if len(head) >= n_bytes:
+                break
+        if head.startswith(_GZIP_MAGIC):
+            self._chunks = iter_inflated(_prepend(head, self._chunks), self.upload_scoring_config.max_inflate_bytes)
+            head = b""
+            async for chunk in self._chunks:
+                head += chunk
+                if len(head) >= n_bytes:
+                    break
+        self.head = head
+        return head
+
+    def get_format(self, upload_format: Optional[str] = None) -> str:
+        """
+        Format of the upload: upload_format when given, else from the file name, the content type and
+        the Parquet magic bytes
+        """
+        if upload_format is not None:
+            if upload_format not in UPLOAD_FORMATS:
+                raise ValueError(f"Unknown upload format {upload_format}, expected one of {UPLOAD_FORMATS}")
+            return upload_format
+        filename = (self.filename or "").lower()
+        if filename.endswith((".parquet", ".parquet.gz", ".pq")) or self.content_type in _PARQUET_MEDIA_TYPES \
+                or self.head.startswith(_PARQUET_MAGIC):
+            return "parquet"
+        return "csv"
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self.head:
+            head, self.head = self.head, b""
+            yield head
+        async for chunk in self._chunks:
+            if chunk:
+                yield chunk
+
+
+@dataclass
+class UploadChunk:
+    start_row: int
+    n_rows: int
+    # input columns of the valid rows of the chunk, row_errors holds the validation error of every other row
+    columns: Optional[Dict[str, np.ndarray]] = None
+    row_errors: Optional[List[Optional[str]]] = None
+    ids: Optional[list] = None
+    error: Optional[str] = None
+
+    @property
+    def n_valid_rows(self) -> int:
+        return self.n_rows - sum(error is not None for error in self.row_errors or [])
+
+
+class UploadChunkReader:
+    """
+    Splits an upload into UploadChunk of at most chunk_rows rows, with one array per prediction input field
+    (and the cohort column when the upload has it) and the ids of the rows. Rows with a missing or invalid value
+    are left out of the columns with their error, a chunk that cannot be read comes with the error instead of its
+    columns and the following chunks are still read.
+    """
+
+    def __init__(self, field_types: Dict[str, object],
+                 upload_scoring_config: UploadScoringConfig = UploadScoringConfig()):
+        """
+        :param field_types: Python type of every prediction input field, PredictionRequestDecoder.field_types
+        :param upload_scoring_config: chunk size, id and cohort columns of the upload
+        """
+        self.field_types = field_types
+        self.upload_scoring_config = upload_scoring_config
+        self.chunk_rows = upload_scoring_config.chunk_rows
+        self.upload_columns: List[str] = []
+
+    @property
+    def has_id(self) -> bool:
+        return self.upload_scoring_config.id_column in self.upload_columns
+
+    def get_used_columns(self, upload_columns: List[str]) -> List[str]:
+        """
+        Checks that the upload has every input field and returns the columns read from it
+        """
+        missing = [field for field in self.field_types if field not in upload_columns]
+        if missing:
+            raise ValueError(f"The upload has no column {missing}, expected the columns {list(self.field_types)}")
+        self.upload_columns = list(upload_columns)
+        optional = [self.upload_scoring_config.id_column, self.upload_scoring_config.cohort_column]
+        return [*self.field_types, *(column for column in optional if column in upload_columns)]
+
+    def get_chunk(self, start_row: int, frame: pd.DataFrame) -> UploadChunk:
+        """
+        The model input columns of the valid rows of a DataFrame of the upload, with the types of the input
+        fields, validated as /api/v1/predict validates its records
+        """
+        try:
+            columns, row_errors = {}, [None] * len(frame)
+            invalid = np.zeros(len(frame), dtype=bool)
+            for field, field_type in self.field_types.items():
+                values = frame[field]
+                missing = values.isna().to_numpy()
+                if field_type is float:
+                    values = pd.to_numeric(values, errors="coerce").astype(np.float64)
+                elif field_type is bool and values.dtype != bool:
+                    values = values.astype(str).str.strip().str.lower().map(_BOOLEAN_VALUES)
+                elif get_args(field_type):
+                    values = values.where(values.isin(get_args(field_type)))
+                rejected = values.isna().to_numpy()
+                for position in np.flatnonzero(rejected & ~invalid):
+                    row_errors[position] = f"Missing value in column {field}" if missing[position] else \
+                        f"Invalid value {frame[field].iloc[position]!r} in column {field}"
+                invalid |= rejected
+                columns[field] = values.to_numpy(dtype=np.float64 if field_type is float else object)
+
+            cohort_column = self.upload_scoring_config.cohort_column
+            if cohort_column in frame.columns:
+                cohorts = frame[cohort_column].astype(object)
+                columns[cohort_column] = cohorts.where(cohorts.notna() & (cohorts != ""), None).to_numpy()
+            if invalid.any():
+                valid = np.flatnonzero(~invalid)
+                columns = {column: values[valid] for column, values in columns.items()}
+            ids = None
+            if self.has_id:
+                ids = frame[self.upload_scoring_config.id_column].astype(object)
+                ids = ids.where(ids.notna(), None).tolist()
+            return UploadChunk(start_row=start_row, n_rows=len(frame), columns=columns,
+                               row_errors=row_errors if invalid.any() else None, ids=ids)
+        except Exception as e:
+            return UploadChunk(start_row=start_row, n_rows=len(frame), error=f"{e}")
+
+    def iter_frame_chunks(self, start_row: int, frame: pd.DataFrame):
+        for offset in range(0, len(frame), self.chunk_rows):
+            yield self.get_chunk(start_row + offset, frame.iloc[offset:offset + self.chunk_rows])
+
+
+class CsvChunkReader(UploadChunkReader):
+    """
+    Reads a CSV upload with a header line as it arrives: the bytes received are cut after their last complete
+    line once they hold chunk_rows lines and that block is parsed, so at most one block of the file is in memory.
+    Records are split on line breaks, quoted fields spanning lines are not supported.
+    """
+
+    async def open(self, upload: UploadStream) -> "CsvChunkReader":
+        """
+        Reads and checks the header line of the upload
+        """
+        buffer = b""
+        self._chunks = upload.__aiter__()
+        async for chunk in self._chunks:
+            buffer += chunk
+            if b"\n" in buffer or len(buffer) > self.upload_scoring_config.max_header_bytes:
+                break
+        header, newline, self._rest = buffer.partition(b"\n")
+        if not newline and len(buffer) > self.upload_scoring_config.max_header_bytes:
+            raise ValueError(f"No header line in the first {self.upload_scoring_config.max_header_bytes} bytes")
+        header = header.decode("utf-8-sig").strip("\r")
+        self.header = [column.strip() for column in next(csv.reader([header]), [])]
+        self.used_columns = self.get_used_columns(self.header)
+        # categories are kept as text, numbers are converted per input field
+        self.dtypes = {column: str for column in self.used_columns
+                       if column in self.field_types and self.field_types[column] is not float}
+        return self
+
+    def parse(self, start_row: int, block: bytes) -> List[UploadChunk]:
+        try:
+            frame = pd.read_csv(io.BytesIO(block), header=None, names=self.header, usecols=self.used_columns,
+                                dtype=self.dtypes, skipinitialspace=True)
+        except Exception as e:
+            return [UploadChunk(start_row=start_row, n_rows=block.count(b"\n"), error=f"Invalid CSV: {e}")]
+        return list(self.iter_frame_chunks(start_row, frame))
+
+    async def __aiter__(self) -> AsyncIterator[UploadChunk]:
+        pending, pending_lines, start_row = [self._rest], self._rest.count(b"\n"), 0
+        async for chunk in self._chunks:
+            pending.append(chunk)
+            pending_lines += chunk.count(b"\n")
+            if pending_lines < self.chunk_rows:
+                continue
+            block = b"".join(pending)
+            end = block.rfind(b"\n") + 1
+            pending, pending_lines = [block[end:]], 0
+            for upload_chunk in await run_in_threadpool(self.parse, start_row, block[:end]):
+                start_row += upload_chunk.n_rows
+                yield upload_chunk
+        block = b"".join(pending)
+        if block.strip():
+            for upload_chunk in await run_in_threadpool(self.parse, start_row, block):
+                start_row += upload_chunk.n_rows
+                yield upload_chunk
+
+
+class ParquetChunkReader(UploadChunkReader):
+    """
+    Reads a Parquet upload in record batches of chunk_rows rows. Parquet keeps its schema and row group offsets
+    in the footer of the file, so the upload is spooled to a temporary file before the first batch is read.
+    """
+
+    async def open(self, upload: UploadStream) -> "ParquetChunkReader":
+        """
+        Spools the upload to a temporary file and checks its schema
+        """
+        import pyarrow.parquet as pq
+
+        self._file = tempfile.TemporaryFile(dir=self.upload_scoring_config.spool_dir)
+        try:
+            async for chunk in upload:
+                self._file.write(chunk)
+            self._file.seek(0)
+            self.parquet_file = pq.ParquetFile(self._file)
+            self.used_columns = self.get_used_columns(self.parquet_file.schema_arrow.names)
+        except Exception:
+            self._file.close()
+            raise
+        return self
+
+    async def __aiter__(self) -> AsyncIterator[UploadChunk]:
+        try:
+            batches = self.parquet_file.iter_batches(batch_size=self.chunk_rows, columns=self.used_columns)
+            start_row = 0
+            while True:
+                batch = await run_in_threadpool(next, batches, None)
+                if batch is None:
+                    break
+                upload_chunk = self.get_chunk(start_row, batch.to_pandas())
+                start_row += upload_chunk.n_rows
+                yield upload_chunk
+        finally:
+            self._file.close()
+
+
+async def open_upload_reader(upload: UploadStream, field_types: Dict[str, object],
+                             upload_format: Optional[str] = None,
+                             upload_scoring_config: UploadScoringConfig = UploadScoringConfig()) -> UploadChunkReader:
+    """
+    Returns the chunk reader of the upload once its header (CSV) or schema (Parquet) is checked.
+    Raises ValueError when the upload cannot be scored
+    """
+    await upload.open()
+    reader_class = ParquetChunkReader if upload.get_format(upload_format) == "parquet" else CsvChunkReader
+    try:
+        return await reader_class(field_types, upload_scoring_config).open(upload)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Unreadable {reader_class.__name__.replace('ChunkReader', '')} upload: {e}")
+
+
+class PredictionStreamEncoder:
+    """
+    Encodes the predictions of upload chunks as NDJSON (one /api/v1/predict record per line, with its row and id)
+    or CSV (one column per class probability), gzip compressed on request. Every chunk is flushed so the client
+    receives the predictions of a chunk as soon as it is scored.
+    """
+
+    def __init__(self, output_format: str, gzip: bool = False, has_id: bool = False,
+                 upload_scoring_config: UploadScoringConfig = UploadScoringConfig()):
+        """
+        :param output_format: ndjson or csv
+        :param gzip: gzip compress the stream
+        :param has_id: echo the id column of the upload
+        :param upload_scoring_config: id column and gzip level
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}, expected one of {OUTPUT_FORMATS}")
+        self.output_format = output_format
+        self.id_column = upload_scoring_config.id_column if has_id else None
+        self.compressor = zlib.compressobj(upload_scoring_config.gzip_level, zlib.DEFLATED, 31) if gzip else None
+        self.probability_columns = [f"probability_{label}" for label in HEART_DISEASE_STATUS_MAP]
+        self.csv_columns = ["row", *([self.id_column] if self.id_column else []), "prediction", "status",
+                            *self.probability_columns, "risk_score", "error"]
+        self._header_written = False
+
+    @property
+    def media_type(self) -> str:
+        return "application/x-ndjson" if self.output_format == "ndjson" else "text/csv"
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Encoding": "gzip"} if self.compressor is not None else {}
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compressor is None:
+            return data
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def encode(self, upload_chunk: UploadChunk, records: Optional[List[dict]] = None) -> bytes:
+        """
+        Encodes the predictions (predict_columns records of the valid rows) of a chunk, with the error of the
+        rows that were not scored, or the error of the chunk on every row when it failed
+        """
+        rows = range(upload_chunk.start_row, upload_chunk.start_row + upload_chunk.n_rows)
+        ids = upload_chunk.ids if upload_chunk.ids is not None else [None] * upload_chunk.n_rows
+        row_errors = upload_chunk.row_errors if upload_chunk.row_errors is not None else [None] * upload_chunk.n_rows
+        records = iter(records or [])
+        if self.output_format == "ndjson":
+            lines = []
+            for position, row in enumerate(rows):
+                line = {"row": row}
+                if self.id_column:
+                    line[self.id_column] = ids[position]
+                error = upload_chunk.error or row_errors[position]
+                if error is not None:
+                    line.update(status=False, error=error)
+                else:
+                    line.update(format_prediction_record(next(records)))
+                lines.append(encode_json(line))
+            return self._compress(b"\n".join(lines) + b"\n" if lines else b"")
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if not self._header_written:
+            writer.writerow(self.csv_columns)
+            self._header_written = True
+        for position, row in enumerate(rows):
+            prefix = [row, ids[position]] if self.id_column else [row]
+            error = upload_chunk.error or row_errors[position]
+            if error is not None:
+                writer.writerow([*prefix, "", "", *([""] * len(self.probability_columns)), "", error])
+                continue
+            record = next(records)
+            value = int(record["prediction"])
+            writer.writerow([*prefix, value, HEART_DISEASE_STATUS_MAP.get(value, "Unknown"),
+                             *(record.get(column, 0.0) for column in self.probability_columns),
+                             record["risk_score"], ""])
+        return self._compress(buffer.getvalue().encode("utf-8"))
+
+    def close(self) -> bytes:
+        """
+        End of the stream, the CSV header of an empty upload and the gzip trailer
+        """
+        data = b""
+        if self.output_format == "csv" and not self._header_written:
+            data = self.encode(UploadChunk(start_row=0, n_rows=0), records=[])
+            if self.compressor is None:
+                return data
+        if self.compressor is not None:
+            data += self.compressor.flush()
+        return data
+
+
+class UploadScoringResponse(StreamingResponse):
+    """
+    StreamingResponse whose body is produced while the request body is still being read. It does not listen
+    for http.disconnect: the body iterator reads the request stream itself, which reports the disconnect.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_scored_upload(reader: UploadChunkReader, encoder: PredictionStreamEncoder,
+                             model_predictor) -> AsyncIterator[bytes]:
+    """
+    Scores the chunks of an upload one after the other with HeartDiseaseClassifier.predict_columns (without the
+    prediction cache) and yields their encoded predictions, the rows that are not scored are reported with
+    their error
+    """
+    n_rows, n_scored = 0, 0
+    async for upload_chunk in reader:
+        records = []
+        if upload_chunk.error is None and upload_chunk.n_valid_rows:
+            try:
+                records = await run_in_threadpool(model_predictor.predict_columns, upload_chunk.columns, False)
+            except Exception as e:
+                upload_chunk.error = f"{e}"
+        if upload_chunk.error is not None:
+            logging.warning(f"Upload rows {upload_chunk.start_row}-{upload_chunk.start_row + upload_chunk.n_rows} "
+                            f"not scored: {upload_chunk.error}")
+            records = []
+        yield encoder.encode(upload_chunk, records)
+        n_rows += upload_chunk.n_rows
+        n_scored += len(records)
+    yield encoder.close()
+    logging.info(f"Scored upload of {n_rows} rows, {n_rows - n_scored} rows not scored")
@@ -0,0 +1,375 @@
+"""
+Offline batch scoring with the registry model.
+
+    python -m heart_disease.pipline.batch_prediction data/patients.parquet --output predictions.parquet
+    python -m heart_disease.pipline.batch_prediction data/ --output predictions.parquet --workers 8 --chunk-size 50000
+    python -m heart_disease.pipline.batch_prediction --mongo-query '{"dataset": "Cleveland"}' --output-collection cvd_predictions
+    python -m heart_disease.pipline.batch_prediction notebook/heart_disease_uci.csv --model-path model.pkl --mongomock
+
+The input (CSV / Parquet files or the documents of a Mongo query) is read in chunks by the parent process and
+fanned out to a pool of worker processes, each holding one copy of the model, unpickled once from a local snapshot
+of the registry model. Predictions are written in input order to a Parquet file (one row group per chunk) or to a
+Mongo collection with unordered bulk writes, with the version of the model that scored them.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.data_access.bulk_loader import BulkLoader, get_collection
+from heart_disease.data_access.data_source import FileDataSource, MongoDataSource
+from heart_disease.entity.config_entity import BatchPredictionConfig
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import load_object
+from heart_disease.utils.synthetic_data import generate_prediction_input, get_prediction_feature_columns
+
+# model and input columns of a worker process, set once by init_worker
+_worker_state = {}
+
+
+def limit_model_threads(model_obj: object, n_threads: int) -> None:
+    """
+    Caps the threads a boosted model predicts with, the pool already runs one worker per core
+    """
+    model_name = model_obj.__class__.__name__
+    if model_name == "CatBoostClassifier":
+        # the parameters of a fitted CatBoost model are frozen, its predict methods take the thread count
+        for method_name in ("predict", "predict_proba"):
+            setattr(model_obj, method_name, partial(getattr(model_obj, method_name), thread_count=n_threads))
+    elif model_name == "XGBClassifier":
+        model_obj.set_params(n_jobs=n_threads)
+
+
+def init_worker(model_file_path: str, feature_columns: List[str], n_threads: int) -> None:
+    """
+    Loads the model snapshot once per worker process
+    """
+    model = load_object(model_file_path)
+    limit_model_threads(model.trained_model_object, n_threads)
+    _worker_state.update(model=model, feature_columns=feature_columns, score_columns=get_score_columns(model))
+
+
+def get_score_columns(model) -> List[str]:
+    """
+    Columns of the scores of a chunk: prediction, probability_<class> of every class of the model, risk_score
+    and error, taken from the scores of a synthetic row
+    """
+    return [*model.predict_with_scores(generate_prediction_input(1, random_state=0)).columns, "error"]
+
+
+def score_rows(model, features: DataFrame) -> DataFrame:
+    """
+    Scores the rows with predict_with_scores, a batch that fails is split in halves until the failing rows are
+    isolated, so a few invalid rows (e.g. an unknown category) cost a logarithmic number of extra calls and
+    only them are reported with their error
+    """
+    try:
+        scores_df = model.predict_with_scores(features)
+        scores_df["error"] = None
+        return scores_df.reset_index(drop=True)
+    except Exception as e:
+        if len(features) == 1:
+            return DataFrame({"error": [f"{e}"]})
+        middle = len(features) // 2
+        return pd.concat([score_rows(model, features.iloc[:middle]), score_rows(model, features.iloc[middle:])],
+                         ignore_index=True)
+
+
+def score_chunk(chunk: DataFrame) -> Tuple[DataFrame, int, float]:
+    """
+    Scores a chunk in a worker process.
+    Returns the prediction, probability_<class>, risk_score and error columns, the worker pid and the seconds spent
+    """
+    start = time.perf_counter()
+    features = chunk[_worker_state["feature_columns"]].reset_index(drop=True)
+    # a chunk whose rows all failed has only the error column
+    scores_df = score_rows(_worker_state["model"], features).reindex(columns=_worker_state["score_columns"])
+    scores_df["prediction"] = scores_df["prediction"].astype("Int64")
+    scores_df[scores_df.columns[1:-1]] = scores_df[scores_df.columns[1:-1]].astype(np.float64)
+    scores_df["error"] = scores_df["error"].astype(object)
+    return scores_df, os.getpid(), time.perf_counter() - start
+
+
+class ParquetPredictionWriter:
+    """
+    Appends the predictions of every chunk to a Parquet file as one row group, with the schema of the first chunk
+    """
+
+    def __init__(self, file_path: str, compression: str):
+        self.file_path = file_path
+        self.compression = compression
+        self._writer = None
+        self._schema = None
+
+    def write(self, predictions: DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(predictions, preserve_index=False)
+            self._schema = schema.set(schema.get_field_index("error"), pa.field("error", pa.string()))
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.file_path, self._schema, compression=self.compression)
+        self._writer.write_table(pa.Table.from_pandas(predictions, schema=self._schema, preserve_index=False))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class MongoPredictionWriter:
+    """
+    Writes the predictions of every chunk to a collection with the unordered bulk writes of BulkLoader: upserts
+    keyed on the id column when the input has one, so that a rerun replaces the previous predictions, inserts
+    otherwise
+    """
+
+    def __init__(self, collection, id_column: str):
+        self.collection = collection
+        self.id_column = id_column
+        self._loader = None
+
+    def write(self, predictions: DataFrame) -> None:
+        if self._loader is None:
+            has_id = self.id_column in predictions.columns
+            self._loader = BulkLoader(self.collection, mode="upsert" if has_id else "insert", key=self.id_column,
+                                      batch_size=len(predictions), n_workers=1)
+            if has_id:
+                self._loader.create_indexes(fields=[self.id_column])
+        self._loader.write_chunk(predictions)
+
+    def close(self) -> None:
+        pass
+
+
+class BatchPrediction:
+    """
+    Scores a stream of input chunks with the registry model (or a local model file) in a pool of worker processes
+    and writes the predictions with the model version, path and scoring time of the run
+    """
+
+    def __init__(self, batch_prediction_config: BatchPredictionConfig = BatchPredictionConfig(),
+                 model_path: Optional[str] = None, storage: Optional[SimpleStorageService] = None):
+        """
+        :param batch_prediction_config: chunk size, workers and registry model of the run
+        :param model_path: local pickled HeartDiseaseModel to score with instead of the registry model
+        :param storage: storage service of the registry, defaults to the configured storage backend
+        """
+        try:
+            self.batch_prediction_config = batch_prediction_config
+            self.model_path = model_path
+            self.storage = storage
+            self.feature_columns = get_prediction_feature_columns()
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_model_snapshot(self, directory: str) -> Tuple[str, str, str]:
+        """
+        Method Name :   get_model_snapshot
+        Description :   This method downloads the registry model once into directory so that every worker loads
+                        the same version, a local model file is used as it is
+
+        Output      :   Returns the model file path, the model version and the model path it was taken from
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.model_path is not None:
+                digest = hashlib.sha256()
+                with open(self.model_path, "rb") as model_file:
+                    for block in iter(lambda: model_file.read(1 << 20), b""):
+                        digest.update(block)
+                return self.model_path, f"sha256:{digest.hexdigest()[:16]}", os.path.abspath(self.model_path)
+
+            storage = self.storage if self.storage is not None else SimpleStorageService()
+            model_blob_path = self.batch_prediction_config.model_file_path
+            container_name = self.batch_prediction_config.model_blob_name
+            fallback_model_blob_path = self.batch_prediction_config.fallback_model_file_path
+            if model_blob_path != fallback_model_blob_path and not storage.exists(model_blob_path, container_name):
+                logging.warning(f"{model_blob_path} not found, scoring with {fallback_model_blob_path}")
+                model_blob_path = fallback_model_blob_path
+            model_version = storage.get_blob_version(model_blob_path, container_name)
+            file_path = os.path.join(directory, os.path.basename(model_blob_path))
+            with open(file_path, "wb") as model_file:
+                model_file.write(storage.read_bytes(model_blob_path, container_name))
+            logging.info(f"Snapshot of registry model {model_blob_path} version {model_version} at {file_path}")
+            return file_path, model_version, f"{container_name}/{model_blob_path}"
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def get_predictions(self, chunk: DataFrame, scores_df: DataFrame, start_row: int, run_columns: dict) -> DataFrame:
+        """
+        The output rows of a scored chunk: the id of the input rows (their position when the input has no id),
+        the scores and the model version columns
+        """
+        id_column = self.batch_prediction_config.id_column
+        if id_column in chunk.columns:
+            keys = DataFrame({id_column: chunk[id_column].to_numpy()})
+        else:
+            keys = DataFrame({"row": np.arange(start_row, start_row + len(chunk), dtype=np.int64)})
+        predictions = pd.concat([keys, scores_df], axis=1)
+        for column, value in run_columns.items():
+            predictions[column] = value
+        return predictions
+
+    def run(self, chunks: Iterator[DataFrame], writer) -> dict:
+        """
+        Method Name :   run
+        Description :   This method sends the input chunks to the worker processes, at most 2 * n_workers chunks
+                        in flight, and writes their predictions in input order
+
+        Output      :   Returns the run report with the rows/sec of every worker
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered run method of BatchPrediction class")
+        try:
+            config = self.batch_prediction_config
+            with tempfile.TemporaryDirectory() as directory:
+                model_file_path, model_version, model_path = self.get_model_snapshot(directory)
+                run_columns = {"model_version": model_version, "model_path": model_path,
+                               "scored_at": datetime.now(timezone.utc)}
+                init_args = (model_file_path, self.feature_columns, config.worker_threads)
+
+                rows, errors, n_chunks, worker_stats = 0, 0, 0, {}
+
+                def write_result(chunk: DataFrame, start_row: int, result: Tuple[DataFrame, int, float]):
+                    nonlocal errors
+                    scores_df, pid, seconds = result
+                    writer.write(self.get_predictions(chunk, scores_df, start_row, run_columns))
+                    errors += int(scores_df["error"].notna().sum())
+                    stats = worker_stats.setdefault(pid, {"pid": pid, "chunks": 0, "rows": 0, "busy_seconds": 0.0})
+                    stats["chunks"] += 1
+                    stats["rows"] += len(chunk)
+                    stats["busy_seconds"] += seconds
+
+                start = time.perf_counter()
+                if config.n_workers <= 1:
+                    init_worker(*init_args)
+                    for chunk in chunks:
+                        self.check_columns(chunk)
+                        write_result(chunk, rows, score_chunk(chunk))
+                        rows += len(chunk)
+                        n_chunks += 1
+                else:
+                    # spawned workers do not inherit the Mongo client and blob connections of the parent
+                    with ProcessPoolExecutor(max_workers=config.n_workers, mp_context=get_context("spawn"),
+                                             initializer=init_worker, initargs=init_args) as executor:
+                        pending = deque()
+                        for chunk in chunks:
+                            self.check_columns(chunk)
+                            if len(pending) >= 2 * config.n_workers:
+                                pending_chunk, start_row, future = pending.popleft()
+                                write_result(pending_chunk, start_row, future.result())
+                            chunk = chunk.reset_index(drop=True)
+                            pending.append((chunk, rows, executor.submit(score_chunk, chunk)))
+                            rows += len(chunk)
+                            n_chunks += 1
+                        while pending:
+                            chunk, start_row, future = pending.popleft()
+                            write_result(chunk, start_row, future.result())
+                writer.close()
+                seconds = time.perf_counter() - start
+
+            for stats in worker_stats.values():
+                stats["rows_per_second"] = stats["rows"] / stats["busy_seconds"] if stats["busy_seconds"] > 0 else 0.0
+            report = {
+                "model_version": model_version,
+                "model_path": model_path,
+                "rows": rows,
+                "chunks": n_chunks,
+                "errors": errors,
+                "workers": max(1, config.n_workers),
+                "chunk_size": config.chunk_size,
+                "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+                "worker_stats": sorted(worker_stats.values(), key=lambda stats: stats["pid"]),
+            }
+            logging.info(f"Batch prediction report: {report}")
+            return report
+        except Exception as e:
+            raise HeartdieseaseException(e, sys) from e
+
+    def check_columns(self, chunk: DataFrame) -> None:
+        missing = [column for column in self.feature_columns if column not in chunk.columns]
+        if missing:
+            raise Exception(f"The input has no column {missing}, expected the columns {self.feature_columns}")
+
+
+def parse_args(argv=None):
+    config = BatchPredictionConfig()
+    parser = argparse.ArgumentParser(description="Score CSV / Parquet files or a Mongo query with the registry model")
+    parser.add_argument("inputs", nargs="*", help="CSV or Parquet files or directories to score")
+    parser.add_argument("--mongo-query", default=None,
+                        help="score the documents of --collection matching this JSON query instead of files")
+    parser.add_argument("--output", default=None, help="Parquet file the predictions are written to")
+    parser.add_argument("--output-collection", default=None,
+                        help="collection of --database the predictions are written to instead of --output")
+    parser.add_argument("--model-path", default=None,
+                        help="pickled HeartDiseaseModel to score with, defaults to the registry model")
+    parser.add_argument("--chunk-size", type=int, default=config.chunk_size)
+    parser.add_argument("--workers", type=int, default=config.n_workers)
+    parser.add_argument("--database", default=config.database_name)
+    parser.add_argument("--collection", default=config.collection_name)
+    parser.add_argument("--mongo-url", default=None, help="e.g. mongodb://localhost:27017, defaults to the Atlas cluster")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="use an in-memory mongomock database for the Mongo input and output")
+    args = parser.parse_args(argv)
+    if bool(args.inputs) == (args.mongo_query is not None):
+        parser.error("give either input files or --mongo-query")
+    if (args.output is None) == (args.output_collection is None):
+        parser.error("give either --output or --output-collection")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    config = BatchPredictionConfig(chunk_size=args.chunk_size, n_workers=args.workers, database_name=args.database,
+                                   collection_name=args.collection)
+
+    if args.mongo_query is not None:
+        collection = get_collection(args.database, args.collection, mongo_url=args.mongo_url,
+                                    use_mongomock=args.mongomock)
+        source = MongoDataSource(collection_name=args.collection, database=collection.database,
+                                 batch_size=args.chunk_size)
+        chunks = (source.apply_schema_types(batch)
+                  for batch in source.iter_raw_batches(query=json.loads(args.mongo_query)))
+    else:
+        chunks = (batch for path in args.inputs
+                  for batch in FileDataSource(path=path, batch_size=args.chunk_size).iter_batches())
+
+    if args.output is not None:
+        writer = ParquetPredictionWriter(args.output, compression=config.parquet_compression)
+    else:
+        output_collection = get_collection(args.database, args.output_collection, mongo_url=args.mongo_url,
+                                           use_mongomock=args.mongomock)
+        if args.mongomock and args.mongo_query is not None:
+            output_collection = collection.database[args.output_collection]
+        writer = MongoPredictionWriter(output_collection, id_column=config.id_column)
+
+    report = BatchPrediction(batch_prediction_config=config, model_path=args.model_path).run(chunks, writer)
+
+    print(f"Scored {report['rows']} rows in {report['chunks']} chunks with model {report['model_version']} "
+          f"in {report['seconds']:.2f}s ({report['rows_per_second']:,.0f} rows/s, {report['workers']} workers, "
+          f"{report['errors']} rows with errors)")
+    for stats in report["worker_stats"]:
+        print(f"  worker {stats['pid']}: {stats['rows']} rows in {stats['chunks']} chunks, "
+              f"{stats['rows_per_second']:,.0f} rows/s")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,20 @@
+import asyncio
 import os
 import sys
+import time
+import threading
 
 import numpy as np
 import pandas as pd
+from heart_disease.constants import SCHEMA_FILE_PATH
 from heart_disease.entity.config_entity import HeartDiseasePredictorConfig
 from heart_disease.entity.blob_estimator import HeartDieseaseEstimator 
+from heart_disease.entity.cohort_model_pool import CohortModelPool
+from heart_disease.entity.prediction_cache import PredictionCache, canonicalize_rows, canonicalize_value
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
-from heart_disease.utils.main_utils import read_yaml_file
+from heart_disease.utils.main_utils import read_yaml_file, cohort_slug
+from heart_disease.utils.synthetic_data import generate_prediction_input, get_schema_column_types
 from pandas import DataFrame
 
 
@@ -24,11 +31,13 @@ class HeartDieseaseData:
         exang: int,
         oldpeak: int,
         slope: str,
+        dataset: str = None,
 
     ):
         """
         HeartDiseaseData constructor
-        Input: all features of the trained model for prediction
+        Input: all features of the trained model for prediction, dataset (source site) optionally
+        routes the prediction to the model of that cohort
         """
         try:
 
@@ -41,6 +50,7 @@ class HeartDieseaseData:
             self.exang = exang
             self.oldpeak = oldpeak
             self.slope = slope
+            self.dataset = dataset
 
 
         except Exception as e:
@@ -78,6 +88,8 @@ class HeartDieseaseData:
                 "oldpeak": [self.oldpeak],
                 "slope": [self.slope],
             }
+            if self.dataset:
+                input_data["dataset"] = [self.dataset]
 
             logging.info("Created get_heart disease data dict")
 
@@ -93,6 +105,26 @@ class HeartDieseaseData:
 
 
 class HeartDiseaseClassifier:
+    """
+    Serves predictions from the registry model. The estimator and the prediction cache are shared by
+    every instance of the class so the model is loaded once per process and repeated inputs are
+    answered from memory. The cache is keyed on the model version and cleared when the model is swapped.
+    Rows with a cohort (dataset column) that has a model of its own in the registry are scored by that
+    model from the shared CohortModelPool, all other rows by the global model.
+    """
+    _estimator: HeartDieseaseEstimator = None
+    _cohort_pool: CohortModelPool = None
+    _prediction_cache: PredictionCache = None
+    _model_version: str = None
+    _version_checked_at: float = 0.0
+    # set by preload_model: the version is then only changed by the next preload_model call
+    _version_pinned: bool = False
+    # outcome of the last warm-up of the served model, the app is ready once it succeeded
+    _warm_up_status: dict = {"ready": False, "status": "starting"}
+    # numeric fields of config/schema.yaml, the only ones whose numeric strings share the cache key of the number
+    _numeric_columns: frozenset = None
+    _lock = threading.Lock()
+
     def __init__(self,prediction_pipeline_config: HeartDiseasePredictorConfig = HeartDiseasePredictorConfig(),) -> None:
         """
         :param prediction_pipeline_config: Configuration for prediction the value
@@ -100,23 +132,451 @@ class HeartDiseaseClassifier:
         try:
             # self.schema_config = read_yaml_file(SCHEMA_FILE_PATH)
             self.prediction_pipeline_config = prediction_pipeline_config
+            with HeartDiseaseClassifier._lock:
+                if HeartDiseaseClassifier._estimator is None:
+                    model_path = self.prediction_pipeline_config.model_file_path
+                    fallback_model_path = self.prediction_pipeline_config.fallback_model_file_path
+                    HeartDiseaseClassifier._estimator = HeartDieseaseEstimator(
+                        blob_name=self.prediction_pipeline_config.model_blob_name,
+                        model_path=model_path,
+                        fallback_model_path=fallback_model_path if fallback_model_path != model_path else None,
+                    )
+                if HeartDiseaseClassifier._cohort_pool is None and \
+                        self.prediction_pipeline_config.cohort_models_enabled:
+                    HeartDiseaseClassifier._cohort_pool = CohortModelPool(
+                        storage=HeartDiseaseClassifier._estimator.blobS)
+                if HeartDiseaseClassifier._numeric_columns is None:
+                    column_types = get_schema_column_types(read_yaml_file(file_path=SCHEMA_FILE_PATH))
+                    HeartDiseaseClassifier._numeric_columns = frozenset(
+                        column for column, column_type in column_types.items() if column_type != "category")
+                if HeartDiseaseClassifier._prediction_cache is None:
+                    HeartDiseaseClassifier._prediction_cache = PredictionCache(
+                        max_size=self.prediction_pipeline_config.cache_max_size,
+                        ttl_seconds=self.prediction_pipeline_config.cache_ttl_seconds,
+                    )
         except Exception as e:
             raise HeartdieseaseException(e, sys)
 
-    def predict(self, dataframe) -> str:
+    def is_model_version_check_due(self) -> bool:
+        """
+        Returns whether get_model_version will check the registry (and block on the blob store) instead of
+        returning the version checked within model_version_check_interval
+        """
+        cls = HeartDiseaseClassifier
+        return cls._model_version is None or (not cls._version_pinned and time.monotonic() - cls._version_checked_at >=
+                                              self.prediction_pipeline_config.model_version_check_interval)
+
+    def get_model_version(self) -> str:
+        """
+        Returns the version of the registry model, checked at most once per model_version_check_interval.
+        When the version changed the loaded model is dropped and the prediction cache is cleared.
+        """
+        try:
+            cls = HeartDiseaseClassifier
+            if not self.is_model_version_check_due():
+                return cls._model_version
+
+            with cls._lock:
+                # checked again under the lock, the callers that waited for it use the version just checked
+                if not self.is_model_version_check_due():
+                    return cls._model_version
+                model_version = cls._estimator.get_model_version()
+                if cls._model_version is not None and model_version != cls._model_version:
+                    logging.info(f"Model version changed from {cls._model_version} to {model_version}")
+                    cls._estimator.invalidate(model_version)
+                    cls._prediction_cache.clear()
+                cls._model_version = model_version
+                cls._version_checked_at = time.monotonic()
+            return model_version
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def refresh_model(self) -> str:
+        """
+        Returns the version of the registry model after checking it and loading the model of a new version,
+        run in the thread pool by the async request handlers when the version check is due
+        """
+        try:
+            model_version = self.get_model_version()
+            HeartDiseaseClassifier._estimator.get_loaded_model()
+            return model_version
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    async def refresh_model_async(self, storage) -> str:
+        """
+        Checks the registry version with the async blob client (AsyncSimpleStorageService) and, when it changed,
+        downloads, warms up and swaps in the new model without blocking the event loop. Run periodically by the app so
+        request handlers find a recent version check and a loaded model instead of calling the blob store.
+        """
+        try:
+            cls = HeartDiseaseClassifier
+            config = self.prediction_pipeline_config
+            model_path = config.model_file_path
+            container_name = config.model_blob_name
+            checked_at = time.monotonic()
+            if model_path != config.fallback_model_file_path and not await storage.exists(model_path, container_name):
+                logging.warning(f"{model_path} not found, serving {config.fallback_model_file_path}")
+                model_path = config.fallback_model_file_path
+            model_version = await storage.get_blob_version(model_path, container_name)
+
+            if model_version != cls._model_version or cls._estimator.loaded_model is None:
+                model = await storage.load_model(model_path, version=model_version)
+                # requests keep the previous model until the new one is warm
+                warm_up_status = await asyncio.to_thread(self.warm_up, model, model_version)
+                with cls._lock:
+                    # a version checked by get_model_version during the download is newer than this one
+                    if cls._model_version is not None and cls._version_checked_at > checked_at:
+                        return cls._model_version
+                    if cls._model_version is not None and model_version != cls._model_version:
+                        logging.info(f"Model version changed from {cls._model_version} to {model_version}")
+                        cls._prediction_cache.clear()
+                    cls._estimator.set_loaded_model(model, model_version)
+                    cls._model_version = model_version
+                    cls._warm_up_status = warm_up_status
+                    cls._version_checked_at = checked_at
+            else:
+                with cls._lock:
+                    cls._version_checked_at = max(cls._version_checked_at, checked_at)
+            return model_version
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def preload_model(self) -> str:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: the version of the registry model, loaded (with its compiled preprocessor and the hottest cohort
+        models) before the first request, and pins it: requests no longer check the registry and the model is only
+        swapped by the next preload_model call. Used by the prefork master, which loads the model once and forks
+        workers sharing it, and forks new workers after a reload.
+        """
+        try:
+            logging.info("Entered preload_model method of HeartDiseaseClassifier class")
+            cls = HeartDiseaseClassifier
+            with cls._lock:
+                model_version = cls._estimator.get_model_version()
+                if model_version != cls._model_version or cls._estimator.loaded_model is None:
+                    if cls._model_version is not None:
+                        logging.info(f"Model version changed from {cls._model_version} to {model_version}")
+                        cls._prediction_cache.clear()
+                    cls._estimator.invalidate(model_version)
+                model = cls._estimator.get_loaded_model()
+                if hasattr(model, "get_compiled_preprocessor"):
+                    model.get_compiled_preprocessor()
+                cls._model_version = model_version
+                cls._version_checked_at = time.monotonic()
+                cls._version_pinned = True
+            if self.prediction_pipeline_config.cohort_models_enabled:
+                self.prefetch_cohort_models()
+            return model_version
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def warm_up(self, model=None, model_version: str = None) -> dict:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: the warm-up status of model (the served global model, loaded first when needed, when None) after
+        running the synthetic warm-up rows of config/schema.yaml through its prediction paths: the DataFrame path
+        with the ColumnTransformer and the array path with the compiled preprocessor, as one batch and row by
+        row, so that the first requests do not pay for the model load and the first-call initializations. The
+        prediction cache is not used. The app reports ready once the served model has been warmed up.
+        """
+        serving = model is None
+        try:
+            logging.info("Entered warm_up method of HeartDiseaseClassifier class")
+            cls = HeartDiseaseClassifier
+            config = self.prediction_pipeline_config
+            start = time.perf_counter()
+            if serving:
+                model_version = self.get_model_version()
+                model = cls._estimator.get_loaded_model()
+
+            rows = generate_prediction_input(config.warm_up_rows, random_state=config.warm_up_random_state) \
+                if config.warm_up_rows else None
+            if rows is not None:
+                columns = {column: rows[column].to_numpy() for column in rows.columns}
+                model.predict_with_scores(rows)
+                model.predict_columns_with_scores(columns)
+                for i in range(min(config.warm_up_single_row_calls, len(rows))):
+                    model.predict_with_scores(rows.iloc[[i]])
+                    model.predict_columns_with_scores({column: values[i:i + 1] for column, values in columns.items()})
+
+            status = {"ready": True, "status": "ready", "model_version": model_version,
+                      "warm_up_rows": 0 if rows is None else len(rows),
+                      "warm_up_seconds": round(time.perf_counter() - start, 3)}
+            logging.info(f"Warmed up model {model_version} in {status['warm_up_seconds']}s")
+            if serving:
+                cls._warm_up_status = status
+            return status
+
+        except Exception as e:
+            if serving:
+                HeartDiseaseClassifier._warm_up_status = {"ready": False, "status": "warm up failed", "error": f"{e}"}
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def get_warm_up_status() -> dict:
+        """
+        Returns whether the served model has been warmed up, with its version and warm-up time
+        """
+        return HeartDiseaseClassifier._warm_up_status
+
+    def is_cohort_model_load_due(self, data) -> bool:
+        """
+        Returns whether routing the rows of data (a DataFrame or a dict of columns) to their cohort models reads
+        the registry (and blocks on the blob store): a cohort model that is not resident or a manifest re-read
+        """
+        pool = HeartDiseaseClassifier._cohort_pool
+        cohorts = data.get(self.prediction_pipeline_config.cohort_column)
+        if pool is None or cohorts is None:
+            return False
+        return not all(pool.is_resident(cohort) for cohort in set(cohorts) if isinstance(cohort, str))
+
+    def get_row_models(self, dataframe) -> list:
+        """
+        Returns per row the (cache version, cohort model) of its cohort, None for rows served by the global model
+        """
+        cohort_column = self.prediction_pipeline_config.cohort_column
+        if cohort_column not in dataframe.columns:
+            return [None] * len(dataframe)
+        return self.get_cohort_models(list(dataframe[cohort_column]))
+
+    def get_cohort_models(self, cohorts: list) -> list:
+        """
+        Returns per cohort value the (cache version, cohort model) of the cohort, None when it has no model
+        """
+        pool = HeartDiseaseClassifier._cohort_pool
+        if pool is None:
+            return [None] * len(cohorts)
+
+        cohort_models = {}
+        for cohort in set(cohort for cohort in cohorts if isinstance(cohort, str)):
+            try:
+                model_and_version = pool.get_model(cohort)
+            except Exception as e:
+                logging.warning(f"Serving cohort {cohort} with the global model, loading its model failed: {e}")
+                model_and_version = None
+            if model_and_version is not None:
+                model, version = model_and_version
+                cohort_models[cohort] = (f"{cohort_slug(cohort)}:{version}", model)
+        return [cohort_models.get(cohort) for cohort in cohorts]
+
+    def predict(self, dataframe) -> np.ndarray:
         """
         This is the method of HeartDiseaseClassifier
-        Returns: Prediction in string format
+        Returns: Array of predicted classes
         """
         try:
             logging.info("Entered predict method of HeartDiseaseClassifier class")
-            model = HeartDieseaseEstimator(
-                blob_name=self.prediction_pipeline_config.model_blob_name,
-                model_path=self.prediction_pipeline_config.model_file_path,
-            )
-            result =  model.predict(dataframe)
-            
-            return result
-        
+            return self.predict_with_scores(dataframe)["prediction"].to_numpy()
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def predict_with_scores(self, dataframe) -> DataFrame:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: DataFrame with prediction, per-class probabilities and risk_score columns.
+        Only the rows missing from the prediction cache are sent through the model.
+        """
+        try:
+            logging.info("Entered predict_with_scores method of HeartDiseaseClassifier class")
+            model_version = self.get_model_version()
+            row_models = self.get_row_models(dataframe)
+            columns, rows = canonicalize_rows(dataframe, HeartDiseaseClassifier._numeric_columns)
+            keys = [(model_version if row_model is None else row_model[0], columns, row)
+                    for row_model, row in zip(row_models, rows)]
+
+            cache = HeartDiseaseClassifier._prediction_cache
+            results = [cache.get(key) for key in keys]
+            missing = [position for position, result in enumerate(results) if result is None]
+
+            if missing:
+                # the cohort only routes, the models are trained without it
+                features = dataframe.drop(columns=[self.prediction_pipeline_config.cohort_column], errors="ignore")
+                model_positions = {}
+                for position in missing:
+                    model_positions.setdefault(row_models[position], []).append(position)
+                for row_model, positions in model_positions.items():
+                    estimator = HeartDiseaseClassifier._estimator if row_model is None else row_model[1]
+                    scores_df = estimator.predict_with_scores(features.iloc[positions])
+                    for position, record in zip(positions, scores_df.to_dict(orient="records")):
+                        cache.put(keys[position], record)
+                        results[position] = record
+
+            logging.info(f"Prediction cache hits: {len(keys) - len(missing)}/{len(keys)}")
+            scores_df = DataFrame(results, index=dataframe.index)
+            if any(row_model is not None for row_model in row_models):
+                # a cohort model may not have seen every class of the global model
+                probability_columns = sorted((column for column in scores_df.columns
+                                              if column.startswith("probability_")),
+                                             key=lambda column: int(column.replace("probability_", "")))
+                scores_df = scores_df[["prediction", *probability_columns, "risk_score"]]
+                scores_df[probability_columns] = scores_df[probability_columns].fillna(0.0)
+            return scores_df
+
         except Exception as e:
-            raise HeartdieseaseException(e, sys)
\ No newline at end of file
+            raise HeartdieseaseException(e, sys)
+
+    def predict_columns(self, columns: dict, use_cache: bool = True) -> list:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: per row the cached record of predict_with_scores (prediction, probability_<class>, risk_score)
+        for raw inputs given as one array per input field, scored without building a DataFrame.
+        Bulk scoring passes use_cache=False so that one-off rows do not evict the cached online predictions.
+        """
+        try:
+            logging.info("Entered predict_columns method of HeartDiseaseClassifier class")
+            model_version = self.get_model_version()
+            cohort_column = self.prediction_pipeline_config.cohort_column
+            n_rows = len(next(iter(columns.values())))
+            cohorts = columns.get(cohort_column)
+            row_models = self.get_cohort_models(list(cohorts)) if cohorts is not None else [None] * n_rows
+
+            cache = HeartDiseaseClassifier._prediction_cache
+            results = [None] * n_rows
+            if use_cache:
+                # the same keys as predict_with_scores, both endpoints share the cached predictions
+                key_columns = tuple(sorted(columns))
+                numeric = [column in HeartDiseaseClassifier._numeric_columns for column in key_columns]
+                rows = zip(*(columns[column] for column in key_columns))
+                keys = [(model_version if row_model is None else row_model[0], key_columns,
+                         tuple(canonicalize_value(value, is_numeric) for value, is_numeric in zip(row, numeric)))
+                        for row_model, row in zip(row_models, rows)]
+                results = [cache.get(key) for key in keys]
+            missing = [position for position, result in enumerate(results) if result is None]
+
+            model_positions = {}
+            for position in missing:
+                model_positions.setdefault(row_models[position], []).append(position)
+            for row_model, positions in model_positions.items():
+                estimator = HeartDiseaseClassifier._estimator if row_model is None else row_model[1]
+                # the cohort only routes, the models are trained without it
+                model_columns = {column: values[positions] for column, values in columns.items()
+                                 if column != cohort_column}
+                predictions, probabilities, classes, risk_scores = \
+                    estimator.predict_columns_with_scores(model_columns)
+                for i, position in enumerate(positions):
+                    record = {"prediction": predictions[i].item(),
+                              **{f"probability_{label}": float(probabilities[i, j]) for j, label in enumerate(classes)},
+                              "risk_score": float(risk_scores[i])}
+                    if use_cache:
+                        cache.put(keys[position], record)
+                    results[position] = record
+
+            logging.info(f"Prediction cache hits: {n_rows - len(missing)}/{n_rows}")
+            return results
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def score_columns(self, columns: dict) -> tuple:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: the predicted classes, the per-class probabilities, their class labels and the risk scores of raw
+        inputs given as one array per input field, as arrays and without the prediction cache, for binary
+        service-to-service traffic where building one record per row would cost more than the model
+        """
+        try:
+            logging.info("Entered score_columns method of HeartDiseaseClassifier class")
+            self.get_model_version()
+            cohort_column = self.prediction_pipeline_config.cohort_column
+            n_rows = len(next(iter(columns.values())))
+            cohorts = columns.get(cohort_column)
+            row_models = self.get_cohort_models(list(cohorts)) if cohorts is not None else [None] * n_rows
+            model_columns = {column: values for column, values in columns.items() if column != cohort_column}
+            if all(row_model is None for row_model in row_models):
+                return HeartDiseaseClassifier._estimator.predict_columns_with_scores(model_columns)
+
+            model_positions = {}
+            for position, row_model in enumerate(row_models):
+                model_positions.setdefault(row_model, []).append(position)
+            scored = []
+            for row_model, positions in model_positions.items():
+                estimator = HeartDiseaseClassifier._estimator if row_model is None else row_model[1]
+                positions = np.asarray(positions)
+                scored.append((positions, estimator.predict_columns_with_scores(
+                    {column: values[positions] for column, values in model_columns.items()})))
+
+            # a cohort model may not have seen every class of the global model
+            classes = np.unique(np.concatenate([model_scores[2] for _, model_scores in scored]))
+            predictions = np.empty(n_rows, dtype=classes.dtype)
+            probabilities = np.zeros((n_rows, len(classes)))
+            risk_scores = np.empty(n_rows)
+            for positions, (model_predictions, model_probabilities, model_classes, model_risk_scores) in scored:
+                predictions[positions] = model_predictions
+                probabilities[positions[:, None], np.searchsorted(classes, model_classes)] = model_probabilities
+                risk_scores[positions] = model_risk_scores
+            return predictions, probabilities, classes, risk_scores
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def explain(self, dataframe, scores_df: DataFrame) -> list:
+        """
+        This is the method of HeartDiseaseClassifier
+        Returns: per row the attributions of the raw input fields to its predicted class (from scores_df) and
+        their base value, by the model that scored the row. Rows are explained in chunks until the explanation
+        latency budget is spent, the rows left get None.
+        """
+        try:
+            logging.info("Entered explain method of HeartDiseaseClassifier class")
+            start = time.perf_counter()
+            budget_seconds = self.prediction_pipeline_config.explanation_latency_budget_ms / 1000
+            chunk_size = self.prediction_pipeline_config.explanation_chunk_size
+            features = dataframe.drop(columns=[self.prediction_pipeline_config.cohort_column], errors="ignore")
+            predictions = scores_df["prediction"].to_numpy()
+
+            model_positions = {}
+            for position, row_model in enumerate(self.get_row_models(dataframe)):
+                model_positions.setdefault(row_model, []).append(position)
+
+            explanations = [None] * len(dataframe)
+            for row_model, positions in model_positions.items():
+                estimator = HeartDiseaseClassifier._estimator if row_model is None else row_model[1]
+                for chunk_start in range(0, len(positions), chunk_size):
+                    if time.perf_counter() - start > budget_seconds:
+                        break
+                    chunk = positions[chunk_start:chunk_start + chunk_size]
+                    attributions_df = estimator.explain(features.iloc[chunk], classes=predictions[chunk])
+                    for position, record in zip(chunk, attributions_df.to_dict(orient="records")):
+                        base_value = record.pop("base_value")
+                        explanations[position] = {"base_value": base_value, "contributions": record}
+
+            explained = sum(explanation is not None for explanation in explanations)
+            logging.info(f"Explained {explained}/{len(explanations)} rows in "
+                         f"{(time.perf_counter() - start) * 1000:.1f} ms")
+            return explanations
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        """
+        Returns hit-rate metrics of the shared prediction cache
+        """
+        cache = HeartDiseaseClassifier._prediction_cache
+        stats = cache.stats() if cache is not None else {}
+        stats["model_version"] = HeartDiseaseClassifier._model_version
+        return stats
+
+    @staticmethod
+    def get_cohort_pool_stats() -> dict:
+        """
+        Returns residency and hit-rate metrics of the shared cohort model pool
+        """
+        pool = HeartDiseaseClassifier._cohort_pool
+        return pool.stats() if pool is not None else {"enabled": False}
+
+    @staticmethod
+    def prefetch_cohort_models() -> list:
+        """
+        Load the hottest cohort models ahead of their requests
+        """
+        pool = HeartDiseaseClassifier._cohort_pool
+        return pool.prefetch() if pool is not None else []
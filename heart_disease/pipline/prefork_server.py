@@ -0,0 +1,307 @@
+"""
+Multi-worker serving of the FastAPI app with the model in memory shared copy-on-write.
+
+    python app.py --workers 4
+    kill -HUP <master pid>    # reload the registry model and replace the workers one by one
+
+The master process imports the app (and with it pandas, sklearn, catboost, ...), loads the registry model with
+its compiled preprocessor and the hottest cohort models, freezes the garbage collector so that collections in
+the workers do not write to the pages of these objects, and forks the workers, which serve on the socket bound by
+the master. The workers never load the global model themselves: the master polls the registry version and, when
+it changed (or on SIGHUP), loads the new model and forks a new worker before stopping each previous one, so every
+worker shares the memory of the model it serves. A worker that exits is replaced. GET /metrics/memory reports the
+unique (USS) and proportional (PSS) memory of the master and every worker.
+"""
+import asyncio
+import gc
+import os
+import select
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from heart_disease.configuration.client_manager import ClientManager
+from heart_disease.entity.config_entity import PreforkServerConfig
+from heart_disease.logger import logging
+from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+from heart_disease.utils.process_memory import get_child_pids, read_process_memory
+
+# pid of the prefork master, inherited by the forked workers, None in a single process server
+_master_pid: Optional[int] = None
+
+server_logger = logging.getLogger("uvicorn.error")
+
+
+def _log(message: str, level: int = logging.INFO) -> None:
+    logging.log(level, message)
+    server_logger.log(level, message)
+
+
+def get_server_memory() -> dict:
+    """
+    Memory in MB of the master and of every worker of the server (of the current process when it is not
+    preforked), with the totals of their unique and proportional memory
+    """
+    master = read_process_memory(_master_pid) if _master_pid is not None else None
+    worker_pids = get_child_pids(_master_pid) if _master_pid is not None else [os.getpid()]
+    workers = [memory for memory in map(read_process_memory, worker_pids) if memory is not None]
+    processes = workers + ([master] if master is not None else [])
+    return {
+        "master": master,
+        "workers": workers,
+        "total_uss": round(sum(memory["uss"] for memory in processes), 1),
+        "total_pss": round(sum(memory["pss"] for memory in processes), 1),
+        "total_rss": round(sum(memory["rss"] for memory in processes), 1),
+    }
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    uvicorn server of a forked worker, tells the master through a pipe once the app has started and warmed up
+    its model, so that a reload only stops a previous worker when its replacement is ready
+    """
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        while not self.should_exit and not HeartDiseaseClassifier.get_warm_up_status()["ready"]:
+            await asyncio.sleep(0.05)
+        if not self.should_exit:
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+
+class PreforkServer:
+    """
+    Master process of the multi-worker server: loads the model once, forks the workers sharing it, replaces
+    workers that exit and reloads the model across all workers when its registry version changes
+    """
+
+    def __init__(self, app, prefork_server_config: PreforkServerConfig = PreforkServerConfig(),
+                 log_level: str = "info"):
+        """
+        :param app: ASGI application served by the workers
+        :param prefork_server_config: address, number of workers and timeouts of the server
+        :param log_level: uvicorn log level of the workers
+        """
+        self.app = app
+        self.prefork_server_config = prefork_server_config
+        self.uvicorn_config = uvicorn.Config(app, host=prefork_server_config.host, port=prefork_server_config.port,
+                                             log_level=log_level, lifespan="on",
+                                             timeout_graceful_shutdown=int(prefork_server_config.graceful_timeout))
+        self.socket: Optional[socket.socket] = None
+        # running workers by pid, with the generation (model load) they were forked from
+        self.workers: Dict[int, int] = {}
+        # stopped workers by pid, with the time they are killed at if they have not exited
+        self.retiring: Dict[int, float] = {}
+        self.generation = 0
+        self._stopping = False
+        self._reload_requested = False
+
+    def load_model(self) -> str:
+        """
+        Loads the registry model in the master and freezes the objects loaded so far (the imported modules
+        and the model) in the permanent generation of the garbage collector, which never touches them
+        """
+        gc.unfreeze()
+        model_version = HeartDiseaseClassifier().preload_model()
+        # every worker opens its own pooled Mongo / blob connections, the master's must not be shared by them
+        ClientManager.get_instance().close()
+        gc.collect()
+        gc.freeze()
+        self.generation += 1
+        _log(f"Prefork master {os.getpid()} loaded model {model_version}, {gc.get_freeze_count()} objects frozen")
+        return model_version
+
+    def bind(self) -> socket.socket:
+        config = self.prefork_server_config
+        sock = socket.socket(socket.AF_INET6 if ":" in config.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((config.host, config.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def run_worker(self, ready_fd: int) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # reloads are coordinated by the master
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        WorkerServer(self.uvicorn_config, ready_fd).run(sockets=[self.socket])
+
+    def spawn_worker(self) -> tuple:
+        """
+        Forks a worker, returns its pid and the pipe it reports its startup on
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            exit_code = 0
+            try:
+                self.run_worker(write_fd)
+            except BaseException:
+                logging.exception("Prefork worker failed")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        os.close(write_fd)
+        self.workers[pid] = self.generation
+        return pid, read_fd
+
+    def start_workers(self, n_workers: int) -> List[int]:
+        """
+        Forks n_workers workers and waits until they serve, returns the pids of the ready ones; a worker not
+        ready within worker_ready_timeout is killed
+        """
+        pending = dict(self.spawn_worker() for _ in range(n_workers))
+        ready, failed = [], []
+        deadline = time.monotonic() + self.prefork_server_config.worker_ready_timeout
+        while pending and time.monotonic() < deadline:
+            fds = {read_fd: pid for pid, read_fd in pending.items()}
+            readable, _, _ = select.select(list(fds), [], [], max(0.0, deadline - time.monotonic()))
+            for read_fd in readable:
+                pid = fds[read_fd]
+                if os.read(read_fd, 1):
+                    ready.append(pid)
+                else:
+                    _log(f"Prefork worker {pid} exited before serving", logging.ERROR)
+                    failed.append(pid)
+                os.close(read_fd)
+                del pending[pid]
+        for pid, read_fd in pending.items():
+            _log(f"Prefork worker {pid} not ready after {self.prefork_server_config.worker_ready_timeout}s",
+                 logging.ERROR)
+            os.close(read_fd)
+            failed.append(pid)
+        for pid in failed:
+            self.retire_worker(pid, graceful=False)
+        return ready
+
+    def retire_worker(self, pid: int, graceful: bool = True) -> None:
+        self.workers.pop(pid, None)
+        self.retiring[pid] = time.monotonic() + (self.prefork_server_config.graceful_timeout if graceful else 0)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def reap_workers(self) -> None:
+        """
+        Collects exited workers, kills stopped workers past their graceful timeout and replaces the running
+        workers that exited
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self.retiring.pop(pid, None)
+            if self.workers.pop(pid, None) is not None and not self._stopping:
+                _log(f"Prefork worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, starting a new one",
+                     logging.WARNING)
+        now = time.monotonic()
+        for pid, kill_at in list(self.retiring.items()):
+            if now >= kill_at:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.retiring.pop(pid)
+        missing = self.prefork_server_config.n_workers - len(self.workers)
+        if missing > 0 and not self._stopping:
+            self.start_workers(missing)
+
+    def reload(self, force: bool = False) -> None:
+        """
+        Loads the new registry model, or the same one when forced, and replaces the workers one at a time by
+        workers forked after the load, so that the server keeps serving and never holds more than one worker
+        beyond its size. A reload that fails keeps the previous workers
+        """
+        try:
+            model_version = HeartDiseaseClassifier._estimator.get_model_version()
+            ClientManager.get_instance().close()
+            if model_version == HeartDiseaseClassifier._model_version and not force:
+                return
+            previous_workers = list(self.workers)
+            self.load_model()
+        except Exception as e:
+            _log(f"Model reload failed, keeping the current workers: {e}", logging.ERROR)
+            return
+        for pid in previous_workers:
+            if not self.start_workers(1):
+                _log("A reloaded worker did not start, keeping the previous workers", logging.ERROR)
+                return
+            self.retire_worker(pid)
+        _log(f"Reloaded {len(previous_workers)} workers with model {HeartDiseaseClassifier._model_version}")
+
+    def log_memory(self) -> None:
+        memory = get_server_memory()
+        if memory["master"] is None:
+            return
+        workers = ", ".join(f"{worker['pid']}: uss={worker['uss']} pss={worker['pss']} rss={worker['rss']}"
+                            for worker in memory["workers"])
+        _log(f"Memory (MB) master: pss={memory['master']['pss']} uss={memory['master']['uss']}, workers {workers}; "
+             f"total uss={memory['total_uss']} pss={memory['total_pss']} rss={memory['total_rss']}")
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame) -> None:
+        self._reload_requested = True
+
+    def stop_workers(self) -> None:
+        for pid in list(self.workers):
+            self.retire_worker(pid)
+        while self.retiring:
+            self.reap_workers()
+            time.sleep(0.1)
+
+    def run(self) -> int:
+        """
+        Method Name :   run
+        Description :   This method loads the model, forks the workers and supervises them until SIGTERM / SIGINT
+
+        Output      :   exit code of the master, 1 when no worker started
+        """
+        global _master_pid
+        config = self.prefork_server_config
+        _master_pid = os.getpid()
+        self.load_model()
+        self.socket = self.bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        try:
+            ready = self.start_workers(config.n_workers)
+            _log(f"Prefork master {_master_pid} serving on {config.host}:{config.port} with {len(ready)} workers")
+            if not ready:
+                return 1
+            self.log_memory()
+            now = time.monotonic()
+            next_version_check = now + config.model_version_check_interval
+            next_memory_report = now + config.memory_report_interval
+            while not self._stopping:
+                self.reap_workers()
+                now = time.monotonic()
+                if self._reload_requested or now >= next_version_check:
+                    force, self._reload_requested = self._reload_requested, False
+                    self.reload(force=force)
+                    next_version_check = time.monotonic() + config.model_version_check_interval
+                if config.memory_report_interval and now >= next_memory_report:
+                    self.log_memory()
+                    next_memory_report = now + config.memory_report_interval
+                time.sleep(0.5)
+            return 0
+        finally:
+            _log(f"Prefork master {_master_pid} stopping {len(self.workers)} workers")
+            self._stopping = True
+            self.stop_workers()
+            self.socket.close()
@@ -1,4 +1,9 @@
 import sys
+from datetime import datetime
+from typing import Optional
+
+import yaml
+
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
 from heart_disease.components.data_ingestion import DataIngestion 
@@ -7,6 +12,13 @@ from heart_disease.components.data_transformation import DataTransformation
 from heart_disease.components.model_trainer import ModelTrainer
 from heart_disease.components.model_evaluation import ModelEvaluation
 from heart_disease.components.model_pusher import ModelPusher
+from heart_disease.components.model_compaction import ModelCompaction
+from heart_disease.components.cohort_trainer import CohortTrainer
+from heart_disease.components.incremental_trainer import IncrementalTrainer, get_schema_hash
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.constants import SCHEMA_FILE_PATH
+from heart_disease.entity.blob_estimator import HeartDieseaseEstimator
+from heart_disease.utils.main_utils import read_yaml_file
 
 
 from heart_disease.entity.config_entity import (DataIngestionConfig,
@@ -14,7 +26,10 @@ from heart_disease.entity.config_entity import (DataIngestionConfig,
                                           DataTransformationConfig,
                                           ModelTrainerConfig,
                                           ModelEvaluationConfig,
-                                          ModelPusherConfig
+                                          ModelPusherConfig,
+                                          ModelCompactionConfig,
+                                          CohortTrainingConfig,
+                                          IncrementalTrainingConfig
                                           )
 
 
@@ -23,7 +38,10 @@ from heart_disease.entity.artifact_entity import (DataIngestionArtifact,
                                             DataTransformationArtifact,
                                             ModelTrainerArtifact,
                                             ModelEvaluationArtifact,
-                                            ModelPusherArtifact
+                                            ModelPusherArtifact,
+                                            ModelCompactionArtifact,
+                                            CohortTrainingArtifact,
+                                            IncrementalTrainingArtifact
                                             )
 
 
@@ -36,20 +54,24 @@ class TrainingPipeline:
         self.model_trainer_config = ModelTrainerConfig()
         self.model_evaluation_config = ModelEvaluationConfig()
         self.model_pusher_config = ModelPusherConfig()
+        self.model_compaction_config = ModelCompactionConfig()
+        self.cohort_training_config = CohortTrainingConfig()
+        self.incremental_training_config = IncrementalTrainingConfig()
 
 
     
 
 
-    def start_data_ingestion(self) -> DataIngestionArtifact:
+    def start_data_ingestion(self, watermark=None) -> DataIngestionArtifact:
         """
-        This method of TrainPipeline class is responsible for starting data ingestion component
+        This method of TrainPipeline class is responsible for starting data ingestion component,
+        only the records after watermark are ingested when one is given
         """
         try:
             logging.info("Entered the start_data_ingestion method of TrainPipeline class")
             logging.info("Getting the data from mongodb")
             data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config)
-            data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
+            data_ingestion_artifact = data_ingestion.initiate_data_ingestion(watermark=watermark)
             logging.info("Got the train_set and test_set from mongodb")
             logging.info(
                 "Exited the start_data_ingestion method of TrainPipeline class"
@@ -126,19 +148,156 @@ class TrainingPipeline:
         except Exception as e:
             raise HeartdieseaseException(e, sys)
 
-    def start_model_pusher(self, model_evaluation_artifact: ModelEvaluationArtifact) -> ModelPusherArtifact:
+    def start_model_compaction(self, data_transformation_artifact: DataTransformationArtifact,
+                               model_trainer_artifact: ModelTrainerArtifact) -> ModelCompactionArtifact:
+        """
+        This method of TrainPipeline class is responsible for building the compact serving variant of the model
+        """
+        try:
+            model_compaction = ModelCompaction(model_compaction_config=self.model_compaction_config,
+                                               data_transformation_artifact=data_transformation_artifact,
+                                               model_trainer_artifact=model_trainer_artifact,
+                                               model_trainer_config=self.model_trainer_config)
+            model_compaction_artifact = model_compaction.initiate_model_compaction()
+            return model_compaction_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def start_model_pusher(self, model_evaluation_artifact: ModelEvaluationArtifact,
+                           model_compaction_artifact: Optional[ModelCompactionArtifact] = None,
+                           model_trainer_artifact: Optional[ModelTrainerArtifact] = None) -> ModelPusherArtifact:
         """
         This method of TrainPipeline class is responsible for starting model pushing
         """
         try:
             model_pusher = ModelPusher(model_evaluation_artifact=model_evaluation_artifact,
-                                       model_pusher_config=self.model_pusher_config
+                                       model_pusher_config=self.model_pusher_config,
+                                       model_compaction_artifact=model_compaction_artifact,
+                                       model_trainer_artifact=model_trainer_artifact
                                        )
             model_pusher_artifact = model_pusher.initiate_model_pusher()
             return model_pusher_artifact
         except Exception as e:
             raise HeartdieseaseException(e, sys)
 
+    def start_cohort_training(self, data_ingestion_artifact: DataIngestionArtifact,
+                              data_validation_artifact: DataValidationArtifact) -> CohortTrainingArtifact:
+        """
+        This method of TrainPipeline class is responsible for training and pushing the per-cohort models
+        """
+        try:
+            cohort_trainer = CohortTrainer(cohort_training_config=self.cohort_training_config,
+                                           data_ingestion_artifact=data_ingestion_artifact,
+                                           data_validation_artifact=data_validation_artifact,
+                                           data_transformation_config=self.data_transformation_config,
+                                           model_trainer_config=self.model_trainer_config,
+                                           model_evaluation_config=self.model_evaluation_config)
+            cohort_training_artifact = cohort_trainer.initiate_cohort_training()
+            return cohort_training_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def get_training_state(self) -> Optional[dict]:
+        """
+        This method of TrainPipeline class returns the watermark and schema hash published with the
+        production model, None when there is none
+        """
+        try:
+            blob = SimpleStorageService()
+            state_blob_path = self.incremental_training_config.training_state_blob_path
+            if not blob.exists(state_blob_path, self.incremental_training_config.blob_name):
+                return None
+            return yaml.safe_load(blob.read_object(state_blob_path))
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def publish_training_state(self, data_ingestion_artifact: DataIngestionArtifact, mode: str,
+                               base_watermark=None) -> None:
+        """
+        This method of TrainPipeline class publishes the watermark of the pushed model, so the next
+        incremental run ingests only the records added after it
+        """
+        try:
+            watermark = data_ingestion_artifact.watermark
+            if base_watermark is not None and (watermark is None or watermark < base_watermark):
+                watermark = base_watermark
+            training_state = {
+                "watermark_column": self.incremental_training_config.watermark_column,
+                "watermark": watermark,
+                "schema_hash": get_schema_hash(read_yaml_file(file_path=SCHEMA_FILE_PATH)),
+                "mode": mode,
+                "trained_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            SimpleStorageService().upload_bytes(yaml.safe_dump(training_state).encode("utf-8"),
+                                                to_filename=self.incremental_training_config.training_state_blob_path,
+                                                container_name=self.incremental_training_config.blob_name)
+            logging.info(f"Published training state: {training_state}")
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def start_incremental_training(self, data_ingestion_artifact: DataIngestionArtifact,
+                                   data_validation_artifact: DataValidationArtifact,
+                                   training_state: dict) -> IncrementalTrainingArtifact:
+        """
+        This method of TrainPipeline class is responsible for warm-starting the production model on new records
+        """
+        try:
+            production_model = HeartDieseaseEstimator(blob_name=self.model_evaluation_config.blob_name,
+                                                      model_path=self.model_evaluation_config.blob_model_key_path
+                                                      ).load_model()
+            incremental_trainer = IncrementalTrainer(incremental_training_config=self.incremental_training_config,
+                                                     data_ingestion_artifact=data_ingestion_artifact,
+                                                     data_validation_artifact=data_validation_artifact,
+                                                     model_trainer_config=self.model_trainer_config,
+                                                     production_model=production_model,
+                                                     training_state=training_state)
+            incremental_training_artifact = incremental_trainer.initiate_incremental_training()
+            return incremental_training_artifact
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
+    def run_incremental_pipeline(self, ) -> None:
+        """
+        This method of TrainPipeline class continues training the production model on the records added since it
+        was pushed, so the retrain time follows the number of new records. It falls back to run_pipeline when
+        there is no training state, on schema change or drift, or when the model cannot be warm-started.
+        """
+        try:
+            training_state = self.get_training_state()
+            if training_state is None or training_state.get("watermark") is None:
+                logging.info("No training state in the registry, running a full retrain")
+                return self.run_pipeline()
+
+            data_ingestion_artifact = self.start_data_ingestion(watermark=training_state["watermark"])
+            if data_ingestion_artifact.n_rows < self.incremental_training_config.min_rows:
+                logging.info(f"Only {data_ingestion_artifact.n_rows} new records, "
+                             f"below {self.incremental_training_config.min_rows}: nothing to retrain")
+                return None
+
+            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
+            incremental_training_artifact = self.start_incremental_training(
+                data_ingestion_artifact=data_ingestion_artifact, data_validation_artifact=data_validation_artifact,
+                training_state=training_state)
+            if incremental_training_artifact.is_full_retrain_required:
+                logging.info(f"Falling back to a full retrain: {incremental_training_artifact.reason}")
+                return self.run_pipeline()
+
+            model_evaluation_artifact = self.start_model_evaluation(
+                data_ingestion_artifact=data_ingestion_artifact,
+                model_trainer_artifact=incremental_training_artifact.model_trainer_artifact)
+            if not model_evaluation_artifact.is_model_accepted:
+                logging.info(f"Incremental model not accepted.")
+                return None
+            # pushed without a compact model, the previous one is removed from the registry
+            model_pusher_artifact = self.start_model_pusher(
+                model_evaluation_artifact=model_evaluation_artifact,
+                model_trainer_artifact=incremental_training_artifact.model_trainer_artifact)
+            self.publish_training_state(data_ingestion_artifact, mode="incremental",
+                                        base_watermark=training_state["watermark"])
+
+        except Exception as e:
+            raise HeartdieseaseException(e, sys)
+
     def run_pipeline(self, ) -> None:
         """
         This method of TrainPipeline class is responsible for running complete pipeline
@@ -149,13 +308,26 @@ class TrainingPipeline:
             data_transformation_artifact = self.start_data_transformation(
                 data_ingestion_artifact=data_ingestion_artifact, data_validation_artifact=data_validation_artifact)
             model_trainer_artifact = self.start_model_trainer(data_transformation_artifact=data_transformation_artifact)
+            model_compaction_artifact = None
+            if self.model_compaction_config.enabled:
+                model_compaction_artifact = self.start_model_compaction(
+                    data_transformation_artifact=data_transformation_artifact,
+                    model_trainer_artifact=model_trainer_artifact)
             model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact=data_ingestion_artifact,
                                                                     model_trainer_artifact=model_trainer_artifact)
             
-            if not model_evaluation_artifact.is_model_accepted:
+            if model_evaluation_artifact.is_model_accepted:
+                model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact,
+                                                                model_compaction_artifact=model_compaction_artifact,
+                                                                model_trainer_artifact=model_trainer_artifact)
+                self.publish_training_state(data_ingestion_artifact, mode="full")
+            else:
                 logging.info(f"Model not accepted.")
-                return None
-            model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact)
+
+            # the global model stays the fallback for cohorts without a model of their own
+            if self.cohort_training_config.train_cohort_models:
+                cohort_training_artifact = self.start_cohort_training(
+                    data_ingestion_artifact=data_ingestion_artifact, data_validation_artifact=data_validation_artifact)
             
         except Exception as e:
             raise HeartdieseaseException(e, sys)
\ No newline at end of file
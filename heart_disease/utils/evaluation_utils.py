@@ -0,0 +1,129 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+
+
+def encode_labels(values: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    map class labels onto their position in the sorted labels array
+    values: array of class labels
+    labels: sorted array of every known class label
+    return: np.array of integer class indices
+    """
+    return np.searchsorted(labels, np.asarray(values).astype(int))
+
+
+def confusion_matrices(y_true: np.ndarray, y_pred: np.ndarray, n_classes: int) -> np.ndarray:
+    """
+    build one or many confusion matrices with a single bincount
+    y_true: class indices of shape (n,) or (rounds, n)
+    y_pred: class indices with the same shape as y_true
+    return: np.array of shape (n_classes, n_classes) or (rounds, n_classes, n_classes)
+    """
+    single = np.ndim(y_true) == 1
+    y_true = np.atleast_2d(y_true)
+    y_pred = np.atleast_2d(y_pred)
+    rounds = y_true.shape[0]
+
+    offsets = (np.arange(rounds) * n_classes * n_classes)[:, None]
+    flat = (offsets + y_true * n_classes + y_pred).ravel()
+    matrices = np.bincount(flat, minlength=rounds * n_classes * n_classes).reshape(rounds, n_classes, n_classes)
+    return matrices[0] if single else matrices
+
+
+def metrics_from_confusion_matrices(matrices: np.ndarray) -> dict:
+    """
+    compute accuracy and weighted precision, recall and f1 from one or many confusion matrices
+    matrices: np.array of shape (n_classes, n_classes) or (rounds, n_classes, n_classes)
+    return: dict of metric name to float (single matrix) or np.array (many matrices)
+    """
+    single = matrices.ndim == 2
+    matrices = (matrices[None, :, :] if single else matrices).astype(np.float64)
+
+    true_positive = np.diagonal(matrices, axis1=1, axis2=2)
+    support = matrices.sum(axis=2)
+    predicted = matrices.sum(axis=1)
+    total = support.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, true_positive / predicted, 0.0)
+        recall = np.where(support > 0, true_positive / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        weights = support / total[:, None]
+
+    metrics = {
+        "accuracy": true_positive.sum(axis=1) / total,
+        "precision": (precision * weights).sum(axis=1),
+        "recall": (recall * weights).sum(axis=1),
+        "f1": (f1 * weights).sum(axis=1),
+    }
+    if single:
+        return {name: float(value[0]) for name, value in metrics.items()}
+    return metrics
+
+
+def weighted_roc_auc(y_true: np.ndarray, probabilities: np.ndarray, n_classes: int) -> Optional[float]:
+    """
+    one-vs-rest roc auc weighted by class support, None when it is undefined for the given labels
+    y_true: class indices of shape (n,)
+    probabilities: np.array of shape (n, n_classes) aligned with the class indices
+    """
+    try:
+        present = np.unique(y_true)
+        if len(present) < 2:
+            return None
+        if n_classes == 2:
+            return float(roc_auc_score(y_true, probabilities[:, 1]))
+        return float(roc_auc_score(y_true, probabilities, multi_class="ovr", average="weighted",
+                                   labels=np.arange(n_classes)))
+    except ValueError as e:
+        logging.info(f"ROC AUC is undefined for this test set: {e}")
+        return None
+
+
+def bootstrap_confidence_intervals(y_true: np.ndarray, y_pred: np.ndarray, n_classes: int,
+                                   n_rounds: int = 1000, confidence_level: float = 0.95,
+                                   n_jobs: int = 4, random_state: int = 42) -> dict:
+    """
+    percentile bootstrap confidence intervals of the confusion matrix metrics
+    the metrics only depend on the confusion matrix, and the confusion matrix of a resample of the rows is a
+    multinomial draw of n samples over the cells of the full one, so every round is drawn over the cells
+    instead of resampling the rows: memory is O(rounds * n_classes^2) whatever the number of samples.
+    the rounds are split into chunks which are drawn and scored in parallel, each chunk fully vectorized
+    y_true: class indices of shape (n,)
+    y_pred: class indices of shape (n,)
+    return: dict of metric name to [lower, upper]
+    """
+    try:
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        n_samples = y_true.shape[0]
+        cell_probabilities = confusion_matrices(y_true, y_pred, n_classes).ravel() / n_samples
+        n_jobs = max(1, min(n_jobs, n_rounds))
+        chunk_rounds = np.array_split(np.arange(n_rounds), n_jobs)
+        seeds = np.random.SeedSequence(random_state).spawn(n_jobs)
+
+        def run_chunk(rounds: np.ndarray, seed: np.random.SeedSequence) -> dict:
+            rng = np.random.default_rng(seed)
+            matrices = rng.multinomial(n_samples, cell_probabilities, size=len(rounds))
+            return metrics_from_confusion_matrices(matrices.reshape(len(rounds), n_classes, n_classes))
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            chunks = list(executor.map(run_chunk, [rounds for rounds in chunk_rounds if len(rounds)], seeds))
+
+        alpha = (1.0 - confidence_level) / 2.0
+        intervals = {}
+        for name in chunks[0]:
+            values = np.concatenate([chunk[name] for chunk in chunks])
+            lower, upper = np.quantile(values, [alpha, 1.0 - alpha])
+            intervals[name] = [float(lower), float(upper)]
+        return intervals
+
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
@@ -1,10 +1,13 @@
 import os
+import re
 import sys
 
 import numpy as np
 import dill
 import yaml
+import pandas as pd
 from pandas import DataFrame
+from sklearn.model_selection import train_test_split
 
 from heart_disease.exception import HeartdieseaseException
 from heart_disease.logger import logging
@@ -98,10 +101,66 @@ def drop_columns(df: DataFrame, cols: list)-> DataFrame:
     logging.info("Entered drop_columns methon of utils")
 
     try:
-        df = df.drop(columns=cols, axis=1)
+        df = df.drop(columns=cols)
 
         logging.info("Exited the drop_columns method of utils")
         
         return df
     except Exception as e:
-        raise HeartdieseaseException(e, sys) from e
\ No newline at end of file
+        raise HeartdieseaseException(e, sys) from e
+
+
+def prepare_features_and_target(df: DataFrame, target_column: str, cols: list):
+    """
+    split a raw dataframe into input features and target the same way training does
+    df: pandas DataFrame with the target column
+    target_column: name of the target column
+    cols: list of columns to be dropped
+    return: input feature DataFrame and target Series with missing and duplicate rows removed
+    """
+    logging.info("Entered prepare_features_and_target method of utils")
+
+    try:
+        input_feature_df = drop_columns(df=df.drop(columns=[target_column]), cols=cols)
+        combined = pd.concat([input_feature_df, df[target_column]], axis=1)
+        combined = combined.dropna().drop_duplicates()
+
+        logging.info(f"Cleaned dataframe: {df.shape[0]} -> {combined.shape[0]} rows")
+        return combined.drop(columns=[target_column]), combined[target_column]
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
+
+
+def split_calibration_rows(input_feature_df: DataFrame, target_feature_df: pd.Series, ratio: float,
+                           random_state: int = None):
+    """
+    hold out a stratified ratio of the rows to fit the risk calibrator on, outside the model's training rows
+    input_feature_df: input features
+    target_feature_df: target of the rows
+    ratio: fraction of the rows held out, 0 holds out nothing
+    return: input features and target of the training rows, then of the calibration rows (None when ratio is 0)
+    """
+    try:
+        n_calibration = int(round(len(target_feature_df) * ratio))
+        if n_calibration == 0:
+            return input_feature_df, target_feature_df, None, None
+        # a class with a single row cannot be split in two, and a stratified split needs a row of every class on
+        # both sides, which small slices (a cohort, an incremental batch) do not have room for
+        class_counts = target_feature_df.value_counts()
+        n_classes = len(class_counts)
+        stratify = target_feature_df if class_counts.min() >= 2 and n_calibration >= n_classes and \
+            len(target_feature_df) - n_calibration >= n_classes else None
+        x_train, x_calibration, y_train, y_calibration = train_test_split(
+            input_feature_df, target_feature_df, test_size=n_calibration, stratify=stratify,
+            random_state=random_state)
+        logging.info(f"Held out {len(y_calibration)} of {len(target_feature_df)} rows for the risk calibrator")
+        return x_train, y_train, x_calibration, y_calibration
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
+
+
+def cohort_slug(cohort) -> str:
+    """
+    Name of a cohort usable in blob and directory names, e.g. "VA Long Beach" -> "va_long_beach"
+    """
+    return re.sub(r"[^a-z0-9]+", "_", str(cohort).strip().lower()).strip("_")
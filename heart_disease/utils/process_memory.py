@@ -0,0 +1,42 @@
+import os
+from typing import List, Optional
+
+_SMAPS_FIELDS = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+                 "Private_Clean": "uss", "Private_Dirty": "uss", "Swap": "swap"}
+
+
+def read_process_memory(pid: int) -> Optional[dict]:
+    """
+    Memory of a process in MB from /proc/<pid>/smaps_rollup: rss, pss (shared pages divided among the processes
+    mapping them), uss (pages of this process only, freed when it exits) and shared. None when the process is
+    gone or the platform has no smaps_rollup
+    """
+    sizes = {"pid": pid, "rss": 0, "pss": 0, "uss": 0, "shared": 0, "swap": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    sizes[_SMAPS_FIELDS[name]] += int(value.split()[0])
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    return {key: value if key == "pid" else round(value / 1024, 1) for key, value in sizes.items()}
+
+
+def get_child_pids(pid: int) -> List[int]:
+    """
+    Pids of the running children of a process, read from /proc
+    """
+    child_pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as stat:
+                # the command name may contain spaces, the parent pid is the second field after it
+                fields = stat.read().rpartition(")")[2].split()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+        if int(fields[1]) == pid and fields[0] != "Z":
+            child_pids.append(int(name))
+    return sorted(child_pids)
@@ -0,0 +1,118 @@
+import sys
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from heart_disease.constants import SCHEMA_FILE_PATH, TARGET_COLUMN
+from heart_disease.exception import HeartdieseaseException
+from heart_disease.logger import logging
+from heart_disease.utils.main_utils import read_yaml_file
+
+
+def get_schema_column_types(schema_config: dict) -> dict:
+    """
+    flatten the columns section of schema.yaml into a dict of column name to type
+    """
+    column_types = {}
+    for column in schema_config["columns"]:
+        column_types.update(column)
+    return column_types
+
+
+def get_prediction_feature_columns(schema_config: Optional[dict] = None) -> List[str]:
+    """
+    raw input columns expected by the prediction pipeline: every schema column
+    except the id, the target and the drop_columns
+    """
+    try:
+        if schema_config is None:
+            schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+        excluded = set(schema_config["drop_columns"]) | {"id", TARGET_COLUMN}
+        return [column for column in get_schema_column_types(schema_config) if column not in excluded]
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
+
+
+def generate_synthetic_data(n_rows: int, schema_config: Optional[dict] = None, random_state: int = 42,
+                            missing_rate: float = 0.0) -> DataFrame:
+    """
+    generate a raw dataframe that follows config/schema.yaml (column order, types and value domains)
+    the target depends on age, thalch, oldpeak, exang and cp so that trained models have signal to learn
+    n_rows: number of rows to generate
+    missing_rate: fraction of values set to NaN in every feature column except id and target
+    return: pandas DataFrame with every schema column
+    """
+    logging.info(f"Generating {n_rows} rows of synthetic data")
+
+    try:
+        if schema_config is None:
+            schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+        rng = np.random.default_rng(random_state)
+        categorical_values = schema_config["categorical_values"]
+        numerical_ranges = schema_config["numerical_ranges"]
+
+        column_types = get_schema_column_types(schema_config)
+        data = {}
+        for column, column_type in column_types.items():
+            if column == "id":
+                data[column] = np.arange(1, n_rows + 1, dtype=np.int64)
+            elif column == TARGET_COLUMN:
+                continue
+            elif column_type == "category":
+                values = categorical_values[column]
+                codes = rng.integers(0, len(values), n_rows)
+                if all(isinstance(value, bool) for value in values):
+                    # TRUE / FALSE columns are read back from csv as booleans
+                    data[column] = np.asarray(values, dtype=bool)[codes]
+                else:
+                    data[column] = pd.Categorical.from_codes(codes, categories=values)
+            else:
+                low, high = numerical_ranges[column]
+                if isinstance(low, float) or isinstance(high, float):
+                    data[column] = np.round(rng.uniform(low, high, n_rows), 1)
+                else:
+                    data[column] = rng.integers(low, high + 1, n_rows, dtype=np.int64)
+
+        dataframe = DataFrame(data)
+
+        if TARGET_COLUMN in column_types:
+            low, high = numerical_ranges[TARGET_COLUMN]
+            age = dataframe["age"].to_numpy(dtype=np.float64)
+            thalch = dataframe["thalch"].to_numpy(dtype=np.float64)
+            oldpeak = dataframe["oldpeak"].to_numpy(dtype=np.float64)
+            score = (0.04 * (age - 50) - 0.02 * (thalch - 140) + 0.5 * oldpeak
+                     + 1.0 * dataframe["exang"].to_numpy(dtype=bool)
+                     + 1.0 * (dataframe["cp"].to_numpy() == "asymptomatic")
+                     + rng.normal(0.0, 1.0, n_rows))
+            edges = np.quantile(score, [0.45, 0.73, 0.85, 0.97])
+            dataframe[TARGET_COLUMN] = np.clip(np.digitize(score, edges), low, high).astype(np.int64)
+
+        if missing_rate > 0:
+            for column in dataframe.columns:
+                if column in ("id", TARGET_COLUMN):
+                    continue
+                mask = rng.random(n_rows) < missing_rate
+                dataframe[column] = dataframe[column].mask(mask)
+
+        return dataframe
+
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
+
+
+def generate_prediction_input(n_rows: int, schema_config: Optional[dict] = None, random_state: int = 42) -> DataFrame:
+    """
+    generate raw prediction inputs (the nine features used by the prediction pipeline)
+    with plain object / numeric dtypes, as they would be decoded from a request
+    """
+    try:
+        if schema_config is None:
+            schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+        dataframe = generate_synthetic_data(n_rows, schema_config=schema_config, random_state=random_state)
+        dataframe = dataframe[get_prediction_feature_columns(schema_config)]
+        return dataframe.astype({column: object for column in dataframe.columns
+                                 if isinstance(dataframe[column].dtype, pd.CategoricalDtype)})
+    except Exception as e:
+        raise HeartdieseaseException(e, sys) from e
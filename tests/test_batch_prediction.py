@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from heart_disease.pipline import batch_prediction
+from heart_disease.pipline.batch_prediction import ParquetPredictionWriter, get_score_columns, score_chunk
+from heart_disease.utils.synthetic_data import generate_prediction_input, get_prediction_feature_columns
+
+
+class SexCheckingModel:
+    """
+    Scores like HeartDiseaseModel.predict_with_scores, and fails on a batch with an unknown sex as the fitted
+    encoder does
+    """
+
+    def predict_with_scores(self, dataframe: DataFrame) -> DataFrame:
+        if not dataframe["sex"].isin(["Male", "Female"]).all():
+            raise ValueError("Found unknown categories in column sex")
+        probabilities = np.full((len(dataframe), 2), 0.5)
+        result = DataFrame(probabilities, columns=["probability_0", "probability_1"], index=dataframe.index)
+        result.insert(0, "prediction", np.zeros(len(dataframe), dtype=int))
+        result["risk_score"] = 0.5
+        return result
+
+
+def set_worker_model(model) -> None:
+    batch_prediction._worker_state.update(model=model, feature_columns=get_prediction_feature_columns(),
+                                          score_columns=get_score_columns(model))
+
+
+def test_score_chunk_with_only_invalid_rows_has_the_score_columns():
+    set_worker_model(SexCheckingModel())
+    chunk = generate_prediction_input(4, random_state=1).assign(sex="Mle")
+
+    scores_df, _, _ = score_chunk(chunk)
+
+    assert list(scores_df.columns) == ["prediction", "probability_0", "probability_1", "risk_score", "error"]
+    assert scores_df["prediction"].isna().all()
+    assert scores_df["risk_score"].isna().all()
+    assert scores_df["error"].str.contains("unknown categories").all()
+
+
+def test_parquet_writer_accepts_an_invalid_first_chunk(tmp_path):
+    set_worker_model(SexCheckingModel())
+    invalid_scores, _, _ = score_chunk(generate_prediction_input(3, random_state=1).assign(sex="Mle"))
+    valid_scores, _, _ = score_chunk(generate_prediction_input(5, random_state=2))
+
+    file_path = str(tmp_path / "predictions.parquet")
+    writer = ParquetPredictionWriter(file_path, compression="zstd")
+    writer.write(invalid_scores)
+    writer.write(valid_scores)
+    writer.close()
+
+    predictions = pd.read_parquet(file_path)
+    assert len(predictions) == 8
+    assert predictions["prediction"].isna().sum() == 3
+    assert predictions["error"].notna().sum() == 3
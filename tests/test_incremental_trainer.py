@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from catboost import CatBoostClassifier
+from xgboost import XGBClassifier
+
+from heart_disease.components.incremental_trainer import IncrementalTrainer
+from heart_disease.entity.config_entity import IncrementalTrainingConfig, ModelTrainerConfig
+
+
+def get_incremental_trainer(iterations: int = 5) -> IncrementalTrainer:
+    incremental_training_config = IncrementalTrainingConfig()
+    incremental_training_config.iterations = iterations
+    return IncrementalTrainer(incremental_training_config=incremental_training_config, data_ingestion_artifact=None,
+                              data_validation_artifact=None, model_trainer_config=ModelTrainerConfig(),
+                              production_model=None, training_state={})
+
+
+@pytest.mark.parametrize("model_obj", [CatBoostClassifier(iterations=10, verbose=0, thread_count=1),
+                                       XGBClassifier(n_estimators=10, n_jobs=1)])
+def test_continue_training_on_new_records_without_every_class(model_obj):
+    rng = np.random.default_rng(0)
+    model_obj.fit(rng.normal(size=(300, 4)), np.arange(300) % 5 * 1.0)
+    x_new, y_new = rng.normal(size=(60, 4)), np.arange(60) % 4 * 1.0
+
+    model = get_incremental_trainer().continue_training(model_obj, x_new, y_new)
+
+    assert list(model.classes_) == list(model_obj.classes_)
+    assert model.predict_proba(x_new).shape == (60, 5)
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from heart_disease.utils.main_utils import split_calibration_rows
+
+
+def test_split_calibration_rows_of_a_slice_smaller_than_the_classes_is_not_stratified():
+    target = pd.Series(np.repeat(np.arange(5), 6))
+    features = pd.DataFrame({"age": np.arange(30)})
+
+    x_train, y_train, x_calibration, y_calibration = split_calibration_rows(features, target, ratio=0.1,
+                                                                            random_state=0)
+
+    assert len(y_calibration) == 3
+    assert len(y_train) == 27
+    assert sorted(x_train["age"].tolist() + x_calibration["age"].tolist()) == list(range(30))
+
+
+def test_split_calibration_rows_is_stratified_when_every_class_fits():
+    target = pd.Series(np.repeat(np.arange(5), 20))
+    features = pd.DataFrame({"age": np.arange(100)})
+
+    _, _, _, y_calibration = split_calibration_rows(features, target, ratio=0.1, random_state=0)
+
+    assert sorted(y_calibration.tolist()) == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
@@ -0,0 +1,77 @@
+import pickle
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.cloud_storage.storage_backend import InMemoryBackend
+from heart_disease.components.model_pusher import ModelPusher
+from heart_disease.constants import MODEL_BLOB_NAME
+from heart_disease.entity.artifact_entity import (ClassificationMetricArtifact, ModelCompactionArtifact,
+                                                  ModelEvaluationArtifact, ModelTrainerArtifact)
+from heart_disease.entity.blob_estimator import HeartDieseaseEstimator
+from heart_disease.entity.config_entity import ModelPusherConfig
+
+
+def get_model_pusher(storage: SimpleStorageService, model_file_path: str,
+                     model_compaction_artifact: ModelCompactionArtifact = None,
+                     numpy_model_file_path: str = None) -> ModelPusher:
+    model_evaluation_artifact = ModelEvaluationArtifact(is_model_accepted=True, changed_accuracy=0.01,
+                                                        blob_model_path="model.pkl",
+                                                        trained_model_path=model_file_path,
+                                                        evaluation_report_file_path="")
+    model_trainer_artifact = ModelTrainerArtifact(trained_model_file_path=model_file_path,
+                                                  metric_artifact=ClassificationMetricArtifact(f1_score=0.9,
+                                                                                               precision_score=0.9,
+                                                                                               recall_score=0.9),
+                                                  numpy_model_file_path=numpy_model_file_path)
+    return ModelPusher(model_evaluation_artifact, ModelPusherConfig(),
+                       model_compaction_artifact=model_compaction_artifact,
+                       model_trainer_artifact=model_trainer_artifact, blob_storage=storage)
+
+
+def write_model(path, name: str) -> str:
+    with open(path, "wb") as model_file:
+        pickle.dump(name, model_file)
+    return str(path)
+
+
+def test_push_without_compact_model_removes_the_previous_one_and_serving_falls_back(tmp_path):
+    storage = SimpleStorageService(backend=InMemoryBackend(container_name=MODEL_BLOB_NAME))
+    compact_model_path = ModelPusherConfig.blob_compact_model_key_path
+    get_model_pusher(storage, write_model(tmp_path / "first.pkl", "first"),
+                     ModelCompactionArtifact(is_compact_model_created=True, method="truncation_50_of_100_trees",
+                                             report_file_path="",
+                                             compact_model_file_path=write_model(tmp_path / "compact.pkl",
+                                                                                 "first compact"))
+                     ).initiate_model_pusher()
+    estimator = HeartDieseaseEstimator(blob_name=MODEL_BLOB_NAME, model_path=compact_model_path,
+                                       blob_storage=storage, fallback_model_path="model.pkl")
+    estimator.invalidate(estimator.get_model_version())
+    assert estimator.get_loaded_model() == "first compact"
+
+    model_pusher_artifact = get_model_pusher(
+        storage, write_model(tmp_path / "second.pkl", "second"),
+        ModelCompactionArtifact(is_compact_model_created=False, method="", report_file_path="")
+    ).initiate_model_pusher()
+
+    assert model_pusher_artifact.blob_compact_model_path is None
+    assert not storage.exists(compact_model_path)
+    estimator.invalidate(estimator.get_model_version())
+    assert estimator.get_loaded_model() == "second"
+
+
+def test_push_without_numpy_model_removes_the_previous_one_and_serving_falls_back(tmp_path):
+    storage = SimpleStorageService(backend=InMemoryBackend(container_name=MODEL_BLOB_NAME))
+    numpy_model_path = ModelPusherConfig.blob_numpy_model_key_path
+    get_model_pusher(storage, write_model(tmp_path / "first.pkl", "first"),
+                     numpy_model_file_path=write_model(tmp_path / "numpy.pkl", "first numpy")).initiate_model_pusher()
+    estimator = HeartDieseaseEstimator(blob_name=MODEL_BLOB_NAME, model_path=numpy_model_path,
+                                       blob_storage=storage, fallback_model_path="model.pkl")
+    estimator.invalidate(estimator.get_model_version())
+    assert estimator.get_loaded_model() == "first numpy"
+
+    model_pusher_artifact = get_model_pusher(storage, write_model(tmp_path / "second.pkl", "second")
+                                             ).initiate_model_pusher()
+
+    assert model_pusher_artifact.blob_numpy_model_path is None
+    assert not storage.exists(numpy_model_path)
+    estimator.invalidate(estimator.get_model_version())
+    assert estimator.get_loaded_model() == "second"
@@ -0,0 +1,32 @@
+import pytest
+import yaml
+from neuro_mf import ModelFactory
+from sklearn.datasets import make_classification
+
+from heart_disease.components.model_tuning import FoldCachedModelSearch
+
+
+def write_model_config(path) -> str:
+    model_config = {
+        "grid_search": {"class": "GridSearchCV", "module": "sklearn.model_selection", "params": {"cv": 3}},
+        "model_selection": {"module_0": {"class": "CatBoostClassifier", "module": "catboost",
+                                         "params": {"learning_rate": 0.1, "verbose": 0, "thread_count": 1},
+                                         "search_param_grid": {"depth": [3], "iterations": [40]}}},
+    }
+    with open(path, "w") as model_config_file:
+        yaml.safe_dump(model_config, model_config_file)
+    return str(path)
+
+
+def test_fold_cached_search_scores_a_catboost_grid_point_like_grid_search_cv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model_config_file_path = write_model_config(tmp_path / "model.yaml")
+    x, y = make_classification(n_samples=600, n_features=8, n_informative=5, n_classes=3, random_state=0)
+
+    model_factory = ModelFactory(model_config_path=model_config_file_path)
+    grid_searched_best_model = model_factory.execute_grid_search_operation(
+        initialized_model=model_factory.get_initialized_model_list()[0], input_feature=x, output_feature=y)
+    candidates = FoldCachedModelSearch(model_config_file_path=model_config_file_path).search(x, y)
+
+    assert len(candidates) == 1
+    assert candidates[0].best_score == pytest.approx(grid_searched_best_model.best_score)
@@ -0,0 +1,11 @@
+from pandas import DataFrame
+
+from heart_disease.entity.prediction_cache import canonicalize_rows
+
+
+def test_numeric_strings_share_the_cache_key_of_the_number_in_numeric_fields_only():
+    columns, rows = canonicalize_rows(DataFrame({"age": ["63", 63, 63.0], "cp": ["1", 1, " 1 "]}),
+                                      numeric_columns={"age"})
+
+    assert columns == ("age", "cp")
+    assert rows == [(63.0, "1"), (63.0, 1.0), (63.0, "1")]
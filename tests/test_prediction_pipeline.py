@@ -0,0 +1,81 @@
+import pickle
+import threading
+import time
+
+import pytest
+import yaml
+from pandas import DataFrame
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.cloud_storage.storage_backend import InMemoryBackend
+from heart_disease.constants import MODEL_BLOB_NAME
+from heart_disease.entity.cohort_model_pool import CohortModelPool
+from heart_disease.entity.config_entity import HeartDiseasePredictorConfig
+from heart_disease.pipline.prediction_pipeline import HeartDiseaseClassifier
+from heart_disease.entity.prediction_cache import PredictionCache
+
+
+class SlowRegistryEstimator:
+    """
+    Stands in for HeartDieseaseEstimator, counts the registry version checks, each one taking a while
+    """
+
+    def __init__(self, model_version: str):
+        self.model_version = model_version
+        self.loaded_model = object()
+        self.n_version_checks = 0
+
+    def get_model_version(self) -> str:
+        self.n_version_checks += 1
+        time.sleep(0.05)
+        return self.model_version
+
+    def invalidate(self, model_version: str = None) -> None:
+        self.loaded_model = None
+
+
+@pytest.fixture
+def classifier_state(monkeypatch):
+    for name in ("_estimator", "_cohort_pool", "_prediction_cache", "_model_version", "_version_checked_at",
+                 "_version_pinned"):
+        monkeypatch.setattr(HeartDiseaseClassifier, name, getattr(HeartDiseaseClassifier, name))
+    HeartDiseaseClassifier._estimator = SlowRegistryEstimator("v2")
+    HeartDiseaseClassifier._prediction_cache = PredictionCache(max_size=10, ttl_seconds=60)
+    HeartDiseaseClassifier._model_version = "v1"
+    HeartDiseaseClassifier._version_checked_at = 0.0
+    HeartDiseaseClassifier._version_pinned = False
+    return HeartDiseaseClassifier._estimator
+
+
+def test_concurrent_due_version_checks_call_the_registry_once(classifier_state):
+    model_predictor = HeartDiseaseClassifier(HeartDiseasePredictorConfig(cohort_models_enabled=False))
+    assert model_predictor.is_model_version_check_due()
+
+    versions = []
+    threads = [threading.Thread(target=lambda: versions.append(model_predictor.get_model_version()))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert versions == ["v2"] * 8
+    assert classifier_state.n_version_checks == 1
+    assert not model_predictor.is_model_version_check_due()
+
+
+def test_cohort_model_load_is_due_until_the_model_of_the_cohort_is_resident(classifier_state):
+    storage = SimpleStorageService(backend=InMemoryBackend(container_name=MODEL_BLOB_NAME))
+    pool = CohortModelPool(storage=storage)
+    storage.upload_bytes(pickle.dumps("cleveland model"), "cohorts/cleveland/model.pkl")
+    storage.upload_bytes(yaml.safe_dump({"cohorts": {"Cleveland": {"blob_model_path": "cohorts/cleveland/model.pkl",
+                                                                   "version": "1"}}}).encode("utf-8"),
+                         pool.manifest_blob_path)
+    HeartDiseaseClassifier._cohort_pool = pool
+    model_predictor = HeartDiseaseClassifier(HeartDiseasePredictorConfig())
+    cohort_column = model_predictor.prediction_pipeline_config.cohort_column
+
+    assert not model_predictor.is_cohort_model_load_due(DataFrame({"age": [63]}))
+    assert model_predictor.is_cohort_model_load_due(DataFrame({cohort_column: ["Cleveland"]}))
+    assert pool.get_model("Cleveland") == ("cleveland model", "1")
+    assert not model_predictor.is_cohort_model_load_due(DataFrame({cohort_column: ["Cleveland", "Hungary"]}))
@@ -0,0 +1,31 @@
+import threading
+
+from heart_disease.cloud_storage.azure_blob_storage import SimpleStorageService
+from heart_disease.cloud_storage.storage_backend import InMemoryBackend, LatencyInjectingBackend, \
+    LocalFileSystemBackend
+
+
+def get_slow_storage(data: bytes) -> SimpleStorageService:
+    backend = InMemoryBackend(container_name="models")
+    backend.write_bytes("model.pkl", data)
+    return SimpleStorageService(backend=LatencyInjectingBackend(backend, latency_seconds=0.2))
+
+
+def test_concurrent_reads_of_stores_with_the_same_container_name_are_not_shared():
+    storages = [get_slow_storage(b"first"), get_slow_storage(b"second")]
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.update({i: storages[i].read_bytes("model.pkl")}))
+               for i in range(len(storages))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {0: b"first", 1: b"second"}
+
+
+def test_local_backends_of_the_same_root_share_their_store_key(tmp_path):
+    assert LocalFileSystemBackend(str(tmp_path), "models").store_key == \
+           LocalFileSystemBackend(str(tmp_path / "."), "models").store_key
+    assert LocalFileSystemBackend(str(tmp_path), "models").store_key != \
+           LocalFileSystemBackend(str(tmp_path / "other"), "models").store_key